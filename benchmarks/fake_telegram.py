@@ -0,0 +1,141 @@
+"""
+Fake Telegram
+Offline stand-in for the Bot API plus builders for the updates a user sends
+"""
+import asyncio
+import itertools
+import json
+import time
+from collections import Counter
+from telegram import Update
+from telegram.request import BaseRequest
+
+BOT_USER = {'id': 1000, 'is_bot': True, 'first_name': 'Bench', 'username': 'bench_bot'}
+
+class FakeTelegramRequest(BaseRequest):
+    """
+    Answers every Bot API call locally after an optional simulated delay
+    Sent messages are echoed back as Message objects so handlers that edit or
+    reply to them keep working; calls are counted per API method, and the
+    callback data of the last inline keyboard sent to each chat is kept
+    """
+    
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.calls = Counter()
+        self.buttons = {}  # chat id -> callback data of the last inline keyboard
+        self._message_ids = itertools.count(1)
+    
+    @property
+    def read_timeout(self):
+        return None
+    
+    async def initialize(self):
+        pass
+    
+    async def shutdown(self):
+        pass
+    
+    def _message(self, params):
+        chat_id = int(params.get('chat_id', 0) or 0)
+        return {
+            'message_id': int(params.get('message_id') or next(self._message_ids)),
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private'},
+            'from': BOT_USER,
+            'text': params.get('text', '')
+        }
+    
+    async def do_request(self, url, method, request_data=None, read_timeout=None,
+                         write_timeout=None, connect_timeout=None, pool_timeout=None):
+        endpoint = url.rsplit('/', 1)[-1]
+        self.calls[endpoint] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        
+        params = request_data.parameters if request_data else {}
+        if endpoint == 'getMe':
+            result = BOT_USER
+        elif endpoint == 'getFile':
+            result = {
+                'file_id': params.get('file_id'),
+                'file_unique_id': f"u{params.get('file_id')}",
+                'file_size': 1024,
+                'file_path': f"photos/{params.get('file_id')}.jpg"
+            }
+        elif endpoint in ('sendMessage', 'sendPhoto', 'editMessageText', 'editMessageReplyMarkup'):
+            result = self._message(params)
+            markup = params.get('reply_markup')
+            if isinstance(markup, str):
+                markup = json.loads(markup)
+            if markup and 'inline_keyboard' in markup:
+                self.buttons[result['chat']['id']] = [
+                    button.get('callback_data') for row in markup['inline_keyboard'] for button in row
+                ]
+        else:
+            result = True
+        return 200, json.dumps({'ok': True, 'result': result}).encode('utf-8')
+
+class FakeUser:
+    """Builds the updates one simulated private-chat user sends"""
+    
+    _update_ids = itertools.count(1)
+    
+    def __init__(self, bot, user_id, request=None):
+        self.bot = bot
+        self.request = request
+        self.user = {
+            'id': user_id,
+            'is_bot': False,
+            'first_name': f"User{user_id}",
+            'username': f"user{user_id}"
+        }
+        self._message_ids = itertools.count(1)
+        self.last_bot_message = {
+            'message_id': 1,
+            'date': int(time.time()),
+            'chat': {'id': user_id, 'type': 'private'},
+            'from': BOT_USER,
+            'text': ''
+        }
+    
+    def _message(self, **fields):
+        message = {
+            'message_id': next(self._message_ids),
+            'date': int(time.time()),
+            'chat': {'id': self.user['id'], 'type': 'private'},
+            'from': self.user
+        }
+        message.update(fields)
+        return Update.de_json({'update_id': next(self._update_ids), 'message': message}, self.bot)
+    
+    def command(self, command):
+        text = f"/{command}"
+        return self._message(text=text, entities=[{'type': 'bot_command', 'offset': 0, 'length': len(text)}])
+    
+    def text(self, text):
+        return self._message(text=text)
+    
+    def photo(self):
+        file_id = f"photo-{self.user['id']}-{next(self._message_ids)}"
+        return self._message(photo=[{
+            'file_id': file_id, 'file_unique_id': f"u{file_id}", 'width': 1280, 'height': 960
+        }])
+    
+    def press(self, prefix):
+        """Press the first button whose callback data starts with prefix on the last keyboard sent to this user"""
+        buttons = self.request.buttons.get(self.user['id'], []) if self.request else []
+        data = next((data for data in buttons if data and data.startswith(prefix)), prefix)
+        return self.callback(data)
+    
+    def callback(self, data):
+        return Update.de_json({
+            'update_id': next(self._update_ids),
+            'callback_query': {
+                'id': f"cq-{self.user['id']}-{next(self._message_ids)}",
+                'from': self.user,
+                'chat_instance': str(self.user['id']),
+                'message': self.last_bot_message,
+                'data': data
+            }
+        }, self.bot)
@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+"""
+Conversation Benchmarks
+Runs simulated users through the real /start, /rent and /return conversations
+built by main.build_application(), against fake Telegram and fake Google Sheets
+
+Usage:
+    python benchmarks/run_benchmarks.py --users 200 --sheets-latency 0.15 --save before.json
+    python benchmarks/run_benchmarks.py --users 200 --sheets-latency 0.15 --compare before.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+import warnings
+from collections import Counter, defaultdict
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(BENCH_DIR), 'src'))
+sys.path.insert(0, BENCH_DIR)
+
+PASSWORD = 'bench-password'
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=200, help='simulated users per flow')
+    parser.add_argument('--items', type=int, default=50, help='inventory items')
+    parser.add_argument('--sheets-latency', type=float, default=0.1, help='seconds per Sheets call')
+    parser.add_argument('--sheets-jitter', type=float, default=0.05, help='extra random seconds per Sheets call')
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0, help='chance of a 429 per Sheets call')
+    parser.add_argument('--failure-rate', type=float, default=0.0, help='chance of a 503 per Sheets call')
+    parser.add_argument('--sheets-quota', type=int, default=0,
+                        help='Sheets read and write requests per minute (0 = unlimited)')
+    parser.add_argument('--telegram-latency', type=float, default=0.02, help='seconds per Bot API call')
+    parser.add_argument('--write-behind', action=argparse.BooleanOptionalAction, default=True,
+                        help='confirm writes from the local journal (WRITE_BEHIND)')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--save', help='write results as JSON to this file')
+    parser.add_argument('--compare', help='compare with results saved by an earlier --save')
+    return parser.parse_args()
+
+def configure_environment(args):
+    """Point config at offline stand-ins; must run before any bot module is imported"""
+    os.environ['TELEGRAM_BOT_TOKEN'] = '123456:benchmark'
+    os.environ['GOOGLE_SHEETS_ID'] = 'benchmark'
+    os.environ['VERIFICATION_PASSWORD'] = PASSWORD
+    os.environ['ADMIN_USER_IDS'] = ''
+    os.environ['STORAGE_BACKEND'] = 'fake'
+    os.environ['WRITE_BEHIND'] = 'true' if args.write_behind else 'false'
+    os.environ['SHEETS_READ_QUOTA_PER_MINUTE'] = str(args.sheets_quota)
+    os.environ['SHEETS_WRITE_QUOTA_PER_MINUTE'] = str(args.sheets_quota)
+    os.environ['WRITE_JOURNAL_PATH'] = os.path.join(tempfile.mkdtemp(prefix='bench-'), 'journal.jsonl')
+
+class CountingStorage:
+    """Wraps a storage backend and counts calls per method"""
+    
+    def __init__(self, storage):
+        self.storage = storage
+        self.calls = Counter()
+    
+    def __getattr__(self, name):
+        attr = getattr(self.storage, name)
+        if not callable(attr):
+            return attr
+        
+        def counted(*args, **kwargs):
+            self.calls[name] += 1
+            return attr(*args, **kwargs)
+        counted.__name__ = name
+        return counted
+
+def percentile(samples, pct):
+    """Nearest-rank percentile of a list of numbers"""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    rank = max(1, int(round(pct / 100 * len(ordered))))
+    return ordered[min(rank, len(ordered)) - 1]
+
+def latency_summary(samples):
+    return {
+        'p50': percentile(samples, 50) * 1000,
+        'p95': percentile(samples, 95) * 1000,
+        'p99': percentile(samples, 99) * 1000,
+        'max': max(samples, default=0) * 1000
+    }
+
+def per_flow(counter, users):
+    return {name: round(count / users, 2) for name, count in sorted(counter.items())}
+
+# Each flow is a list of (step name, function building the update from a FakeUser)
+FLOWS = {
+    'start': [
+        ('/start', lambda user, item_id: user.command('start')),
+        ('password', lambda user, item_id: user.text(PASSWORD)),
+    ],
+    'rent': [
+        ('/rent', lambda user, item_id: user.command('rent')),
+        ('item id', lambda user, item_id: user.text(item_id)),
+        ('quantity', lambda user, item_id: user.text('1')),
+        ('duration', lambda user, item_id: user.callback('duration_3')),
+        ('pickup photo', lambda user, item_id: user.photo()),
+    ],
+    'return': [
+        ('/return', lambda user, item_id: user.command('return')),
+        ('select', lambda user, item_id: user.press('return_select_')),
+        ('return photo', lambda user, item_id: user.photo()),
+    ],
+}
+
+async def wait_for_flush(storage, timeout=120):
+    """Wait until write-behind entries reach the fake sheets"""
+    journal = getattr(storage, '_journal', None)
+    deadline = time.monotonic() + timeout
+    while journal is not None and len(journal) and time.monotonic() < deadline:
+        await asyncio.sleep(0.05)
+
+async def run_flow(name, application, users, items, counting, spreadsheet, telegram, errors):
+    """Run every user through one flow concurrently and collect its metrics"""
+    import config
+    semaphore = asyncio.Semaphore(config.CONCURRENT_UPDATES)
+    step_samples = defaultdict(list)
+    all_samples = []
+    counting.calls.clear()
+    spreadsheet.reset_calls()
+    telegram.calls.clear()
+    errors.clear()
+    
+    async def run_user(idx, user):
+        item_id = items[idx % len(items)]
+        for step, build in FLOWS[name]:
+            update = build(user, item_id)
+            started = time.perf_counter()
+            async with semaphore:
+                await application.process_update(update)
+            elapsed = time.perf_counter() - started
+            step_samples[step].append(elapsed)
+            all_samples.append(elapsed)
+    
+    started = time.perf_counter()
+    await asyncio.gather(*(run_user(idx, user) for idx, user in enumerate(users)))
+    wall = time.perf_counter() - started
+    await wait_for_flush(counting.storage)
+    
+    count = len(users)
+    return {
+        'users': count,
+        'wall_seconds': wall,
+        'flows_per_second': count / wall if wall else 0.0,
+        'updates_per_second': len(all_samples) / wall if wall else 0.0,
+        'latency_ms': latency_summary(all_samples),
+        'steps_ms': {step: latency_summary(step_samples[step]) for step, _ in FLOWS[name]},
+        'storage_calls_per_flow': per_flow(counting.calls, count),
+        'sheets_calls_per_flow': per_flow(spreadsheet.calls, count),
+        'telegram_calls_per_flow': per_flow(telegram.calls, count),
+        'handler_errors': sum(errors.values())
+    }
+
+async def run(args):
+    configure_environment(args)
+    
+    from telegram.warnings import PTBUserWarning
+    warnings.filterwarnings('ignore', category=PTBUserWarning)  # per_message notes from main.py
+    
+    import fake_sheets
+    import storage
+    from fake_telegram import FakeTelegramRequest, FakeUser
+    
+    inventory = [
+        [f"BENCH{idx:03d}", f"Bench Item {idx}", 'Equipment', 'Brand', 'Model', args.users * 2,
+         f"Shelf {idx % 8}", 0, args.users * 2]
+        for idx in range(1, args.items + 1)
+    ]
+    faults = fake_sheets.FaultProfile(
+        latency=args.sheets_latency, jitter=args.sheets_jitter,
+        rate_limit_rate=args.rate_limit_rate, failure_rate=args.failure_rate, seed=args.seed
+    )
+    spreadsheet = fake_sheets.build_fake_spreadsheet(inventory_rows=inventory, faults=faults)
+    counting = CountingStorage(fake_sheets.fake_sheets_manager(spreadsheet))
+    storage.use_storage(counting)
+    
+    # Imported only now so the handlers pick up the fake storage
+    from main import build_application
+    from async_sheets import get_async_sheets
+    
+    telegram = FakeTelegramRequest(latency=args.telegram_latency)
+    application, _ = build_application(
+        request=telegram, get_updates_request=FakeTelegramRequest(latency=args.telegram_latency)
+    )
+    errors = Counter()
+    
+    async def count_error(update, context):
+        errors[type(context.error).__name__] += 1
+    application.add_error_handler(count_error)
+    
+    await application.initialize()
+    await get_async_sheets().warm_up()
+    
+    users = [FakeUser(application.bot, 10_000 + idx, telegram) for idx in range(args.users)]
+    items = [row[0] for row in inventory]
+    results = {'settings': vars(args), 'flows': {}}
+    try:
+        for name in FLOWS:
+            results['flows'][name] = await run_flow(
+                name, application, users, items, counting, spreadsheet, telegram, errors
+            )
+            if name == 'rent':
+                active = len(counting.storage.get_all_active_rentals())
+                print(f"📦 {active}/{args.users} rentals recorded")
+            # The background tail read starts below the last row; with no new rows it must read nothing, not fail
+            if counting.storage.refresh_log() is None:
+                raise RuntimeError(f"Rental Log tail read failed after the {name} flow")
+    finally:
+        await application.shutdown()
+        get_async_sheets().shutdown()
+    return results
+
+def print_results(results, baseline=None):
+    print()
+    print(f"{'flow':<8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'flows/s':>9} {'updates/s':>10} {'errors':>7}")
+    for name, flow in results['flows'].items():
+        latency = flow['latency_ms']
+        print(f"{name:<8} {latency['p50']:>9.1f} {latency['p95']:>9.1f} {latency['p99']:>9.1f} "
+              f"{flow['flows_per_second']:>9.1f} {flow['updates_per_second']:>10.1f} {flow['handler_errors']:>7}")
+        if baseline and name in baseline['flows']:
+            before = baseline['flows'][name]
+            print(f"{'  vs':<8} "
+                  + ' '.join(f"{_delta(before['latency_ms'][p], latency[p]):>9}" for p in ('p50', 'p95', 'p99'))
+                  + f" {_delta(before['flows_per_second'], flow['flows_per_second']):>9}")
+    
+    for name, flow in results['flows'].items():
+        print(f"\n{name}: per-step latency (ms)")
+        for step, latency in flow['steps_ms'].items():
+            print(f"  {step:<14} p50 {latency['p50']:>8.1f}  p95 {latency['p95']:>8.1f}  p99 {latency['p99']:>8.1f}")
+        print(f"  storage calls per flow:  {_format_calls(flow['storage_calls_per_flow'])}")
+        print(f"  Sheets calls per flow:   {_format_calls(flow['sheets_calls_per_flow'])}")
+        print(f"  Telegram calls per flow: {_format_calls(flow['telegram_calls_per_flow'])}")
+
+def _delta(before, after):
+    if not before:
+        return 'n/a'
+    return f"{(after - before) / before * 100:+.0f}%"
+
+def _format_calls(calls):
+    return ', '.join(f"{name}={count:g}" for name, count in calls.items()) or 'none'
+
+def main():
+    args = parse_args()
+    results = asyncio.run(run(args))
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+    print_results(results, baseline)
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        print(f"\n💾 Saved results to {args.save}")
+
+if __name__ == '__main__':
+    main()
@@ -3,13 +3,18 @@ Admin Commands Module
 Provides administrative functions for bot management
 """
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
-from telegram.ext import ContextTypes
+from telegram.ext import ContextTypes, ConversationHandler
+from telegram.error import BadRequest
 from datetime import datetime, timedelta
-import pytz
 import config
-from sheets_manager import SheetsManager
+from async_sheets import get_async_sheets
+from fanout import get_fanout
+from perf_stats import perf_stats
 
-sheets = SheetsManager()
+# Conversation states (continue after the ones in bot.py)
+WAITING_FOR_BROADCAST_MESSAGE = 8
+
+sheets = get_async_sheets()
 
 def is_admin(user_id: int) -> bool:
     """Check if user is an admin"""
@@ -39,9 +44,10 @@ async def admin_panel(update: Update, context: ContextTypes.DEFAULT_TYPE):
             InlineKeyboardButton("🔍 Search User", callback_data="admin_search_user")
         ],
         [
-            InlineKeyboardButton("📢 Broadcast Message", callback_data="admin_broadcast"),
-            InlineKeyboardButton("❌ Close", callback_data="admin_close")
-        ]
+            InlineKeyboardButton("⚙️ Performance", callback_data="admin_perf"),
+            InlineKeyboardButton("📢 Broadcast Message", callback_data="admin_broadcast")
+        ],
+        [InlineKeyboardButton("❌ Close", callback_data="admin_close")]
     ]
     
     reply_markup = InlineKeyboardMarkup(keyboard)
@@ -59,18 +65,26 @@ async def view_all_rentals(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await query.answer()
     
     try:
-        active_rentals = sheets.get_all_active_rentals()
+        active_rentals = await sheets.get_all_active_rentals()
+        health = sheets.health()
+        
+        # The same Sheets problem texts the users' views show
+        from bot import DATA_NOTES, sheets_problem_message
+        if not active_rentals and health in ('unavailable', 'schema'):
+            await query.edit_message_text(sheets_problem_message(health))
+            return
         
         if not active_rentals:
             await query.edit_message_text("✅ No active rentals at the moment!")
             return
         
-        message = f"📦 *Active Rentals ({len(active_rentals)})*\n\n"
+        message = DATA_NOTES.get(health, "")
+        message += f"📦 *Active Rentals ({len(active_rentals)})*\n\n"
         
         for idx, rental in enumerate(active_rentals[:20], 1):  # Limit to 20 for message length
-            message += f"{idx}. *{rental.get('Item Name')}* (`{rental.get('Item ID')}`)\n"
-            message += f"   👤 {rental.get('Borrower Name')} ({rental.get('Telegram Username')})\n"
-            message += f"   📅 Due: {rental.get('Expected Return Date')}\n"
+            message += f"{idx}. *{rental.item_name}* (`{rental.item_id}`)\n"
+            message += f"   👤 {rental.borrower_name} ({rental.telegram_username})\n"
+            message += f"   📅 Due: {rental.expected_return}\n"
             message += f"\n"
         
         if len(active_rentals) > 20:
@@ -80,7 +94,7 @@ async def view_all_rentals(update: Update, context: ContextTypes.DEFAULT_TYPE):
         reply_markup = InlineKeyboardMarkup(keyboard)
         
         await query.edit_message_text(message, parse_mode='Markdown', reply_markup=reply_markup)
-        
+    
     except Exception as e:
         await query.edit_message_text(f"❌ Error fetching rentals: {e}")
 
@@ -90,22 +104,8 @@ async def view_overdue_items(update: Update, context: ContextTypes.DEFAULT_TYPE)
     await query.answer()
     
     try:
-        tz = pytz.timezone(config.TIMEZONE)
-        today = datetime.now(tz).date()
-        
-        active_rentals = sheets.get_all_active_rentals()
-        overdue_rentals = []
-        
-        for log in active_rentals:
-            expected_return = log.get('Expected Return Date', '')
-            try:
-                return_date = datetime.strptime(expected_return, '%Y-%m-%d').date()
-                if return_date < today:
-                    days_overdue = (today - return_date).days
-                    log['_days_overdue'] = days_overdue
-                    overdue_rentals.append(log)
-            except:
-                continue
+        # Already sorted most overdue first, with rental.days_overdue set
+        overdue_rentals = await sheets.get_overdue_rentals()
         
         if not overdue_rentals:
             await query.edit_message_text(
@@ -116,16 +116,13 @@ async def view_overdue_items(update: Update, context: ContextTypes.DEFAULT_TYPE)
             )
             return
         
-        # Sort by days overdue (most overdue first)
-        overdue_rentals.sort(key=lambda x: x['_days_overdue'], reverse=True)
-        
         message = f"⚠️ *Overdue Items ({len(overdue_rentals)})*\n\n"
         
         for idx, rental in enumerate(overdue_rentals[:15], 1):
-            days = rental['_days_overdue']
-            message += f"{idx}. *{rental.get('Item Name')}* (`{rental.get('Item ID')}`)\n"
-            message += f"   👤 {rental.get('Borrower Name')} ({rental.get('Telegram Username')})\n"
-            message += f"   📅 Due: {rental.get('Expected Return Date')}\n"
+            days = rental.days_overdue
+            message += f"{idx}. *{rental.item_name}* (`{rental.item_id}`)\n"
+            message += f"   👤 {rental.borrower_name} ({rental.telegram_username})\n"
+            message += f"   📅 Due: {rental.expected_return}\n"
             message += f"   🚨 *{days} day{'s' if days > 1 else ''} overdue*\n\n"
         
         if len(overdue_rentals) > 15:
@@ -138,74 +135,115 @@ async def view_overdue_items(update: Update, context: ContextTypes.DEFAULT_TYPE)
         reply_markup = InlineKeyboardMarkup(keyboard)
         
         await query.edit_message_text(message, parse_mode='Markdown', reply_markup=reply_markup)
-        
+    
     except Exception as e:
         await query.edit_message_text(f"❌ Error fetching overdue items: {e}")
 
 async def view_statistics(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """View usage statistics"""
+    """View usage statistics (🔄 Recount rebuilds them from the whole log)"""
     query = update.callback_query
     await query.answer()
     
     try:
-        all_logs = sheets.log_sheet.get_all_records()
-        
-        total_rentals = len(all_logs)
-        active_rentals = len([log for log in all_logs if log.get('Status', '').upper() == 'ACTIVE'])
-        completed_rentals = len([log for log in all_logs if log.get('Status', '').upper() == 'RETURNED'])
-        
-        # Count unique users
-        unique_users = len(set(log.get('User ID', '') for log in all_logs if log.get('User ID')))
-        
-        # Most rented items
-        item_counts = {}
-        for log in all_logs:
-            item_id = log.get('Item ID', '')
-            if item_id:
-                item_counts[item_id] = item_counts.get(item_id, 0) + 1
-        
-        top_items = sorted(item_counts.items(), key=lambda x: x[1], reverse=True)[:5]
-        
-        # Calculate on-time return rate
-        on_time_returns = 0
-        late_returns = 0
-        
-        for log in all_logs:
-            if log.get('Status', '').upper() == 'RETURNED':
-                try:
-                    expected = datetime.strptime(log.get('Expected Return Date', ''), '%Y-%m-%d')
-                    actual = datetime.strptime(log.get('Actual Return Date', ''), '%Y-%m-%d %H:%M:%S')
-                    
-                    if actual.date() <= expected.date():
-                        on_time_returns += 1
-                    else:
-                        late_returns += 1
-                except:
-                    continue
-        
-        total_completed = on_time_returns + late_returns
-        on_time_rate = (on_time_returns / total_completed * 100) if total_completed > 0 else 0
+        stats = await sheets.get_rental_stats(rebuild=query.data == 'admin_stats_rebuild')
+        if stats is None:
+            await query.edit_message_text("❌ Statistics are unavailable right now. Please try again later.")
+            return
         
         message = "📊 *Usage Statistics*\n\n"
-        message += f"📦 Total Rentals: *{total_rentals}*\n"
-        message += f"🟢 Active: *{active_rentals}*\n"
-        message += f"✅ Completed: *{completed_rentals}*\n"
-        message += f"👥 Unique Users: *{unique_users}*\n"
-        message += f"⏱️ On-Time Return Rate: *{on_time_rate:.1f}%*\n\n"
+        message += f"📦 Total Rentals: *{stats['total']}*\n"
+        message += f"🟢 Active: *{stats['active']}*\n"
+        message += f"✅ Completed: *{stats['completed']}*\n"
+        message += f"👥 Unique Users: *{stats['unique_users']}*\n"
+        message += f"⏱️ On-Time Return Rate: *{stats['on_time_rate']:.1f}%*\n\n"
         
-        if top_items:
+        if stats['top_items']:
             message += "🔥 *Most Rented Items:*\n"
-            for idx, (item_id, count) in enumerate(top_items, 1):
+            for idx, (item_id, count) in enumerate(stats['top_items'], 1):
                 message += f"{idx}. `{item_id}` - {count} rental{'s' if count > 1 else ''}\n"
         
-        keyboard = [[InlineKeyboardButton("🔙 Back to Admin Panel", callback_data="admin_back")]]
+        keyboard = [
+            [InlineKeyboardButton("🔄 Recount", callback_data="admin_stats_rebuild")],
+            [InlineKeyboardButton("🔙 Back to Admin Panel", callback_data="admin_back")]
+        ]
         reply_markup = InlineKeyboardMarkup(keyboard)
         
         await query.edit_message_text(message, parse_mode='Markdown', reply_markup=reply_markup)
-        
+    
+    except BadRequest as e:
+        if 'not modified' not in str(e).lower():
+            raise
     except Exception as e:
         await query.edit_message_text(f"❌ Error generating statistics: {e}")
 
+async def view_performance(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Show which handlers spend the most time and quota in Google Sheets"""
+    query = update.callback_query
+    await query.answer()
+    
+    if not is_admin(query.from_user.id):
+        await query.edit_message_text("❌ You don't have permission to access admin commands.")
+        return
+    
+    stats = perf_stats.snapshot()
+    uptime_hours = (datetime.now().timestamp() - perf_stats.started) / 3600
+    
+    message = "⚙️ *Performance*\n"
+    message += f"_Since {uptime_hours:.1f}h ago_\n\n"
+    
+    handlers = sorted(
+        stats['handlers'].items(),
+        key=lambda entry: (entry[1].sheets_calls, entry[1].update_time),
+        reverse=True
+    )[:8]
+    if handlers:
+        message += "🔥 *Hottest Handlers* (by Sheets calls)\n"
+        for name, handler in handlers:
+            message += f"`{name}`\n"
+            if handler.updates:
+                p50, p95, _ = handler.percentiles()
+                message += (f"   {handler.updates} updates · {handler.sheets_calls / handler.updates:.1f} calls/update · "
+                            f"{handler.sheets_time / handler.updates * 1000:.0f}ms in Sheets/update\n")
+                message += f"   p50 {p50 * 1000:.0f}ms · p95 {p95 * 1000:.0f}ms"
+            else:
+                # Refreshes, journal flushes and other work outside any update
+                message += f"   {handler.sheets_calls} calls · {handler.sheets_time:.1f}s in Sheets"
+            errors = handler.errors + handler.sheets_errors
+            message += f" · {errors} error{'s' if errors != 1 else ''}\n"
+        message += "\n"
+    
+    api_calls = sorted(stats['api_calls'].items(), key=lambda entry: entry[1].count, reverse=True)[:6]
+    if api_calls:
+        total_calls = sum(call.count for call in stats['api_calls'].values())
+        message += f"📡 *Sheets API Calls* ({total_calls} total)\n"
+        for name, call in api_calls:
+            p50, p95, p99 = call.percentiles()
+            message += (f"`{name}` ×{call.count}: p50 {p50 * 1000:.0f} / p95 {p95 * 1000:.0f} / "
+                        f"p99 {p99 * 1000:.0f}ms")
+            message += f" · {call.errors} err\n" if call.errors else "\n"
+        message += "\n"
+    
+    methods = sorted(stats['methods'].items(), key=lambda entry: entry[1].total_time, reverse=True)[:5]
+    if methods:
+        message += "🗄️ *Slowest Storage Methods* (total time)\n"
+        for name, method in methods:
+            _, p95, _ = method.percentiles()
+            message += f"`{name.split('.')[-1]}` ×{method.count}: {method.total_time:.1f}s, p95 {p95 * 1000:.0f}ms\n"
+    
+    if not (handlers or api_calls or methods):
+        message += "No activity recorded yet."
+    
+    keyboard = [
+        [InlineKeyboardButton("🔄 Refresh", callback_data="admin_perf")],
+        [InlineKeyboardButton("🔙 Back to Admin Panel", callback_data="admin_back")]
+    ]
+    try:
+        await query.edit_message_text(message, parse_mode='Markdown', reply_markup=InlineKeyboardMarkup(keyboard))
+    except BadRequest as e:
+        # Refresh pressed with nothing new to show
+        if 'not modified' not in str(e).lower():
+            raise
+
 async def admin_back(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Go back to admin panel"""
     query = update.callback_query
@@ -221,8 +259,10 @@ async def admin_back(update: Update, context: ContextTypes.DEFAULT_TYPE):
             InlineKeyboardButton("� Notify Overdue", callback_data="admin_notify_overdue")
         ],
         [
-            InlineKeyboardButton("❌ Close", callback_data="admin_close")
-        ]
+            InlineKeyboardButton("⚙️ Performance", callback_data="admin_perf"),
+            InlineKeyboardButton("📢 Broadcast Message", callback_data="admin_broadcast")
+        ],
+        [InlineKeyboardButton("❌ Close", callback_data="admin_close")]
     ]
     
     reply_markup = InlineKeyboardMarkup(keyboard)
@@ -246,63 +286,90 @@ async def notify_overdue_users(update: Update, context: ContextTypes.DEFAULT_TYP
     await query.answer("Sending notifications to overdue users...")
     
     try:
-        from telegram import Bot
-        bot = context.bot
-        
-        tz = pytz.timezone(config.TIMEZONE)
-        today = datetime.now(tz).date()
-        
-        all_logs = sheets.log_sheet.get_all_records()
-        overdue_rentals = []
-        
-        for log in all_logs:
-            if log.get('Status', '').upper() == 'ACTIVE':
-                expected_return = log.get('Expected Return Date', '')
-                try:
-                    return_date = datetime.strptime(expected_return, '%Y-%m-%d').date()
-                    if return_date < today:
-                        days_overdue = (today - return_date).days
-                        log['_days_overdue'] = days_overdue
-                        overdue_rentals.append(log)
-                except:
-                    continue
+        overdue_rentals = await sheets.get_overdue_rentals()
+        messages = []
         
-        sent_count = 0
         for rental in overdue_rentals:
             try:
-                user_id = int(rental.get('User ID', 0))
-                if user_id:
-                    days = rental['_days_overdue']
-                    message = f"""
+                user_id = int(rental.user_id or 0)
+            except (TypeError, ValueError):
+                continue
+            
+            if user_id:
+                days = rental.days_overdue
+                message = f"""
 🚨 *OVERDUE EQUIPMENT REMINDER*
 
-📦 Item: {rental.get('Item Name')}
-🆔 Item ID: `{rental.get('Item ID')}`
-📅 Was due: {rental.get('Expected Return Date')}
+📦 Item: {rental.item_name}
+🆔 Item ID: `{rental.item_id}`
+📅 Was due: {rental.expected_return}
 ⚠️ *{days} day{'s' if days > 1 else ''} overdue*
 
 Please return this item as soon as possible!
 Use /return to complete the return process.
 
 Thank you! 🙏
-                    """
-                    await bot.send_message(
-                        chat_id=user_id,
-                        text=message,
-                        parse_mode='Markdown'
-                    )
-                    sent_count += 1
-            except Exception as e:
-                print(f"Failed to notify user {user_id}: {e}")
-                continue
+                """
+                messages.append((user_id, message, {'parse_mode': 'Markdown'}))
+        
+        async def report_progress(result):
+            await query.edit_message_text(f"📢 Sending overdue notifications... {result.done}/{result.total}")
+        
+        result = await get_fanout(context.bot).send(messages, progress=report_progress, kind='overdue')
         
         await query.edit_message_text(
-            f"✅ Sent {sent_count} overdue notification(s)!",
+            f"📢 *Overdue notifications*\n\n{result.summary()}",
+            parse_mode='Markdown',
             reply_markup=InlineKeyboardMarkup([[
                 InlineKeyboardButton("🔙 Back", callback_data="admin_back")
             ]])
         )
-        
+    
     except Exception as e:
         await query.edit_message_text(f"❌ Error sending notifications: {e}")
 
+async def admin_broadcast_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Ask the admin for the message to broadcast"""
+    query = update.callback_query
+    await query.answer()
+    
+    if not is_admin(query.from_user.id):
+        await query.edit_message_text("❌ You don't have permission to access admin commands.")
+        return ConversationHandler.END
+    
+    await query.edit_message_text(
+        "📢 *Broadcast Message*\n\n"
+        "Send the message you want to broadcast to every bot user.\n\n"
+        "Type /cancel to cancel.",
+        parse_mode='Markdown'
+    )
+    return WAITING_FOR_BROADCAST_MESSAGE
+
+async def admin_broadcast_send(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Broadcast the admin's message to every known user"""
+    if not is_admin(update.effective_user.id):
+        return ConversationHandler.END
+    
+    text = update.message.text
+    
+    # Everyone who has ever rented, plus users verified since the last restart
+    from bot import verified_users
+    user_ids = set(await sheets.get_known_user_ids()) | set(verified_users)
+    user_ids.discard(update.effective_user.id)
+    
+    status = await update.message.reply_text(f"📢 Broadcasting to {len(user_ids)} user(s)...")
+    
+    async def report_progress(result):
+        await status.edit_text(f"📢 Broadcasting... {result.done}/{result.total}")
+    
+    messages = [(user_id, text, {}) for user_id in sorted(user_ids)]
+    result = await get_fanout(context.bot).send(messages, progress=report_progress, kind='broadcast')
+    
+    await status.edit_text(
+        f"📢 *Broadcast complete*\n\n{result.summary()}",
+        parse_mode='Markdown',
+        reply_markup=InlineKeyboardMarkup([[
+            InlineKeyboardButton("🔙 Back to Admin Panel", callback_data="admin_back")
+        ]])
+    )
+    return ConversationHandler.END
@@ -0,0 +1,133 @@
+"""
+Async Sheets Manager
+Non-blocking facade over SheetsManager for the python-telegram-bot event loop
+"""
+import asyncio
+import contextvars
+import functools
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import config
+from storage import get_storage
+from sheets_scheduler import current_priority, INTERACTIVE
+
+class AsyncSheetsManager:
+    """
+    Runs the blocking gspread calls of a SheetsManager on a bounded worker pool
+    so one slow Sheets round trip never freezes the event loop for other users.
+    
+    Reads are cancelled after SHEETS_CALL_TIMEOUT seconds (waiting for API quota
+    included) and fall back to the same "not found" values SheetsManager returns
+    on error. health() then reports 'unavailable' until a read finishes in time,
+    so handlers say Sheets is unreachable rather than that nothing was found.
+    Writes are never timed out, because the worker thread would keep writing
+    regardless.
+    
+    Calls from admin views and background jobs run on a separate, smaller pool
+    so a user's request never waits for a thread behind a bulk read.
+    """
+    
+    def __init__(self, sheets, max_workers=None, timeout=None, bulk_workers=None):
+        self.sheets = sheets
+        self.timeout = timeout if timeout is not None else config.SHEETS_CALL_TIMEOUT
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers or config.SHEETS_MAX_WORKERS,
+            thread_name_prefix='sheets'
+        )
+        self._bulk_executor = ThreadPoolExecutor(
+            max_workers=bulk_workers or config.SHEETS_BULK_WORKERS,
+            thread_name_prefix='sheets-bulk'
+        )
+        # Set while the last read timed out (e.g. queued behind a short quota)
+        self._reads_timing_out = False
+    
+    async def _run(self, func, *args, **kwargs):
+        """Run a blocking call on the worker pool for its priority class, keeping the caller's context"""
+        loop = asyncio.get_running_loop()
+        ctx = contextvars.copy_context()
+        call = functools.partial(ctx.run, func, *args, **kwargs)
+        executor = self._executor if current_priority.get() == INTERACTIVE else self._bulk_executor
+        return await loop.run_in_executor(executor, call)
+    
+    async def _read(self, default, func, *args, **kwargs):
+        """Run a read with a timeout, returning the default if it does not finish"""
+        try:
+            result = await asyncio.wait_for(self._run(func, *args, **kwargs), self.timeout)
+        except asyncio.TimeoutError:
+            print(f"⏱️ Sheets call {func.__name__} timed out after {self.timeout}s")
+            self._reads_timing_out = True
+            return default
+        self._reads_timing_out = False
+        return result
+    
+    def health(self):
+        """
+        'ok', 'stale', 'unavailable' or 'schema' (no I/O, so it is safe to call on the event loop)
+        A timed-out read counts as 'unavailable', since its result is only the fallback
+        """
+        health = self.sheets.health()
+        if self._reads_timing_out and health != 'schema':
+            return 'unavailable'
+        return health
+    
+    async def get_item_by_id(self, item_id):
+        return await self._read(None, self.sheets.get_item_by_id, item_id)
+    
+    async def check_availability(self, item_id, user_id=None):
+        return await self._read((False, 0, None), self.sheets.check_availability, item_id, user_id)
+    
+    async def reserve_stock(self, item_id, user_id, quantity):
+        return await self._run(self.sheets.reserve_stock, item_id, user_id, quantity)
+    
+    async def release_stock(self, hold_id):
+        return await self._run(self.sheets.release_stock, hold_id)
+    
+    async def get_active_rentals_by_user(self, user_id):
+        return await self._read([], self.sheets.get_active_rentals_by_user, user_id)
+    
+    async def get_all_active_rentals(self):
+        return await self._read([], self.sheets.get_all_active_rentals)
+    
+    async def get_all_due_tomorrow(self):
+        return await self._read([], self.sheets.get_all_due_tomorrow)
+    
+    async def get_overdue_rentals(self):
+        return await self._read([], self.sheets.get_overdue_rentals)
+    
+    async def get_known_user_ids(self):
+        return await self._read([], self.sheets.get_known_user_ids)
+    
+    async def get_rental_stats(self, rebuild=False):
+        return await self._read(None, self.sheets.get_rental_stats, rebuild)
+    
+    async def user_has_overdue_items(self, user_id):
+        return await self._read((False, None), self.sheets.user_has_overdue_items, user_id)
+    
+    async def log_rental(self, **kwargs):
+        return await self._run(self.sheets.log_rental, **kwargs)
+    
+    async def complete_return(self, rental_id, return_photo_url):
+        return await self._run(self.sheets.complete_return, rental_id, return_photo_url)
+    
+    async def archive_returned_rentals(self, older_than_days=None):
+        return await self._run(self.sheets.archive_returned_rentals, older_than_days)
+    
+    async def warm_up(self):
+        return await self._run(self.sheets.warm_up)
+    
+    def shutdown(self):
+        """Stop the worker pool, dropping calls that have not started yet"""
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self._bulk_executor.shutdown(wait=False, cancel_futures=True)
+
+_shared_async = None
+_shared_async_lock = threading.Lock()
+
+def get_async_sheets():
+    """Get the process-wide async facade over the configured storage backend"""
+    global _shared_async
+    if _shared_async is None:
+        with _shared_async_lock:
+            if _shared_async is None:
+                _shared_async = AsyncSheetsManager(get_storage())
+    return _shared_async
@@ -15,7 +15,7 @@ from telegram.ext import (
 from datetime import datetime, timedelta
 import pytz
 import config
-from sheets_manager import SheetsManager
+from async_sheets import get_async_sheets
 from admin_commands import is_admin
 
 # Conversation states
@@ -29,7 +29,7 @@ WAITING_FOR_RETURN_CHOICE = 6
 WAITING_FOR_RETURN_PHOTO = 7
 
 # Initialize Sheets Manager
-sheets = SheetsManager()
+sheets = get_async_sheets()
 
 # Password for verification (from config/env)
 VERIFICATION_PASSWORD = config.VERIFICATION_PASSWORD
@@ -37,6 +37,20 @@ VERIFICATION_PASSWORD = config.VERIFICATION_PASSWORD
 # Store verified users (in-memory, resets when bot restarts)
 verified_users = set()
 
+# Shown while Google Sheets is failing (see sheets.health())
+SHEETS_UNAVAILABLE_MESSAGE = "⚠️ Google Sheets is temporarily unreachable. Please try again in a minute."
+STALE_DATA_NOTE = "⚠️ _Google Sheets is unreachable right now, showing the last saved data._\n\n"
+# Shown while a sheet's header row does not match the expected columns (health() == 'schema')
+SHEETS_SCHEMA_MESSAGE = ("⚠️ The Google Sheets columns were changed, so rentals and returns are paused "
+                         "until an admin fixes the header row.")
+SCHEMA_DATA_NOTE = ("⚠️ _The Google Sheets columns were changed, showing the last saved data. "
+                    "Rentals and returns are paused until an admin fixes the header row._\n\n")
+DATA_NOTES = {'stale': STALE_DATA_NOTE, 'schema': SCHEMA_DATA_NOTE}
+
+def sheets_problem_message(health):
+    """The message explaining why Sheets can't be used ('unavailable' or 'schema' health)"""
+    return SHEETS_SCHEMA_MESSAGE if health == 'schema' else SHEETS_UNAVAILABLE_MESSAGE
+
 # Helper Functions for Validation
 def validate_quantity_input(quantity_str, max_available):
     """
@@ -85,6 +99,12 @@ def verify_user(user_id):
     """Mark user as verified"""
     verified_users.add(user_id)
 
+async def release_rental_hold(context: ContextTypes.DEFAULT_TYPE):
+    """Give back any stock held for the user's unfinished rental"""
+    hold_id = context.user_data.pop('rental_hold_id', None)
+    if hold_id is not None:
+        await sheets.release_stock(hold_id)
+
 async def check_verification(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Check if user is verified, if not ask for password"""
     user = update.effective_user
@@ -116,14 +136,14 @@ async def receive_password(update: Update, context: ContextTypes.DEFAULT_TYPE):
             context.user_data.pop('after_verify', None)
             
             # Check if user has overdue items
-            has_overdue, overdue_rental = sheets.user_has_overdue_items(user.id)
+            has_overdue, overdue_rental = await sheets.user_has_overdue_items(user.id)
             if has_overdue:
                 await update.message.reply_text(
                     "✅ *Verification Successful!*\n\n"
                     f"However, you have an overdue item that must be returned first:\n\n"
-                    f"📦 Item: {overdue_rental.get('Item Name', 'Unknown')}\n"
-                    f"🆔 ID: `{overdue_rental.get('Item ID', 'N/A')}`\n"
-                    f"🗓️ Was due: {overdue_rental.get('Expected Return Date', 'N/A')}\n\n"
+                    f"📦 Item: {overdue_rental.item_name or 'Unknown'}\n"
+                    f"🆔 ID: `{overdue_rental.item_id or 'N/A'}`\n"
+                    f"🗓️ Was due: {overdue_rental.expected_return or 'N/A'}\n\n"
                     "⚠️ Please return this item before renting more equipment.\n\n"
                     "Use /return to return your overdue item.",
                     parse_mode='Markdown'
@@ -317,14 +337,17 @@ async def rent_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
         return WAITING_FOR_PASSWORD
     
+    # A restarted /rent gives back stock held by the previous attempt
+    await release_rental_hold(context)
+    
     # Check if user has overdue items
-    has_overdue, overdue_rental = sheets.user_has_overdue_items(user.id)
+    has_overdue, overdue_rental = await sheets.user_has_overdue_items(user.id)
     if has_overdue:
         await update.message.reply_text(
             f"❌ *You have an overdue item that must be returned first:*\n\n"
-            f"📦 Item: {overdue_rental.get('Item Name', 'Unknown')}\n"
-            f"🆔 ID: `{overdue_rental.get('Item ID', 'N/A')}`\n"
-            f"🗓️ Was due: {overdue_rental.get('Expected Return Date', 'N/A')}\n\n"
+            f"📦 Item: {overdue_rental.item_name or 'Unknown'}\n"
+            f"🆔 ID: `{overdue_rental.item_id or 'N/A'}`\n"
+            f"🗓️ Was due: {overdue_rental.expected_return or 'N/A'}\n\n"
             "⚠️ Please return this item before renting more equipment.\n\n"
             "Use /return to return your overdue item.",
             parse_mode='Markdown'
@@ -347,8 +370,15 @@ async def receive_item_id(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Process the item ID provided by user"""
     item_id = update.message.text.strip().upper()
     
-    # Check availability
-    available, quantity, item = sheets.check_availability(item_id)
+    # Check availability (stock held by other users' unfinished rentals is excluded)
+    available, quantity, item = await sheets.check_availability(item_id, update.effective_user.id)
+    
+    health = sheets.health()
+    if health == 'schema' or (not item and health == 'unavailable'):
+        await update.message.reply_text(
+            f"{sheets_problem_message(health)}\n\nType /cancel to cancel."
+        )
+        return WAITING_FOR_ITEM_ID
     
     if not item:
         await update.message.reply_text(
@@ -360,7 +390,7 @@ async def receive_item_id(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     if not available:
         # Item is out of stock - check Quantity Current
-        quantity_current = int(item.get('Quantity Current', 0))
+        quantity_current = int(item.get('Quantity Current') or 0)
         
         await update.message.reply_text(
             f"❌ Sorry, *{item.get('Item Name')}* (ID: `{item_id}`) is currently OUT OF STOCK.\n\n"
@@ -418,8 +448,29 @@ async def receive_quantity(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
         return WAITING_FOR_QUANTITY
     
+    # Hold the stock so nobody else can take it while this rental is completed
+    hold_id, available_now = await sheets.reserve_stock(
+        context.user_data['rental_item_id'], update.effective_user.id, quantity
+    )
+    if hold_id is None:
+        context.user_data['rental_item_max_quantity'] = available_now
+        if available_now < 1:
+            await update.message.reply_text(
+                "❌ Sorry, this item was just taken by someone else and is now out of stock.\n\n"
+                "Please start over with /rent."
+            )
+            context.user_data.clear()
+            return ConversationHandler.END
+        await update.message.reply_text(
+            f"❌ Only {available_now} unit(s) are available now.\n\n"
+            f"Please enter a number between 1 and {available_now}\n\n"
+            "Type /cancel to cancel this operation."
+        )
+        return WAITING_FOR_QUANTITY
+    
     # Store quantity
     context.user_data['rental_quantity'] = quantity
+    context.user_data['rental_hold_id'] = hold_id
     
     # Create duration selection keyboard
     keyboard = [
@@ -525,13 +576,13 @@ async def receive_pickup_photo(update: Update, context: ContextTypes.DEFAULT_TYP
         )
         return WAITING_FOR_PICKUP_PHOTO
     
-    # DOUBLE-CHECK availability before finalizing (prevent race conditions)
+    # Renew the stock hold before finalizing (it may have expired while waiting for the photo)
     item_id = context.user_data['rental_item_id']
     requested_qty = context.user_data.get('rental_quantity', 1)
     
-    available, current_qty, item = sheets.check_availability(item_id)
+    hold_id, current_qty = await sheets.reserve_stock(item_id, update.effective_user.id, requested_qty)
     
-    if not available or current_qty < requested_qty:
+    if hold_id is None:
         await update.message.reply_text(
             f"❌ *Sorry, this item is no longer available!*\n\n"
             f"Someone else may have rented it while you were completing your request.\n\n"
@@ -540,6 +591,7 @@ async def receive_pickup_photo(update: Update, context: ContextTypes.DEFAULT_TYP
             "Please start over with /rent and check current availability.",
             parse_mode='Markdown'
         )
+        await release_rental_hold(context)
         context.user_data.clear()
         return ConversationHandler.END
     
@@ -554,7 +606,7 @@ async def receive_pickup_photo(update: Update, context: ContextTypes.DEFAULT_TYP
     telegram_username = f"@{user.username}" if user.username else f"ID:{user.id}"
     
     # Log the rental in Google Sheets
-    success = sheets.log_rental(
+    success = await sheets.log_rental(
         borrower_name=borrower_name,
         telegram_username=telegram_username,
         user_id=user.id,
@@ -563,9 +615,13 @@ async def receive_pickup_photo(update: Update, context: ContextTypes.DEFAULT_TYP
         rental_start=context.user_data['rental_start'],
         expected_return=context.user_data['rental_return'],
         pickup_photo_url=photo_url,
-        quantity=context.user_data.get('rental_quantity', 1)
+        quantity=context.user_data.get('rental_quantity', 1),
+        hold_id=hold_id
     )
     
+    if success and success.inventory_written is False:
+        print(f"⚠️ Rental logged but Loaned Out not updated for {context.user_data['rental_item_id']}")
+    
     if success:
         rental_quantity = context.user_data.get('rental_quantity', 1)
         confirmation_msg = f"""
@@ -591,6 +647,10 @@ Thank you! 🙏
             confirmation_msg, 
             parse_mode='Markdown'
         )
+    elif sheets.health() != 'ok':
+        await update.message.reply_text(
+            f"❌ Your rental could not be saved.\n\n{sheets_problem_message(sheets.health())}"
+        )
     else:
         await update.message.reply_text(
             "❌ There was an error processing your rental. Please contact an admin."
@@ -613,7 +673,12 @@ async def my_rentals(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
         return
     
-    rentals = sheets.get_active_rentals_by_user(user.id)
+    rentals = await sheets.get_active_rentals_by_user(user.id)
+    health = sheets.health()
+    
+    if not rentals and health in ('unavailable', 'schema'):
+        await update.message.reply_text(sheets_problem_message(health))
+        return
     
     if not rentals:
         await update.message.reply_text(
@@ -625,15 +690,16 @@ async def my_rentals(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
         return
     
-    message = f"📦 *Your Active Rentals ({len(rentals)} item{'s' if len(rentals) > 1 else ''}):*\n\n"
+    message = DATA_NOTES.get(health, "")
+    message += f"📦 *Your Active Rentals ({len(rentals)} item{'s' if len(rentals) > 1 else ''}):*\n\n"
     
     for idx, rental in enumerate(rentals, 1):
-        item_name = rental.get('Item Name', 'Unknown Item')
-        item_id = rental.get('Item ID', 'N/A')
-        quantity = rental.get('Quantity', 1)
-        rental_start = rental.get('Rental Start Date', 'N/A')
-        expected_return = rental.get('Expected Return Date', 'N/A')
-        location = rental.get('Location', 'Unknown')
+        item_name = rental.item_name or 'Unknown Item'
+        item_id = rental.item_id or 'N/A'
+        quantity = rental.quantity
+        rental_start = rental.rental_start or 'N/A'
+        expected_return = rental.expected_return or 'N/A'
+        location = rental.location or 'Unknown'
         
         message += f"{idx}. *{item_name}*\n"
         message += f"   🆔 ID: `{item_id}`\n"
@@ -668,7 +734,12 @@ async def return_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
         return ConversationHandler.END
     
-    rentals = sheets.get_active_rentals_by_user(user.id)
+    rentals = await sheets.get_active_rentals_by_user(user.id)
+    health = sheets.health()
+    
+    if health == 'schema' or (not rentals and health == 'unavailable'):
+        await update.message.reply_text(sheets_problem_message(health))
+        return ConversationHandler.END
     
     if not rentals:
         await update.message.reply_text(
@@ -677,15 +748,15 @@ async def return_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return ConversationHandler.END
     
     # Store rentals in context
-    context.user_data['return_rentals'] = rentals
+    context.user_data['return_rentals'] = {rental.rental_id: rental for rental in rentals}
     
     # Create inline keyboard for rental selection
     keyboard = []
-    for idx, rental in enumerate(rentals):
+    for rental in rentals:
         keyboard.append([
             InlineKeyboardButton(
-                f"{rental.get('Item Name')} ({rental.get('Item ID')})",
-                callback_data=f"return_select_{idx}"
+                f"{rental.item_name} ({rental.item_id})",
+                callback_data=f"return_select_{rental.rental_id}"
             )
         ])
     
@@ -705,24 +776,27 @@ async def receive_return_choice(update: Update, context: ContextTypes.DEFAULT_TY
     query = update.callback_query
     await query.answer()
     
-    # Extract index from callback data
-    idx = int(query.data.replace("return_select_", ""))
-    rentals = context.user_data.get('return_rentals', [])
+    # Extract the Rental ID from callback data
+    rental_id = query.data.replace("return_select_", "")
+    selected_rental = context.user_data.get('return_rentals', {}).get(rental_id)
+    if selected_rental is None:
+        # A button from an older list: look the rental up again
+        rentals = await sheets.get_active_rentals_by_user(update.effective_user.id)
+        selected_rental = next((rental for rental in rentals if rental.rental_id == rental_id), None)
     
-    if idx < 0 or idx >= len(rentals):
-        await query.edit_message_text("❌ Invalid selection. Please try again.")
+    if selected_rental is None:
+        await query.edit_message_text("❌ This rental is no longer active. Use /myrentals to check.")
         return ConversationHandler.END
     
     # Store selected rental
-    selected_rental = rentals[idx]
     context.user_data['return_rental'] = selected_rental
     
-    location = selected_rental.get('Location', 'the designated area')
-    quantity = selected_rental.get('Quantity', 1)
+    location = selected_rental.location or 'the designated area'
+    quantity = selected_rental.quantity
     
     await query.edit_message_text(
-        f"📸 *Returning: {selected_rental.get('Item Name')}*\n"
-        f"🆔 Item ID: `{selected_rental.get('Item ID')}`\n"
+        f"📸 *Returning: {selected_rental.item_name}*\n"
+        f"🆔 Item ID: `{selected_rental.item_id}`\n"
         f"📦 Quantity: {quantity}\n"
         f"📍 Return to: *{location}*\n\n"
         f"⚠️ Please return {'the item' if quantity == 1 else 'all items'} to *{location}* and take a photo to confirm.\n\n"
@@ -748,19 +822,21 @@ async def receive_return_photo(update: Update, context: ContextTypes.DEFAULT_TYP
     
     # Get rental details
     rental = context.user_data['return_rental']
-    row_number = rental['_row_number']
     
-    # Complete the return in Google Sheets
-    success = sheets.complete_return(row_number, photo_url)
+    # Complete the return in Google Sheets (found by Rental ID wherever its row is now)
+    success = await sheets.complete_return(rental.rental_id, photo_url)
+    
+    if success and success.inventory_written is False:
+        print(f"⚠️ Return logged but Loaned Out not updated for {rental.item_id}")
     
     if success:
-        location = rental.get('Location', 'the designated area')
-        quantity = rental.get('Quantity', 1)
+        location = rental.location or 'the designated area'
+        quantity = rental.quantity
         
         await update.message.reply_text(
             f"✅ *Return Confirmed!*\n\n"
-            f"📦 Item: {rental.get('Item Name')}\n"
-            f"🆔 Item ID: `{rental.get('Item ID')}`\n"
+            f"📦 Item: {rental.item_name}\n"
+            f"🆔 Item ID: `{rental.item_id}`\n"
             f"📦 Quantity: {quantity}\n"
             f"📍 Location: *{location}*\n\n"
             f"⚠️ *Please return {'the item' if quantity == 1 else 'all items'} to: {location}*\n\n"
@@ -770,6 +846,10 @@ async def receive_return_photo(update: Update, context: ContextTypes.DEFAULT_TYP
             f"• To view your rentals: /myrentals",
             parse_mode='Markdown'
         )
+    elif sheets.health() != 'ok':
+        await update.message.reply_text(
+            f"❌ Your return could not be saved.\n\n{sheets_problem_message(sheets.health())}"
+        )
     else:
         await update.message.reply_text(
             "❌ There was an error processing your return. Please contact an admin."
@@ -781,6 +861,7 @@ async def receive_return_photo(update: Update, context: ContextTypes.DEFAULT_TYP
 
 async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Cancel the current operation"""
+    await release_rental_hold(context)
     context.user_data.clear()
     
     await update.message.reply_text(
@@ -798,6 +879,7 @@ async def rent_cancel_callback(update: Update, context: ContextTypes.DEFAULT_TYP
     """Cancel rental from callback"""
     query = update.callback_query
     await query.answer()
+    await release_rental_hold(context)
     context.user_data.clear()
     
     await query.edit_message_text(
@@ -827,7 +909,12 @@ async def main_myrentals_callback(update: Update, context: ContextTypes.DEFAULT_
     await query.answer()
     
     user = query.from_user
-    rentals = sheets.get_active_rentals_by_user(user.id)
+    rentals = await sheets.get_active_rentals_by_user(user.id)
+    health = sheets.health()
+    
+    if not rentals and health in ('unavailable', 'schema'):
+        await query.edit_message_text(sheets_problem_message(health))
+        return
     
     if not rentals:
         await query.edit_message_text(
@@ -839,14 +926,15 @@ async def main_myrentals_callback(update: Update, context: ContextTypes.DEFAULT_
         )
         return
     
-    message = f"📦 *Your Active Rentals ({len(rentals)} item{'s' if len(rentals) > 1 else ''}):*\n\n"
+    message = DATA_NOTES.get(health, "")
+    message += f"📦 *Your Active Rentals ({len(rentals)} item{'s' if len(rentals) > 1 else ''}):*\n\n"
     
     for idx, rental in enumerate(rentals, 1):
-        item_name = rental.get('Item Name', 'Unknown Item')
-        item_id = rental.get('Item ID', 'N/A')
-        rental_start = rental.get('Rental Start Date', 'N/A')
-        expected_return = rental.get('Expected Return Date', 'N/A')
-        location = rental.get('Location', 'Unknown')
+        item_name = rental.item_name or 'Unknown Item'
+        item_id = rental.item_id or 'N/A'
+        rental_start = rental.rental_start or 'N/A'
+        expected_return = rental.expected_return or 'N/A'
+        location = rental.location or 'Unknown'
         
         message += f"{idx}. *{item_name}*\n"
         message += f"   🆔 ID: `{item_id}`\n"
@@ -915,14 +1003,17 @@ async def quick_rent_callback(update: Update, context: ContextTypes.DEFAULT_TYPE
         )
         return ConversationHandler.END
     
+    # A restarted rental gives back stock held by the previous attempt
+    await release_rental_hold(context)
+    
     # Check if user has overdue items
-    has_overdue, overdue_rental = sheets.user_has_overdue_items(user.id)
+    has_overdue, overdue_rental = await sheets.user_has_overdue_items(user.id)
     if has_overdue:
         await query.message.reply_text(
             f"❌ *You have an overdue item that must be returned first:*\n\n"
-            f"📦 Item: {overdue_rental.get('Item Name', 'Unknown')}\n"
-            f"🆔 ID: `{overdue_rental.get('Item ID', 'N/A')}`\n"
-            f"🗓️ Was due: {overdue_rental.get('Expected Return Date', 'N/A')}\n\n"
+            f"📦 Item: {overdue_rental.item_name or 'Unknown'}\n"
+            f"🆔 ID: `{overdue_rental.item_id or 'N/A'}`\n"
+            f"🗓️ Was due: {overdue_rental.expected_return or 'N/A'}\n\n"
             "⚠️ Please return this item before renting more equipment.\n\n"
             "Use /return to return your overdue item.",
             parse_mode='Markdown'
@@ -955,7 +1046,12 @@ async def main_return_callback(update: Update, context: ContextTypes.DEFAULT_TYP
         )
         return ConversationHandler.END
     
-    rentals = sheets.get_active_rentals_by_user(user.id)
+    rentals = await sheets.get_active_rentals_by_user(user.id)
+    health = sheets.health()
+    
+    if health == 'schema' or (not rentals and health == 'unavailable'):
+        await query.edit_message_text(sheets_problem_message(health))
+        return
     
     if not rentals:
         keyboard = [[InlineKeyboardButton("🎯 Rent Equipment", callback_data="quick_rent")]]
@@ -968,15 +1064,15 @@ async def main_return_callback(update: Update, context: ContextTypes.DEFAULT_TYP
         return
     
     # Store rentals in context
-    context.user_data['return_rentals'] = rentals
+    context.user_data['return_rentals'] = {rental.rental_id: rental for rental in rentals}
     
     # Create inline keyboard for rental selection
     keyboard = []
-    for idx, rental in enumerate(rentals):
+    for rental in rentals:
         keyboard.append([
             InlineKeyboardButton(
-                f"{rental.get('Item Name')} ({rental.get('Item ID')})",
-                callback_data=f"return_select_{idx}"
+                f"{rental.item_name} ({rental.item_id})",
+                callback_data=f"return_select_{rental.rental_id}"
             )
         ])
     
@@ -1016,8 +1112,9 @@ async def main_admin_callback(update: Update, context: ContextTypes.DEFAULT_TYPE
         ],
         [
             InlineKeyboardButton("📈 Statistics", callback_data="admin_stats"),
-            InlineKeyboardButton("❌ Close", callback_data="admin_close")
-        ]
+            InlineKeyboardButton("⚙️ Performance", callback_data="admin_perf")
+        ],
+        [InlineKeyboardButton("❌ Close", callback_data="admin_close")]
     ]
     
     reply_markup = InlineKeyboardMarkup(keyboard)
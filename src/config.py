@@ -15,6 +15,106 @@ GOOGLE_SHEETS_ID = os.getenv('GOOGLE_SHEETS_ID')
 INVENTORY_SHEET_NAME = os.getenv('INVENTORY_SHEET_NAME', 'Available Items')
 LOG_SHEET_NAME = os.getenv('LOG_SHEET_NAME', 'Rental Log')
 
+# Sheets cache
+# How often (in seconds) the in-memory inventory is re-read and new Rental Log
+# rows are fetched, to pick up manual edits
+CACHE_REFRESH_SECONDS = int(os.getenv('CACHE_REFRESH_SECONDS', '300'))
+# The Rental Log is read incrementally (new rows only). This often (in seconds)
+# the spreadsheet revision is checked to catch manual edits to existing rows
+LOG_VERIFY_SECONDS = int(os.getenv('LOG_VERIFY_SECONDS', '900'))
+
+# Sheets worker pool
+# Blocking Sheets calls run on this many threads so they never stall the bot's event loop
+SHEETS_MAX_WORKERS = int(os.getenv('SHEETS_MAX_WORKERS', '4'))
+# Seconds before a Sheets read is abandoned and treated as "not found"
+SHEETS_CALL_TIMEOUT = float(os.getenv('SHEETS_CALL_TIMEOUT', '30'))
+
+# Sheets API quota
+# Requests per minute the scheduler lets through for the service account (0 = unlimited).
+# Google's default is 60 reads and 60 writes per minute per user; users' conversations
+# go first, then admin views, then reminders and background refresh
+SHEETS_READ_QUOTA_PER_MINUTE = int(os.getenv('SHEETS_READ_QUOTA_PER_MINUTE', '60'))
+SHEETS_WRITE_QUOTA_PER_MINUTE = int(os.getenv('SHEETS_WRITE_QUOTA_PER_MINUTE', '60'))
+# Worker threads for admin and background calls, kept apart so users never queue behind bulk reads
+SHEETS_BULK_WORKERS = int(os.getenv('SHEETS_BULK_WORKERS', '2'))
+
+# Sheets retries and circuit breaker
+# 429s and transient errors (5xx, timeouts) are retried with jittered exponential backoff.
+# After SHEETS_BREAKER_THRESHOLD failures in a row, Sheets calls fail fast for
+# SHEETS_BREAKER_RESET_SECONDS and reads are served from the last good cache
+SHEETS_RETRY_ATTEMPTS = int(os.getenv('SHEETS_RETRY_ATTEMPTS', '4'))
+SHEETS_RETRY_BASE_SECONDS = float(os.getenv('SHEETS_RETRY_BASE_SECONDS', '0.5'))
+SHEETS_RETRY_MAX_SECONDS = float(os.getenv('SHEETS_RETRY_MAX_SECONDS', '8'))
+SHEETS_BREAKER_THRESHOLD = int(os.getenv('SHEETS_BREAKER_THRESHOLD', '5'))
+SHEETS_BREAKER_RESET_SECONDS = float(os.getenv('SHEETS_BREAKER_RESET_SECONDS', '30'))
+
+# Telegram updates processed at the same time (one slow user no longer blocks the rest)
+CONCURRENT_UPDATES = int(os.getenv('CONCURRENT_UPDATES', '16'))
+
+# Stock reservations
+# Seconds a chosen quantity stays held for a user before the /rent conversation must finish
+STOCK_HOLD_SECONDS = int(os.getenv('STOCK_HOLD_SECONDS', '900'))
+
+# Message fan-out (reminders, overdue notifications, broadcasts)
+# Telegram allows about 30 messages/second overall and 1 message/second per chat
+FANOUT_RATE_PER_SECOND = float(os.getenv('FANOUT_RATE_PER_SECOND', '25'))
+FANOUT_PER_CHAT_INTERVAL = float(os.getenv('FANOUT_PER_CHAT_INTERVAL', '1.0'))
+FANOUT_CONCURRENCY = int(os.getenv('FANOUT_CONCURRENCY', '20'))
+FANOUT_MAX_RETRIES = int(os.getenv('FANOUT_MAX_RETRIES', '3'))
+
+# Write-behind journal (Google Sheets backend, off unless enabled)
+# Rentals and returns are saved to a local journal file and confirmed right away,
+# then written to the sheets in batches by a background worker. Unflushed entries
+# are replayed at startup, so the journal must be on persistent disk: WRITE_BEHIND
+# stays off unless WRITE_JOURNAL_PATH is set too
+WRITE_BEHIND = os.getenv('WRITE_BEHIND', 'false').strip().lower() in ('1', 'true', 'yes')
+WRITE_JOURNAL_PATH = os.getenv('WRITE_JOURNAL_PATH', '').strip()
+# Seconds the worker waits after a write to batch up any that follow
+JOURNAL_BATCH_SECONDS = float(os.getenv('JOURNAL_BATCH_SECONDS', '0.5'))
+
+# Rental Log archive (Google Sheets backends, off unless enabled)
+# Once a day, RETURNED rows older than ARCHIVE_AFTER_DAYS (0 = never) move out of the
+# Rental Log into "<ARCHIVE_SHEET_PREFIX> YYYY-MM" tabs (or "... YYYY" with ARCHIVE_PERIOD=year),
+# so the hot tab holds only active and recent rentals
+ARCHIVE_AFTER_DAYS = int(os.getenv('ARCHIVE_AFTER_DAYS', '0'))
+ARCHIVE_PERIOD = os.getenv('ARCHIVE_PERIOD', 'month').strip().lower()
+ARCHIVE_SHEET_PREFIX = os.getenv('ARCHIVE_SHEET_PREFIX', 'Rental Log Archive')
+ARCHIVE_HOUR = int(os.getenv('ARCHIVE_HOUR', '4'))
+
+# Storage backend
+# 'sheets' (default) reads and writes Google Sheets directly. 'sqlite' keeps inventory and
+# rentals in a local SQLite database and mirrors every change to the sheets in the background.
+# 'fake' runs against an in-memory copy of the sheets (offline runs and benchmarks)
+STORAGE_BACKEND = os.getenv('STORAGE_BACKEND', 'sheets').strip().lower()
+SQLITE_PATH = os.getenv('SQLITE_PATH', 'rental_bot.db')
+
+# Fake sheets (STORAGE_BACKEND=fake)
+# Seconds added to every call, plus up to JITTER more, and the chance of a 429 or other API error per call
+FAKE_SHEETS_LATENCY = float(os.getenv('FAKE_SHEETS_LATENCY', '0'))
+FAKE_SHEETS_JITTER = float(os.getenv('FAKE_SHEETS_JITTER', '0'))
+FAKE_SHEETS_RATE_LIMIT_RATE = float(os.getenv('FAKE_SHEETS_RATE_LIMIT_RATE', '0'))
+FAKE_SHEETS_FAILURE_RATE = float(os.getenv('FAKE_SHEETS_FAILURE_RATE', '0'))
+FAKE_SHEETS_SEED = int(os.getenv('FAKE_SHEETS_SEED')) if os.getenv('FAKE_SHEETS_SEED') else None
+
+# Update delivery
+# 'polling' (long-poll getUpdates) or 'webhook': Telegram POSTs each update to WEBHOOK_URL, which must be
+# HTTPS and reach the bot's own server on WEBHOOK_HOST:WEBHOOK_PORT (directly or through a proxy/load balancer)
+UPDATE_MODE = os.getenv('UPDATE_MODE', 'polling').strip().lower()
+WEBHOOK_URL = os.getenv('WEBHOOK_URL', '')
+WEBHOOK_HOST = os.getenv('WEBHOOK_HOST', '0.0.0.0')
+WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', os.getenv('PORT', '8443')))
+# Path the server accepts updates on (defaults to WEBHOOK_URL's path)
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', '')
+# Telegram sends this in X-Telegram-Bot-Api-Secret-Token; requests without it are refused
+# (random per start when unset, which is fine for a single instance)
+WEBHOOK_SECRET_TOKEN = os.getenv('WEBHOOK_SECRET_TOKEN', '')
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv('WEBHOOK_MAX_CONNECTIONS', '40'))
+
+# Metrics endpoint
+# Serve Prometheus metrics at http://METRICS_HOST:METRICS_PORT/metrics (0 = disabled)
+METRICS_PORT = int(os.getenv('METRICS_PORT', '0'))
+METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+
 # Google Credentials
 # For local development: Use credentials.json file in root directory
 # For Railway/Cloud deployment: Set GOOGLE_CREDENTIALS environment variable with JSON content
@@ -52,7 +152,7 @@ INVENTORY_COLUMNS = {
 }
 
 # Log Sheet: Date & Time, Borrower Name, Telegram Username, User ID, Item ID, Quantity,
-# Rental Start Date, Expected Return Date, Actual Return Date, Status, Pickup Photo, Return Photo
+# Rental Start Date, Expected Return Date, Actual Return Date, Status, Pickup Photo, Return Photo, Rental ID
 # NOTE: Each row is ONE rental. Multiple different items = multiple rows
 LOG_COLUMNS = {
     'DATE_TIME': 0,
@@ -66,6 +166,7 @@ LOG_COLUMNS = {
     'ACTUAL_RETURN': 8,
     'STATUS': 9,
     'PICKUP_PHOTO': 10,
-    'RETURN_PHOTO': 11
+    'RETURN_PHOTO': 11,
+    'RENTAL_ID': 12
 }
 
@@ -0,0 +1,124 @@
+"""
+Due Date Index
+ACTIVE rentals ordered by Expected Return Date, with the set of users holding overdue items
+"""
+import bisect
+from datetime import datetime
+import pytz
+import config
+
+def local_today():
+    """Today's date in config.TIMEZONE"""
+    return datetime.now(pytz.timezone(config.TIMEZONE)).date()
+
+def parse_due_date(value):
+    """Expected Return Date as a date, or None if it is empty or malformed"""
+    try:
+        return datetime.strptime(str(value).strip(), '%Y-%m-%d').date()
+    except ValueError:
+        return None
+
+class DueDateIndex:
+    """
+    Rental keys grouped by due date, with the dates kept sorted so "due before
+    today" and "due on a day" are range reads, plus each user's overdue keys.
+    
+    Due dates are held as date ordinals (RentalRecord.due_ordinal), parsed
+    once when the rental was read. `today` only moves forward through
+    roll_over(), which marks the rentals whose due dates it passes as overdue,
+    so the per-user check stays O(1) between midnights. Callers serialize
+    access (RentalLogMirror holds its lock).
+    """
+    
+    def __init__(self, today=None):
+        self.today = (today or local_today()).toordinal()
+        self._dates = []  # sorted due date ordinals that have at least one rental
+        self._keys_by_date = {}  # due date ordinal -> set of rental keys
+        self._due = {}  # rental key -> (due date ordinal, user key)
+        self._overdue_by_user = {}  # user key -> set of overdue rental keys
+    
+    def __len__(self):
+        return len(self._due)
+    
+    def clear(self):
+        self._dates = []
+        self._keys_by_date = {}
+        self._due = {}
+        self._overdue_by_user = {}
+    
+    def add(self, key, user_key, due):
+        """Index a rental due on a date ordinal (replacing any earlier entry for key); None is skipped"""
+        self.remove(key)
+        if due is None:
+            return
+        self._due[key] = (due, user_key)
+        keys = self._keys_by_date.get(due)
+        if keys is None:
+            keys = self._keys_by_date[due] = set()
+            bisect.insort(self._dates, due)
+        keys.add(key)
+        if due < self.today:
+            self._overdue_by_user.setdefault(user_key, set()).add(key)
+    
+    def remove(self, key):
+        entry = self._due.pop(key, None)
+        if entry is None:
+            return
+        due, user_key = entry
+        keys = self._keys_by_date[due]
+        keys.discard(key)
+        if not keys:
+            del self._keys_by_date[due]
+            del self._dates[bisect.bisect_left(self._dates, due)]
+        self._discard_overdue(user_key, key)
+    
+    def _discard_overdue(self, user_key, key):
+        user_keys = self._overdue_by_user.get(user_key)
+        if user_keys is not None:
+            user_keys.discard(key)
+            if not user_keys:
+                del self._overdue_by_user[user_key]
+    
+    def roll_over(self, today=None):
+        """
+        Advance to a new day (config.TIMEZONE by default), marking rentals
+        due on the days passed as overdue
+        Returns: True if the day changed
+        """
+        today = (today or local_today()).toordinal()
+        if today == self.today:
+            return False
+        if today > self.today:
+            start = bisect.bisect_left(self._dates, self.today)
+            end = bisect.bisect_left(self._dates, today)
+            for due in self._dates[start:end]:
+                for key in self._keys_by_date[due]:
+                    self._overdue_by_user.setdefault(self._due[key][1], set()).add(key)
+        else:
+            # The clock went back: recount from scratch
+            self._overdue_by_user = {}
+            for due in self._dates[:bisect.bisect_left(self._dates, today)]:
+                for key in self._keys_by_date[due]:
+                    self._overdue_by_user.setdefault(self._due[key][1], set()).add(key)
+        self.today = today
+        return True
+    
+    def overdue(self):
+        """Keys of rentals due before today, most overdue first: [(due date ordinal, key)]"""
+        end = bisect.bisect_left(self._dates, self.today)
+        return [(due, key) for due in self._dates[:end] for key in sorted(self._keys_by_date[due])]
+    
+    def due_on(self, day):
+        """Keys of rentals due on a given day (a date)"""
+        return sorted(self._keys_by_date.get(day.toordinal(), ()))
+    
+    def overdue_for_user(self, user_key):
+        """The user's most overdue rental key, or None if they have nothing overdue"""
+        user_keys = self._overdue_by_user.get(user_key)
+        if not user_keys:
+            return None
+        return min(user_keys, key=lambda key: (self._due[key][0], key))
+    
+    def overdue_users(self):
+        """User keys with at least one overdue rental"""
+        return set(self._overdue_by_user)
@@ -0,0 +1,343 @@
+"""
+Fake Google Sheets
+In-memory stand-in for the parts of gspread the bot uses, with latency and fault injection
+"""
+import random
+import re
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from gspread.exceptions import APIError, WorksheetNotFound
+from gspread.utils import a1_to_rowcol, rowcol_to_a1
+import config
+from sheet_schema import INVENTORY_SCHEMA, LOG_SCHEMA
+
+INVENTORY_HEADERS = INVENTORY_SCHEMA.headers
+LOG_HEADERS = LOG_SCHEMA.headers
+
+class _FakeResponse:
+    """Just enough of requests.Response for gspread's APIError"""
+    
+    def __init__(self, code, message, status):
+        self.status_code = code
+        self.text = message
+        self.headers = {}
+        self._error = {'code': code, 'message': message, 'status': status}
+    
+    def json(self):
+        return {'error': self._error}
+
+class FaultProfile:
+    """
+    Per-call latency and failures applied by every fake worksheet call
+    latency/jitter are seconds; rate_limit_rate and failure_rate are
+    probabilities of a 429 or a 503 APIError on each call
+    """
+    
+    def __init__(self, latency=0.0, jitter=0.0, rate_limit_rate=0.0, failure_rate=0.0, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_limit_rate = rate_limit_rate
+        self.failure_rate = failure_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+    
+    @classmethod
+    def from_config(cls):
+        return cls(
+            latency=config.FAKE_SHEETS_LATENCY,
+            jitter=config.FAKE_SHEETS_JITTER,
+            rate_limit_rate=config.FAKE_SHEETS_RATE_LIMIT_RATE,
+            failure_rate=config.FAKE_SHEETS_FAILURE_RATE,
+            seed=config.FAKE_SHEETS_SEED
+        )
+    
+    def apply(self, name):
+        """Sleep for the call's latency, then maybe raise an injected APIError"""
+        with self._lock:
+            delay = self.latency + self._random.uniform(0, self.jitter) if self.jitter else self.latency
+            roll = self._random.random()
+        if delay > 0:
+            time.sleep(delay)
+        if roll < self.rate_limit_rate:
+            raise APIError(_FakeResponse(429, f"Quota exceeded ({name})", 'RESOURCE_EXHAUSTED'))
+        if roll < self.rate_limit_rate + self.failure_rate:
+            raise APIError(_FakeResponse(503, f"The service is currently unavailable ({name})", 'UNAVAILABLE'))
+
+class FakeWorksheet:
+    """
+    One worksheet held as a list of string rows (row 1 is the header)
+    Values are stored as strings like the Sheets API returns them
+    formula(cells) recalculates a row in place after it is written, standing
+    in for sheet formulas such as Quantity Current
+    The grid is grid_rows rows tall (at least the rows given) and grows with
+    appends; ranged reads below it fail with a 400 like the Sheets API
+    """
+    
+    def __init__(self, spreadsheet, title, rows, formula=None, cols=26, grid_rows=None):
+        self.spreadsheet = spreadsheet
+        self.id = len(spreadsheet._worksheets)
+        self.title = title
+        self.formula = formula
+        self._rows = [[str(value) for value in row] for row in rows]
+        self._cols = max([cols] + [len(row) for row in self._rows])
+        self._grid_rows = max(grid_rows or 0, len(self._rows))
+        self._lock = threading.RLock()
+    
+    @property
+    def col_count(self):
+        return self._cols
+    
+    @property
+    def row_count(self):
+        return self._grid_rows
+    
+    def _check_grid(self, range_name, *rows):
+        if any(row > self._grid_rows for row in rows):
+            raise APIError(_FakeResponse(
+                400, f"Range ('{self.title}'!{range_name}) exceeds grid limits. "
+                     f"Max rows: {self._grid_rows}, max columns: {self._cols}", 'INVALID_ARGUMENT'
+            ))
+    
+    def _call(self, name, write=False):
+        self.spreadsheet.calls[f"{self.title}.{name}"] += 1
+        self.spreadsheet.faults.apply(name)
+        if write:
+            self.spreadsheet.touch()
+    
+    def _set(self, row, col, value):
+        while len(self._rows) < row:
+            self._rows.append([])
+        cells = self._rows[row - 1]
+        while len(cells) < col:
+            cells.append('')
+        cells[col - 1] = str(value)
+        self._grid_rows = max(self._grid_rows, len(self._rows))
+        if self.formula and row > 1:
+            self.formula(cells)
+    
+    def get_all_values(self, *args, **kwargs):
+        self._call('get_all_values')
+        with self._lock:
+            return [list(row) for row in self._rows]
+    
+    def get_all_records(self, *args, **kwargs):
+        self._call('get_all_records')
+        with self._lock:
+            headers = self._rows[0] if self._rows else []
+            records = []
+            for row in self._rows[1:]:
+                record = {}
+                for idx, header in enumerate(headers):
+                    value = row[idx] if idx < len(row) else ''
+                    # gspread converts numeric-looking cells to numbers
+                    record[header] = int(value) if re.fullmatch(r'-?\d+', value) else value
+                records.append(record)
+            return records
+    
+    def row_values(self, row, *args, **kwargs):
+        self._call('row_values')
+        with self._lock:
+            values = list(self._rows[row - 1]) if row <= len(self._rows) else []
+        while values and values[-1] == '':
+            values.pop()
+        return values
+    
+    def get(self, range_name, *args, **kwargs):
+        """
+        Ranged read like 'A5:L', 'M2:M' or 'A5:L9' (blank rows past the end are
+        omitted and trailing blank cells trimmed, like the API does)
+        """
+        self._call('get')
+        match = re.fullmatch(r'([A-Z]+)(\d+)(?::([A-Z]+)(\d*))?', range_name.split('!')[-1])
+        if not match:
+            raise ValueError(f"Unsupported range: {range_name}")
+        first_row = int(match.group(2))
+        first_col = a1_to_rowcol(f"{match.group(1)}1")[1]
+        last_col = a1_to_rowcol(f"{match.group(3) or match.group(1)}1")[1]
+        with self._lock:
+            self._check_grid(range_name, first_row, int(match.group(4) or 0))
+            last_row = int(match.group(4)) if match.group(4) else len(self._rows)
+            values = []
+            for row in self._rows[first_row - 1:last_row]:
+                cells = row[first_col - 1:last_col]
+                while cells and cells[-1] == '':
+                    cells.pop()
+                values.append(cells)
+            while values and not values[-1]:
+                values.pop()
+            return values
+    
+    def batch_get(self, ranges, *args, **kwargs):
+        """Several ranges like 'M5' or 'A2:C3' in one call; blank cells are trimmed like the API does"""
+        self._call('batch_get')
+        results = []
+        with self._lock:
+            for range_name in ranges:
+                first, _, last = range_name.split('!')[-1].partition(':')
+                first_row, first_col = a1_to_rowcol(first)
+                last_row, last_col = a1_to_rowcol(last) if last else (first_row, first_col)
+                self._check_grid(range_name, first_row, last_row)
+                values = []
+                for row in self._rows[first_row - 1:last_row]:
+                    cells = row[first_col - 1:last_col]
+                    while cells and cells[-1] == '':
+                        cells.pop()
+                    values.append(cells)
+                while values and not values[-1]:
+                    values.pop()
+                results.append(values)
+        return results
+    
+    def update_cell(self, row, col, value):
+        self._call('update_cell', write=True)
+        with self._lock:
+            self._set(row, col, value)
+    
+    def append_row(self, values, *args, **kwargs):
+        return self.append_rows([values], *args, **kwargs)
+    
+    def append_rows(self, values, *args, **kwargs):
+        self._call('append_rows', write=True)
+        with self._lock:
+            first_row = len(self._rows) + 1
+            for row in values:
+                self._rows.append([str(value) for value in row])
+            last_row = len(self._rows)
+            self._grid_rows = max(self._grid_rows, last_row)
+        width = max((len(row) for row in values), default=1)
+        return {'updates': {'updatedRange': f"'{self.title}'!A{first_row}:{rowcol_to_a1(last_row, width)}"}}
+    
+    def batch_update(self, data, *args, **kwargs):
+        self._call('batch_update', write=True)
+        with self._lock:
+            for update in data:
+                row, col = a1_to_rowcol(update['range'].split('!')[-1].split(':')[0])
+                for row_offset, values in enumerate(update['values']):
+                    for col_offset, value in enumerate(values):
+                        self._set(row + row_offset, col + col_offset, value)
+        return {'totalUpdatedCells': sum(len(values) for update in data for values in update['values'])}
+    
+    def add_cols(self, cols):
+        self._call('add_cols', write=True)
+        with self._lock:
+            self._cols += cols
+        return {}
+    
+    def delete_rows(self, start_index, end_index=None):
+        self._call('delete_rows', write=True)
+        self._delete_rows(start_index, end_index or start_index)
+        return {}
+    
+    def _delete_rows(self, first_row, last_row):
+        with self._lock:
+            deleted = len(self._rows[first_row - 1:last_row])
+            del self._rows[first_row - 1:last_row]
+            self._grid_rows -= deleted
+
+class FakeSpreadsheet:
+    """Holds the fake worksheets, call counters and fault profile"""
+    
+    def __init__(self, faults=None):
+        self.faults = faults or FaultProfile()
+        self.calls = Counter()  # 'Worksheet.method' -> number of calls
+        self._worksheets = {}
+        self._updated = datetime.now(timezone.utc)
+    
+    def create_worksheet(self, title, rows, formula=None, cols=26, grid_rows=None):
+        """
+        Add a worksheet holding rows (no API call is counted; used to build fixtures)
+        Its grid ends at the last row unless grid_rows is larger
+        """
+        self._worksheets[title] = FakeWorksheet(self, title, rows, formula, cols, grid_rows)
+        return self._worksheets[title]
+    
+    def _call(self, name):
+        self.calls[f"Spreadsheet.{name}"] += 1
+        self.faults.apply(name)
+    
+    def add_worksheet(self, title, rows=1000, cols=26, index=None):
+        self._call('add_worksheet')
+        self.touch()
+        return self.create_worksheet(title, [], cols=cols, grid_rows=rows)
+    
+    def batch_update(self, body):
+        """Structural update; only deleteDimension requests on rows are supported, applied in order"""
+        self._call('batch_update')
+        sheets = {sheet.id: sheet for sheet in self._worksheets.values()}
+        ranges = [request['deleteDimension']['range'] for request in body['requests']]
+        if any(dimension['dimension'] != 'ROWS' or dimension['sheetId'] not in sheets for dimension in ranges):
+            raise APIError(_FakeResponse(400, "Unsupported batch_update request", 'INVALID_ARGUMENT'))
+        for dimension in ranges:
+            sheets[dimension['sheetId']]._delete_rows(dimension['startIndex'] + 1, dimension['endIndex'])
+        self.touch()
+        return {'replies': [{} for _ in ranges]}
+    
+    def worksheet(self, title):
+        if title not in self._worksheets:
+            raise WorksheetNotFound(title)
+        return self._worksheets[title]
+    
+    def worksheets(self, *args, **kwargs):
+        self._call('worksheets')
+        return list(self._worksheets.values())
+    
+    def touch(self):
+        self._updated = datetime.now(timezone.utc)
+    
+    def get_lastUpdateTime(self):
+        self._call('get_lastUpdateTime')
+        return self._updated.isoformat()
+    
+    def reset_calls(self):
+        self.calls.clear()
+
+class FakeClient:
+    """Stands in for the authorized gspread client"""
+    
+    def __init__(self, spreadsheet):
+        self.spreadsheet = spreadsheet
+    
+    def open_by_key(self, key):
+        return self.spreadsheet
+
+def sample_inventory(count=50):
+    """Inventory rows (without header) for count items, a few units each"""
+    rows = []
+    for idx in range(1, count + 1):
+        quantity = 1 + idx % 5
+        rows.append([f"ITEM{idx:03d}", f"Item {idx}", 'Equipment', 'Brand', f"Model {idx}",
+                     quantity, f"Shelf {1 + idx % 8}", 0, quantity])
+    return rows
+
+def _quantity_current(cells):
+    """Inventory formula: Quantity Current = Quantity - Loaned Out"""
+    columns = config.INVENTORY_COLUMNS
+    while len(cells) <= columns['QUANTITY_CURRENT']:
+        cells.append('')
+    try:
+        cells[columns['QUANTITY_CURRENT']] = str(int(cells[columns['QUANTITY']] or 0) - int(cells[columns['LOANED_OUT']] or 0))
+    except ValueError:
+        pass
+
+def build_fake_spreadsheet(inventory_rows=None, log_rows=None, faults=None):
+    """
+    Fake spreadsheet with the inventory and Rental Log tabs named in config
+    Returns: FakeSpreadsheet
+    """
+    spreadsheet = FakeSpreadsheet(faults)
+    spreadsheet.create_worksheet(
+        config.INVENTORY_SHEET_NAME,
+        [INVENTORY_HEADERS] + list(sample_inventory() if inventory_rows is None else inventory_rows),
+        formula=_quantity_current
+    )
+    spreadsheet.create_worksheet(config.LOG_SHEET_NAME, [LOG_HEADERS] + list(log_rows or []))
+    return spreadsheet
+
+def fake_sheets_manager(spreadsheet=None):
+    """SheetsManager running against an in-memory fake spreadsheet"""
+    from sheets_manager import SheetsManager
+    spreadsheet = spreadsheet or build_fake_spreadsheet(faults=FaultProfile.from_config())
+    print("🧪 Using in-memory fake Google Sheets")
+    return SheetsManager(client=FakeClient(spreadsheet))
@@ -0,0 +1,164 @@
+"""
+Message Fan-Out
+Sends one message to many chats within Telegram's flood limits
+"""
+import asyncio
+import time
+from telegram.error import Forbidden, BadRequest, RetryAfter, TimedOut, NetworkError
+import config
+from perf_stats import perf_stats
+
+def _seconds(value):
+    """RetryAfter.retry_after may be an int or a timedelta depending on the PTB version"""
+    return value.total_seconds() if hasattr(value, 'total_seconds') else float(value)
+
+class TokenBucket:
+    """Async token bucket: `rate` tokens per second, bursts of up to `capacity`"""
+    
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0
+        self._lock = asyncio.Lock()
+    
+    def pause(self, seconds):
+        """Stop handing out tokens for a while (Telegram asked us to back off)"""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+    
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+class FanOutResult:
+    """Summary of a fan-out run"""
+    
+    def __init__(self, total):
+        self.total = total
+        self.sent = 0
+        self.failed = 0
+        self.blocked = 0  # user blocked the bot or never started it
+        self.retries = 0
+        self.started = time.monotonic()
+        self.elapsed = 0.0
+    
+    @property
+    def done(self):
+        return self.sent + self.failed + self.blocked
+    
+    def summary(self):
+        return (f"✅ Sent: {self.sent}/{self.total}\n"
+                f"🚫 Blocked/unreachable: {self.blocked}\n"
+                f"❌ Failed: {self.failed}\n"
+                f"🔁 Retries: {self.retries}\n"
+                f"⏱️ Took {self.elapsed:.1f}s")
+
+class FanOut:
+    """
+    Rate-limited, bounded-concurrency sender shared by reminders, overdue
+    notifications and admin broadcasts.
+    
+    A global token bucket keeps the bot under Telegram's messages-per-second
+    limit, each chat gets at most one message per FANOUT_PER_CHAT_INTERVAL,
+    RetryAfter pauses every sender for the time Telegram asks, and transient
+    network errors are retried with backoff.
+    """
+    
+    def __init__(self, bot, rate=None, concurrency=None, per_chat_interval=None, max_retries=None):
+        self.bot = bot
+        self.bucket = TokenBucket(rate or config.FANOUT_RATE_PER_SECOND)
+        self.concurrency = concurrency or config.FANOUT_CONCURRENCY
+        self.per_chat_interval = per_chat_interval if per_chat_interval is not None else config.FANOUT_PER_CHAT_INTERVAL
+        self.max_retries = max_retries if max_retries is not None else config.FANOUT_MAX_RETRIES
+        self._chat_next_send = {}  # chat ID -> earliest time of its next message (pruned after each send)
+    
+    async def _wait_for_chat(self, chat_id):
+        now = time.monotonic()
+        next_send = self._chat_next_send.get(chat_id, 0)
+        self._chat_next_send[chat_id] = max(now, next_send) + self.per_chat_interval
+        if next_send > now:
+            await asyncio.sleep(next_send - now)
+    
+    def _forget_idle_chats(self):
+        """Drop chats whose per-chat wait is over, so the map only holds chats messaged moments ago"""
+        now = time.monotonic()
+        self._chat_next_send = {
+            chat_id: next_send for chat_id, next_send in self._chat_next_send.items() if next_send > now
+        }
+    
+    async def _send_one(self, message, result):
+        chat_id, text, kwargs = message
+        for attempt in range(self.max_retries + 1):
+            await self._wait_for_chat(chat_id)
+            await self.bucket.acquire()
+            try:
+                await self.bot.send_message(chat_id=chat_id, text=text, **kwargs)
+                result.sent += 1
+                return True
+            except RetryAfter as e:
+                self.bucket.pause(_seconds(e.retry_after))
+            except Forbidden as e:
+                print(f"Cannot message chat {chat_id}: {e}")
+                result.blocked += 1
+                return False
+            except BadRequest as e:
+                # The message itself was rejected (e.g. bad Markdown); resending won't help
+                print(f"Telegram rejected message to chat {chat_id}: {e}")
+                break
+            except (TimedOut, NetworkError) as e:
+                print(f"Network error messaging chat {chat_id}: {e}")
+                await asyncio.sleep(min(30, 2 ** attempt))
+            except Exception as e:
+                print(f"Failed to message chat {chat_id}: {e}")
+                break
+            if attempt < self.max_retries:
+                result.retries += 1
+        result.failed += 1
+        return False
+    
+    async def send(self, messages, progress=None, progress_interval=2.0, kind='message'):
+        """
+        Send messages, a list of (chat_id, text, send_message kwargs)
+        progress(result) is awaited at most every progress_interval seconds
+        kind labels the delivery counts in perf_stats (reminder, overdue, broadcast)
+        Returns: FanOutResult
+        """
+        result = FanOutResult(len(messages))
+        semaphore = asyncio.Semaphore(self.concurrency)
+        last_progress = [time.monotonic()]
+        
+        async def send_limited(message):
+            async with semaphore:
+                await self._send_one(message, result)
+            if progress and time.monotonic() - last_progress[0] >= progress_interval:
+                last_progress[0] = time.monotonic()
+                try:
+                    await progress(result)
+                except Exception as e:
+                    print(f"Error reporting fan-out progress: {e}")
+        
+        await asyncio.gather(*(send_limited(message) for message in messages))
+        self._forget_idle_chats()
+        result.elapsed = time.monotonic() - result.started
+        perf_stats.record_fanout(kind, result)
+        return result
+
+_shared_fanout = None
+
+def get_fanout(bot):
+    """Process-wide FanOut so every sender shares one rate limit"""
+    global _shared_fanout
+    if _shared_fanout is None or _shared_fanout.bot is not bot:
+        _shared_fanout = FanOut(bot)
+    return _shared_fanout
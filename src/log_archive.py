@@ -0,0 +1,108 @@
+"""
+Rental Log Archive
+Which RETURNED rows leave the hot Rental Log tab, the archive tab each one moves to,
+and the gate that keeps row-numbered writes out of the way while rows move
+"""
+import bisect
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+import config
+from sheet_schema import LOG_SCHEMA
+
+_archive_fields = LOG_SCHEMA.getter('STATUS', 'ACTUAL_RETURN')
+
+def archive_title(returned_at, period=None):
+    """Archive tab for a return time: '<prefix> YYYY-MM', or '<prefix> YYYY' by year"""
+    period = period or config.ARCHIVE_PERIOD
+    suffix = returned_at.strftime('%Y' if period == 'year' else '%Y-%m')
+    return f"{config.ARCHIVE_SHEET_PREFIX} {suffix}"
+
+def is_archive_title(title):
+    return title.startswith(f"{config.ARCHIVE_SHEET_PREFIX} ")
+
+def plan_archive(rows, cutoff, period=None):
+    """
+    Pick the Rental Log rows to archive: RETURNED before cutoff (a datetime)
+    rows[i] is sheet row i + 2
+    Returns: {archive title: [(row number, row)]}, rows in sheet order
+    """
+    plan = {}
+    for row_number, row in enumerate(rows, start=2):
+        status, actual_return = _archive_fields(row)
+        if str(status).strip().upper() != 'RETURNED':
+            continue
+        try:
+            returned_at = datetime.strptime(str(actual_return).strip(), '%Y-%m-%d %H:%M:%S')
+        except ValueError:
+            continue  # leave rows with unreadable dates for someone to look at
+        if returned_at < cutoff:
+            plan.setdefault(archive_title(returned_at, period), []).append((row_number, row))
+    return plan
+
+def row_runs(row_numbers):
+    """
+    Contiguous runs of row numbers as (first, last), bottom-most first,
+    so deleting them in order leaves the runs above where they were
+    """
+    runs = []
+    for row_number in sorted(row_numbers, reverse=True):
+        if runs and runs[-1][0] == row_number + 1:
+            runs[-1] = (row_number, runs[-1][1])
+        else:
+            runs.append((row_number, row_number))
+    return runs
+
+def renumber(row_numbers):
+    """
+    Where the rows left behind end up once row_numbers are deleted
+    Returns: function(old row number) -> new row number, or None for a deleted row
+    """
+    deleted = sorted(row_numbers)
+    deleted_set = set(deleted)
+    
+    def new_row(old_row):
+        if old_row in deleted_set:
+            return None
+        return old_row - bisect.bisect_left(deleted, old_row)
+    return new_row
+
+class WriteGate:
+    """
+    Rental Log writes that address rows by number run side by side under
+    write(); an archive run takes exclusive() and waits for them to finish,
+    and new writes wait until the rows have been renumbered.
+    """
+    
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._writers = 0
+        self._exclusive = False
+    
+    @contextmanager
+    def write(self):
+        with self._cond:
+            while self._exclusive:
+                self._cond.wait()
+            self._writers += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._writers -= 1
+                self._cond.notify_all()
+    
+    @contextmanager
+    def exclusive(self):
+        with self._cond:
+            while self._exclusive:
+                self._cond.wait()
+            self._exclusive = True
+            while self._writers:
+                self._cond.wait()
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._exclusive = False
+                self._cond.notify_all()
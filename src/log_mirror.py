@@ -0,0 +1,391 @@
+"""
+Rental Log Mirror
+In-memory copy of the Rental Log sheet with an index of ACTIVE rentals and running statistics
+"""
+import threading
+import zlib
+from collections import Counter
+from datetime import datetime
+import config
+from due_index import DueDateIndex
+from rental_record import RentalRecord
+from sheet_schema import LOG_SCHEMA
+
+# The cells RentalStats reads from each row, compiled once
+_stats_fields = LOG_SCHEMA.getter('STATUS', 'USER_ID', 'ITEM_ID', 'EXPECTED_RETURN', 'ACTUAL_RETURN')
+_rental_id_field = LOG_SCHEMA.getter('RENTAL_ID')
+
+def log_cell(row, column):
+    """Read a Rental Log cell by LOG_COLUMNS key, returning '' for short rows"""
+    idx = config.LOG_COLUMNS[column]
+    return row[idx] if len(row) > idx else ''
+
+def rows_checksum(rows):
+    """Checksum of a list of sheet rows (trailing empty cells ignored)"""
+    crc = 0
+    for row in rows:
+        values = list(row)
+        while values and values[-1] == '':
+            values.pop()
+        crc = zlib.crc32('\x1f'.join(values).encode('utf-8') + b'\x1e', crc)
+    return crc
+
+def _timeliness(expected_return, actual_return):
+    """'on_time' or 'late' for a RETURNED row, None if its dates cannot be read"""
+    try:
+        expected = datetime.strptime(str(expected_return), '%Y-%m-%d')
+        actual = datetime.strptime(str(actual_return), '%Y-%m-%d %H:%M:%S')
+    except ValueError:
+        return None
+    return 'on_time' if actual.date() <= expected.date() else 'late'
+
+def _contribution(row):
+    """What one Rental Log row adds to the totals: (status, user ID, item ID, timeliness), or None if blank"""
+    if not any(str(value).strip() for value in row):
+        return None
+    status, user_id, item_id, expected_return, actual_return = _stats_fields(row)
+    status = str(status).strip().upper()
+    return (
+        status,
+        str(user_id).strip(),
+        str(item_id).strip(),
+        _timeliness(expected_return, actual_return) if status == 'RETURNED' else None
+    )
+
+class RentalStats:
+    """
+    Totals, status counts, unique users, per-item rental counts and on-time
+    versus late returns over a set of Rental Log rows.
+    
+    Each row's contribution is remembered under a key (its row number), so a
+    row that is re-counted after an edit first takes its old contribution back
+    out. Updating is O(1) per row and reading the totals does not depend on the
+    size of the log. Callers serialize access (RentalLogMirror and SqliteStore
+    hold their own locks).
+    """
+    
+    def __init__(self):
+        self.clear()
+    
+    def clear(self):
+        self._rows = {}  # key -> contribution
+        self.total = 0
+        self.by_status = Counter()
+        self.users = Counter()  # User ID -> rentals
+        self.items = Counter()  # Item ID -> rentals
+        self.returns = Counter()  # 'on_time' / 'late' -> returns
+    
+    def update(self, key, row):
+        """Count a row (a Rental Log row as a list of cells), replacing what it counted before"""
+        self.remove(key)
+        contribution = _contribution(row)
+        if contribution is None:
+            return
+        self._rows[key] = contribution
+        self._apply(contribution, 1)
+    
+    def remove(self, key):
+        """Stop counting a row"""
+        contribution = self._rows.pop(key, None)
+        if contribution is not None:
+            self._apply(contribution, -1)
+    
+    def _apply(self, contribution, sign):
+        status, user_id, item_id, timeliness = contribution
+        self.total += sign
+        self.by_status[status] += sign
+        if user_id:
+            self.users[user_id] += sign
+            if not self.users[user_id]:
+                del self.users[user_id]
+        if item_id:
+            self.items[item_id] += sign
+            if not self.items[item_id]:
+                del self.items[item_id]
+        if timeliness:
+            self.returns[timeliness] += sign
+    
+    def combined(self, other):
+        """New RentalStats holding the totals of both (for reading only: rows are not carried over)"""
+        result = RentalStats()
+        result.total = self.total + other.total
+        result.by_status = self.by_status + other.by_status
+        result.users = self.users + other.users
+        result.items = self.items + other.items
+        result.returns = self.returns + other.returns
+        return result
+    
+    def snapshot(self, top=5):
+        """
+        Current totals
+        Returns: dict with total, active, completed, unique_users, top_items
+        ([(item_id, rentals)], most rented first), on_time, late and on_time_rate (percent)
+        """
+        on_time = self.returns['on_time']
+        late = self.returns['late']
+        return {
+            'total': self.total,
+            'active': self.by_status['ACTIVE'],
+            'completed': self.by_status['RETURNED'],
+            'unique_users': len(self.users),
+            'top_items': self.items.most_common(top),
+            'on_time': on_time,
+            'late': late,
+            'on_time_rate': on_time / (on_time + late) * 100 if on_time + late else 0.0
+        }
+
+class RentalLogMirror:
+    """
+    Holds every Rental Log row ingested so far, remembers the last sheet row
+    it has seen, and keeps an index from User ID to ACTIVE rentals.
+    
+    The mirror does no I/O. SheetsManager feeds it full reads, tail reads and
+    the bot's own writes. write_seq changes on every local write so a sheet
+    read that overlapped a write can be detected and discarded.
+    
+    Rentals still waiting in the write journal are kept apart as "pending",
+    keyed by a negative row number (-journal seq), and are listed after the
+    rentals already on the sheet.
+    
+    stats holds running RentalStats over every row, pending rentals included,
+    updated as rows are ingested. due indexes every ACTIVE rental (pending
+    ones too) by Expected Return Date.
+    
+    Every row with a Rental ID is also mapped from that ID to its current row
+    number (pending rentals to -seq), so a return finds its row without a
+    read or a scan, wherever the row has moved to since it was listed.
+    """
+    
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.rows = []  # rows[i] is sheet row i + 2 (row 1 is the header)
+        self.loaded = False
+        self.write_seq = 0
+        self._active_by_user = {}  # User ID -> {row number: RentalRecord}
+        self._active_rows = {}  # row number -> User ID
+        self._pending = {}  # journal seq -> RentalRecord not yet on the sheet
+        self._pending_rows = {}  # journal seq -> its Rental Log row
+        self._row_by_id = {}  # Rental ID -> row number (-seq while pending)
+        self._id_by_row = {}  # row number -> Rental ID
+        self.stats = RentalStats()
+        self.due = DueDateIndex()
+    
+    @property
+    def last_row(self):
+        """Last sheet row number ingested (1 when only the header is known)"""
+        return len(self.rows) + 1
+    
+    def checksum(self):
+        with self.lock:
+            return rows_checksum(self.rows)
+    
+    def load(self, all_values):
+        """Replace the mirror with a full read of the sheet (header included)"""
+        with self.lock:
+            self.rows = []
+            self._active_by_user = {}
+            self._active_rows = {}
+            self._row_by_id = {}
+            self._id_by_row = {}
+            self.stats.clear()
+            self.due.clear()
+            for seq, row in self._pending_rows.items():
+                self.stats.update(-seq, row)
+                rental = self._pending[seq]
+                self.due.add(-seq, rental.user_id, rental.due_ordinal)
+                if rental.rental_id:
+                    self._row_by_id[rental.rental_id] = -seq
+            for row_number, row in enumerate(all_values[1:], start=2):
+                self.rows.append(list(row))
+                self._ingest(row_number, self.rows[-1])
+            self.loaded = True
+    
+    def extend(self, first_row, rows):
+        """Ingest rows read from the sheet starting at first_row, skipping known rows"""
+        with self.lock:
+            for row_number, row in enumerate(rows, start=first_row):
+                if row_number <= self.last_row:
+                    continue
+                while self.last_row < row_number - 1:
+                    self.rows.append([])  # blank row skipped by the read
+                self.rows.append(list(row))
+                self._ingest(row_number, self.rows[-1])
+    
+    def record_append(self, row_number, row):
+        """Apply a row the bot appended at row_number"""
+        with self.lock:
+            self.write_seq += 1
+            values = [str(value) for value in row]
+            if row_number == self.last_row + 1:
+                self.rows.append(values)
+            self._ingest(row_number, values)
+    
+    def record_update(self, row_number, changes):
+        """Apply cell changes ({LOG_COLUMNS key: value}) the bot wrote to row_number"""
+        with self.lock:
+            self.write_seq += 1
+            if row_number > self.last_row:
+                self._unindex(row_number)
+                return
+            row = self.rows[row_number - 2]
+            for column, value in changes.items():
+                idx = config.LOG_COLUMNS[column]
+                while len(row) <= idx:
+                    row.append('')
+                row[idx] = str(value)
+            self._ingest(row_number, row)
+    
+    def add_pending(self, seq, row):
+        """Show a journaled rental as ACTIVE before it reaches the sheet"""
+        with self.lock:
+            rental = self._pending[seq] = RentalRecord.from_row(row, -seq)
+            self._pending_rows[seq] = row
+            self.stats.update(-seq, row)
+            self.due.add(-seq, rental.user_id, rental.due_ordinal)
+            if rental.rental_id:
+                self._row_by_id[rental.rental_id] = -seq
+    
+    def drop_pending(self, seq):
+        """Forget a pending rental (returned or appended to the sheet)"""
+        with self.lock:
+            rental = self._pending.pop(seq, None)
+            self._pending_rows.pop(seq, None)
+            self.stats.remove(-seq)
+            self.due.remove(-seq)
+            if rental and self._row_by_id.get(rental.rental_id) == -seq:
+                del self._row_by_id[rental.rental_id]
+    
+    def _ingest(self, row_number, row):
+        """Count a row in the stats, map its Rental ID, and index or un-index it based on its Status"""
+        self.stats.update(row_number, row)
+        self._map_id(row_number, str(_rental_id_field(row)).strip())
+        self._unindex(row_number)
+        if str(log_cell(row, 'STATUS')).upper() != 'ACTIVE':
+            return
+        try:
+            rental = RentalRecord.from_row(row, row_number)
+        except ValueError:
+            return
+        user_key = rental.user_id
+        self._active_by_user.setdefault(user_key, {})[row_number] = rental
+        self._active_rows[row_number] = user_key
+        self.due.add(row_number, user_key, rental.due_ordinal)
+    
+    def _map_id(self, row_number, rental_id):
+        old_id = self._id_by_row.get(row_number)
+        if old_id == rental_id:
+            return
+        if old_id and self._row_by_id.get(old_id) == row_number:
+            del self._row_by_id[old_id]
+        if rental_id:
+            self._row_by_id[rental_id] = row_number
+            self._id_by_row[row_number] = rental_id
+        else:
+            self._id_by_row.pop(row_number, None)
+    
+    def _unindex(self, row_number):
+        self.due.remove(row_number)
+        user_key = self._active_rows.pop(row_number, None)
+        if user_key is None:
+            return
+        user_rentals = self._active_by_user.get(user_key, {})
+        user_rentals.pop(row_number, None)
+        if not user_rentals:
+            self._active_by_user.pop(user_key, None)
+    
+    def rebuild_stats(self):
+        """Recount the stats from every row held (normally they are kept up to date row by row)"""
+        with self.lock:
+            self.stats.clear()
+            for row_number, row in enumerate(self.rows, start=2):
+                self.stats.update(row_number, row)
+            for seq, row in self._pending_rows.items():
+                self.stats.update(-seq, row)
+    
+    def stats_snapshot(self, archived=None):
+        """Current RentalStats totals (see RentalStats.snapshot), plus an archive's RentalStats if given"""
+        with self.lock:
+            stats = self.stats.combined(archived) if archived is not None else self.stats
+            return stats.snapshot()
+    
+    def user_ids(self):
+        """Every numeric User ID that appears in the log"""
+        with self.lock:
+            return {
+                int(user_id)
+                for user_id in (str(log_cell(row, 'USER_ID')).strip() for row in self.rows)
+                if user_id.isdigit()
+            }
+    
+    def _active(self, row_number):
+        if row_number < 0:
+            return self._pending.get(-row_number)
+        user_key = self._active_rows.get(row_number)
+        return self._active_by_user.get(user_key, {}).get(row_number)
+    
+    def row_of(self, rental_id):
+        """Row number last seen holding this Rental ID, whatever its Status (negative while pending), or None"""
+        with self.lock:
+            return self._row_by_id.get(str(rental_id).strip())
+    
+    def locate(self, rental_id):
+        """Row number of the ACTIVE rental with this Rental ID (negative while pending), or None"""
+        with self.lock:
+            row_number = self._row_by_id.get(str(rental_id).strip())
+            if row_number is None or self._active(row_number) is None:
+                return None
+            return row_number
+    
+    def active_rental(self, row_number):
+        """Copy of the ACTIVE rental at row_number (negative for pending), or None"""
+        with self.lock:
+            rental = self._active(row_number)
+            return rental.copy() if rental else None
+    
+    def overdue_rentals(self, today=None):
+        """
+        Copies of the ACTIVE rentals due before today (config.TIMEZONE), most
+        overdue first, each with days_overdue set
+        """
+        with self.lock:
+            self.due.roll_over(today)
+            rentals = []
+            for due, row_number in self.due.overdue():
+                rental = self._active(row_number).copy()
+                rental.days_overdue = self.due.today - due
+                rentals.append(rental)
+            return rentals
+    
+    def rentals_due_on(self, day):
+        """Copies of the ACTIVE rentals due on a given day"""
+        with self.lock:
+            return [self._active(row_number).copy() for row_number in self.due.due_on(day)]
+    
+    def overdue_rental_for_user(self, user_id, today=None):
+        """Copy of the user's most overdue ACTIVE rental, or None (constant time per check)"""
+        with self.lock:
+            self.due.roll_over(today)
+            row_number = self.due.overdue_for_user(str(user_id).strip())
+            return self._active(row_number).copy() if row_number is not None else None
+    
+    def active_rentals_for_user(self, user_id):
+        """Copies of a user's ACTIVE rentals, in sheet order"""
+        with self.lock:
+            user_key = str(user_id).strip()
+            user_rentals = self._active_by_user.get(user_key, {})
+            return [rental.copy() for _, rental in sorted(user_rentals.items())] + [
+                rental.copy() for _, rental in sorted(self._pending.items())
+                if rental.user_id == user_key
+            ]
+    
+    def active_rentals(self):
+        """Copies of every ACTIVE rental, in sheet order"""
+        with self.lock:
+            rentals = [
+                rental.copy()
+                for user_rentals in self._active_by_user.values()
+                for rental in user_rentals.values()
+            ]
+            pending = [rental.copy() for _, rental in sorted(self._pending.items())]
+        rentals.sort(key=lambda rental: rental.row_number)
+        return rentals + pending
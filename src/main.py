@@ -4,13 +4,18 @@ Combines bot functionality with reminder scheduler and all features
 """
 import sys
 import os
+import asyncio
 
 # Add src directory to path for imports
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
 from telegram.ext import Application, CommandHandler, MessageHandler, filters, ConversationHandler, CallbackQueryHandler
-from telegram import Update
 from reminder_scheduler import ReminderScheduler
+from async_sheets import get_async_sheets
+from perf_stats import instrument_handlers
+from sheets_scheduler import prioritize_handlers
+from metrics_server import MetricsServer
+from webhook_server import allowed_update_types, serve_webhook
 import config
 
 # Import from bot
@@ -32,18 +37,48 @@ from list_command import send_equipment_list, view_sheet_callback
 # Import admin commands
 from admin_commands import (
     admin_panel, view_all_rentals, view_overdue_items, view_statistics,
-    admin_back, admin_close, notify_overdue_users
+    admin_back, admin_close, notify_overdue_users,
+    admin_broadcast_start, admin_broadcast_send, WAITING_FOR_BROADCAST_MESSAGE,
+    view_performance
 )
 
-def main():
-    """Start the bot"""
-    print("=" * 50)
-    print("🙏 Church Tech Ministry Equipment Rental Bot")
-    print("   Version 2.1.0")
-    print("=" * 50)
-    
-    # Create the Application
-    application = Application.builder().token(config.TELEGRAM_BOT_TOKEN).build()
+async def on_startup(application: Application):
+    """Connect to Google Sheets in the background and start the metrics endpoint once the bot has started"""
+    sheets = get_async_sheets()
+    application.create_task(sheets.warm_up())
+    if config.METRICS_PORT:
+        metrics = MetricsServer()
+        try:
+            await metrics.start()
+            application.bot_data['metrics_server'] = metrics
+        except OSError as e:
+            print(f"⚠️  Could not start metrics endpoint on port {config.METRICS_PORT}: {e}")
+
+async def on_shutdown(application: Application):
+    """Stop the metrics endpoint"""
+    metrics = application.bot_data.pop('metrics_server', None)
+    if metrics:
+        await metrics.stop()
+
+def build_application(token=None, request=None, get_updates_request=None):
+    """
+    Build the Application with every handler and the reminder job registered
+    request/get_updates_request replace the HTTP layer used to reach Telegram
+    (the benchmarks pass a fake one)
+    Returns: (application, scheduler)
+    """
+    builder = (
+        Application.builder()
+        .token(token or config.TELEGRAM_BOT_TOKEN)
+        .concurrent_updates(config.CONCURRENT_UPDATES)
+        .post_init(on_startup)
+        .post_shutdown(on_shutdown)
+    )
+    if request is not None:
+        builder = builder.request(request)
+    if get_updates_request is not None:
+        builder = builder.get_updates_request(get_updates_request)
+    application = builder.build()
     
     # Verification conversation handler for /start
     verification_conv_handler = ConversationHandler(
@@ -134,15 +169,45 @@ def main():
     # Admin callback handlers
     application.add_handler(CallbackQueryHandler(view_all_rentals, pattern='^admin_all_rentals$'))
     application.add_handler(CallbackQueryHandler(view_overdue_items, pattern='^admin_overdue$'))
-    application.add_handler(CallbackQueryHandler(view_statistics, pattern='^admin_stats$'))
+    application.add_handler(CallbackQueryHandler(view_statistics, pattern='^admin_stats(_rebuild)?$'))
     application.add_handler(CallbackQueryHandler(admin_back, pattern='^admin_back$'))
     application.add_handler(CallbackQueryHandler(admin_close, pattern='^admin_close$'))
     application.add_handler(CallbackQueryHandler(notify_overdue_users, pattern='^admin_notify_overdue$'))
     
+    # Admin broadcast conversation
+    broadcast_conv_handler = ConversationHandler(
+        entry_points=[CallbackQueryHandler(admin_broadcast_start, pattern='^admin_broadcast$')],
+        states={
+            WAITING_FOR_BROADCAST_MESSAGE: [
+                MessageHandler(filters.TEXT & ~filters.COMMAND, admin_broadcast_send),
+            ],
+        },
+        fallbacks=[CommandHandler('cancel', cancel)],
+        allow_reentry=True,
+    )
+    application.add_handler(broadcast_conv_handler)
+    application.add_handler(CallbackQueryHandler(view_performance, pattern='^admin_perf$'))
+    
+    # Time every handler and charge the Sheets calls it makes to it (admin ⚙️ Performance),
+    # and give those calls the handler's quota priority (users first, then admins)
+    instrument_handlers(application)
+    prioritize_handlers(application)
+    
     # Initialize and start reminder scheduler
-    scheduler = ReminderScheduler(config.TELEGRAM_BOT_TOKEN)
+    scheduler = ReminderScheduler(application)
     scheduler.start()
     
+    return application, scheduler
+
+def main():
+    """Start the bot"""
+    print("=" * 50)
+    print("🙏 Church Tech Ministry Equipment Rental Bot")
+    print("   Version 2.1.0")
+    print("=" * 50)
+    
+    application, scheduler = build_application()
+    
     # Print admin info if configured
     if config.ADMIN_USER_IDS:
         print(f"✅ Admin users configured: {len(config.ADMIN_USER_IDS)}")
@@ -165,8 +230,13 @@ def main():
     print("Press Ctrl+C to stop")
     print("=" * 50)
     
+    # Ask Telegram only for the update types the handlers above can use
+    allowed_updates = allowed_update_types(application)
     try:
-        application.run_polling(allowed_updates=Update.ALL_TYPES)
+        if config.UPDATE_MODE == 'webhook':
+            asyncio.run(serve_webhook(application, allowed_updates))
+        else:
+            application.run_polling(allowed_updates=allowed_updates)
     except KeyboardInterrupt:
         print("\n⏹️ Stopping bot...")
         scheduler.stop()
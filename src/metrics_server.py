@@ -0,0 +1,203 @@
+"""
+Metrics Server
+Optional Prometheus text-format endpoint served from the bot's own asyncio loop
+"""
+import asyncio
+import bisect
+import time
+import config
+from perf_stats import perf_stats, LATENCY_BUCKETS
+from sheets_retry import get_circuit_breaker
+
+PREFIX = 'rental_bot'
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _labels(**labels):
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + '}'
+
+def _histogram(lines, name, labels, buckets, count, total):
+    cumulative = 0
+    for bound, bucket_count in zip(LATENCY_BUCKETS, buckets):
+        cumulative += bucket_count
+        lines.append(f"{name}_bucket{_labels(**labels, le=bound)} {cumulative}")
+    lines.append(f"{name}_bucket{_labels(**labels, le='+Inf')} {count}")
+    lines.append(f"{name}_count{_labels(**labels)} {count}")
+    lines.append(f"{name}_sum{_labels(**labels)} {total:.6f}")
+
+class EventLoopLagMonitor:
+    """Measures how late a periodic sleep wakes up, i.e. how long the loop was blocked"""
+    
+    def __init__(self, interval=0.5):
+        self.interval = interval
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self._task = None
+    
+    def start(self):
+        self._task = asyncio.get_running_loop().create_task(self._run())
+    
+    def stop(self):
+        if self._task:
+            self._task.cancel()
+    
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - expected)
+            self.last_lag = lag
+            self.max_lag = max(self.max_lag, lag)
+            self.count += 1
+            self.total += lag
+            self.buckets[bisect.bisect_left(LATENCY_BUCKETS, lag)] += 1
+
+class MetricsServer:
+    """
+    Minimal HTTP server answering GET /metrics in the Prometheus text format.
+    It runs on the bot's event loop; rendering only reads perf_stats
+    counters, so a scrape costs well under a millisecond of loop time.
+    """
+    
+    def __init__(self, host=None, port=None):
+        self.host = host or config.METRICS_HOST
+        self.port = port if port is not None else config.METRICS_PORT
+        self.lag = EventLoopLagMonitor()
+        self._server = None
+    
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.lag.start()
+        print(f"📈 Metrics available at http://{self.host}:{self.port}/metrics")
+    
+    async def stop(self):
+        self.lag.stop()
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+    
+    async def _handle(self, reader, writer):
+        try:
+            request_line = await asyncio.wait_for(reader.readline(), timeout=5)
+            # Drain the headers; the request body (if any) is ignored
+            while (await asyncio.wait_for(reader.readline(), timeout=5)) not in (b'\r\n', b'\n', b''):
+                pass
+            parts = request_line.decode('latin-1').split()
+            if len(parts) >= 2 and parts[0] == 'GET' and parts[1].split('?')[0] == '/metrics':
+                status, body = '200 OK', self.render().encode('utf-8')
+            else:
+                status, body = '404 Not Found', b'Not found\n'
+            writer.write(
+                f"HTTP/1.1 {status}\r\n"
+                f"Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                f"Connection: close\r\n\r\n".encode('latin-1') + body
+            )
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+    
+    def render(self):
+        """Current metrics in the Prometheus text exposition format"""
+        stats = perf_stats.snapshot()
+        lines = []
+        
+        name = f"{PREFIX}_update_duration_seconds"
+        lines.append(f"# HELP {name} Time spent processing a Telegram update, per handler")
+        lines.append(f"# TYPE {name} histogram")
+        for handler, handler_stats in sorted(stats['handlers'].items()):
+            if handler_stats.updates:
+                _histogram(lines, name, {'handler': handler}, handler_stats.buckets,
+                           handler_stats.updates, handler_stats.update_time)
+        
+        name = f"{PREFIX}_update_errors_total"
+        lines.append(f"# HELP {name} Updates whose handler raised, per handler")
+        lines.append(f"# TYPE {name} counter")
+        for handler, handler_stats in sorted(stats['handlers'].items()):
+            if handler_stats.updates:
+                lines.append(f"{name}{_labels(handler=handler)} {handler_stats.errors}")
+        
+        name = f"{PREFIX}_handler_sheets_requests_total"
+        lines.append(f"# HELP {name} Google Sheets API calls made on behalf of each handler")
+        lines.append(f"# TYPE {name} counter")
+        for handler, handler_stats in sorted(stats['handlers'].items()):
+            lines.append(f"{name}{_labels(handler=handler)} {handler_stats.sheets_calls}")
+        
+        name = f"{PREFIX}_sheets_request_duration_seconds"
+        lines.append(f"# HELP {name} Google Sheets API call latency, per call")
+        lines.append(f"# TYPE {name} histogram")
+        for call, call_stats in sorted(stats['api_calls'].items()):
+            _histogram(lines, name, {'call': call}, call_stats.buckets, call_stats.count, call_stats.total_time)
+        
+        for suffix, attr, help_text in (
+            ('errors_total', 'errors', 'Google Sheets API calls that failed'),
+            ('rate_limited_total', 'rate_limited', 'Google Sheets API calls rejected with 429 (quota)'),
+        ):
+            name = f"{PREFIX}_sheets_requests_{suffix}"
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} counter")
+            for call, call_stats in sorted(stats['api_calls'].items()):
+                lines.append(f"{name}{_labels(call=call)} {getattr(call_stats, attr)}")
+        
+        name = f"{PREFIX}_sheets_retries_total"
+        lines.append(f"# HELP {name} Google Sheets calls retried after a failure, by failure class")
+        lines.append(f"# TYPE {name} counter")
+        for error_class, count in sorted(stats['retries'].items()):
+            lines.append(f"{name}{_labels(reason=error_class)} {count}")
+        
+        name = f"{PREFIX}_sheets_circuit_open"
+        lines.append(f"# HELP {name} 1 while the Google Sheets circuit breaker is open or half-open")
+        lines.append(f"# TYPE {name} gauge")
+        lines.append(f"{name} {0 if get_circuit_breaker().state == 'closed' else 1}")
+        
+        name = f"{PREFIX}_sheets_requests_last_minute"
+        lines.append(f"# HELP {name} Google Sheets API calls in the last 60 seconds (quota window)")
+        lines.append(f"# TYPE {name} gauge")
+        lines.append(f"{name} {perf_stats.api_calls_last_minute()}")
+        
+        name = f"{PREFIX}_sheets_quota_wait_seconds"
+        lines.append(f"# HELP {name} Time Sheets requests waited for quota, per priority class")
+        lines.append(f"# TYPE {name} histogram")
+        for priority, wait_stats in sorted(stats['quota_waits'].items()):
+            _histogram(lines, name, {'priority': priority}, wait_stats.buckets, wait_stats.count, wait_stats.total_time)
+        
+        name = f"{PREFIX}_storage_call_duration_seconds"
+        lines.append(f"# HELP {name} Storage backend method latency")
+        lines.append(f"# TYPE {name} histogram")
+        for method, call_stats in sorted(stats['methods'].items()):
+            _histogram(lines, name, {'method': method}, call_stats.buckets, call_stats.count, call_stats.total_time)
+        
+        name = f"{PREFIX}_cache_lookups_total"
+        lines.append(f"# HELP {name} In-memory cache lookups by result")
+        lines.append(f"# TYPE {name} counter")
+        for (cache, result), count in sorted(stats['cache'].items()):
+            lines.append(f"{name}{_labels(cache=cache, result=result)} {count}")
+        
+        name = f"{PREFIX}_messages_total"
+        lines.append(f"# HELP {name} Fan-out deliveries (reminders, overdue notices, broadcasts) by outcome")
+        lines.append(f"# TYPE {name} counter")
+        for (kind, outcome), count in sorted(stats['deliveries'].items()):
+            lines.append(f"{name}{_labels(kind=kind, outcome=outcome)} {count}")
+        
+        name = f"{PREFIX}_event_loop_lag_seconds"
+        lines.append(f"# HELP {name} How late the event loop woke a periodic timer")
+        lines.append(f"# TYPE {name} histogram")
+        _histogram(lines, name, {}, self.lag.buckets, self.lag.count, self.lag.total)
+        lines.append(f"# HELP {PREFIX}_event_loop_lag_max_seconds Worst event loop lag seen")
+        lines.append(f"# TYPE {PREFIX}_event_loop_lag_max_seconds gauge")
+        lines.append(f"{PREFIX}_event_loop_lag_max_seconds {self.lag.max_lag:.6f}")
+        
+        lines.append(f"# HELP {PREFIX}_start_time_seconds When the stats were last reset")
+        lines.append(f"# TYPE {PREFIX}_start_time_seconds gauge")
+        lines.append(f"{PREFIX}_start_time_seconds {perf_stats.started:.0f}")
+        lines.append(f"# HELP {PREFIX}_scrape_timestamp_seconds Time of this scrape")
+        lines.append(f"# TYPE {PREFIX}_scrape_timestamp_seconds gauge")
+        lines.append(f"{PREFIX}_scrape_timestamp_seconds {time.time():.0f}")
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,311 @@
+"""
+Performance Stats
+Timing and call counts for storage methods, Google Sheets API calls and Telegram handlers
+"""
+import bisect
+import contextvars
+import functools
+import threading
+import time
+from collections import Counter, deque
+
+# Name of the Telegram handler whose update is being processed ('background' otherwise).
+# AsyncSheetsManager copies the context into its worker threads, so Sheets calls made on
+# behalf of an update are charged to its handler.
+current_handler = contextvars.ContextVar('current_handler', default='background')
+
+# Upper bounds (seconds) of the latency histograms exported by metrics_server
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+def _bucket_index(elapsed):
+    """Histogram bucket for a latency (len(LATENCY_BUCKETS) means +Inf)"""
+    return bisect.bisect_left(LATENCY_BUCKETS, elapsed)
+
+def percentile(samples, pct):
+    """Nearest-rank percentile of a list of numbers"""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    rank = max(1, int(round(pct / 100 * len(ordered))))
+    return ordered[min(rank, len(ordered)) - 1]
+
+class CallStats:
+    """Count, errors, total time and a window of recent latencies for one name"""
+    
+    __slots__ = ('count', 'errors', 'rate_limited', 'total_time', 'recent', 'buckets')
+    
+    def __init__(self, window=500):
+        self.count = 0
+        self.errors = 0
+        self.rate_limited = 0
+        self.total_time = 0.0
+        self.recent = deque(maxlen=window)
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+    
+    def add(self, elapsed, error=False, rate_limited=False):
+        self.count += 1
+        self.total_time += elapsed
+        self.recent.append(elapsed)
+        self.buckets[_bucket_index(elapsed)] += 1
+        if error:
+            self.errors += 1
+        if rate_limited:
+            self.rate_limited += 1
+    
+    def percentiles(self):
+        """(p50, p95, p99) of the recent window, in seconds"""
+        samples = list(self.recent)
+        return percentile(samples, 50), percentile(samples, 95), percentile(samples, 99)
+
+class HandlerStats:
+    """Per-handler rollup: updates handled and the storage and Sheets work they caused"""
+    
+    __slots__ = ('updates', 'errors', 'update_time', 'storage_calls', 'sheets_calls', 'sheets_errors',
+                 'sheets_time', 'recent', 'buckets')
+    
+    def __init__(self, window=500):
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.updates = 0
+        self.errors = 0
+        self.update_time = 0.0
+        self.storage_calls = 0
+        self.sheets_calls = 0
+        self.sheets_errors = 0
+        self.sheets_time = 0.0
+        self.recent = deque(maxlen=window)
+    
+    def percentiles(self):
+        samples = list(self.recent)
+        return percentile(samples, 50), percentile(samples, 95), percentile(samples, 99)
+
+class PerfStats:
+    """Process-wide registry of timings, safe to update from any thread"""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started = time.time()
+        self.methods = {}  # storage method name -> CallStats
+        self.api_calls = {}  # 'Worksheet.method' -> CallStats
+        self.handlers = {}  # handler name -> HandlerStats
+        self.cache = Counter()  # (cache name, 'hit' or 'miss') -> lookups
+        self.deliveries = Counter()  # (message kind, outcome) -> messages
+        self.retries = Counter()  # retry class ('rate_limited' or 'transient') -> Sheets retries
+        self._api_times = deque()  # monotonic time of each Sheets call in the last minute
+        self.quota_waits = {}  # priority class -> CallStats of time spent waiting for Sheets quota
+    
+    def _handler(self):
+        name = current_handler.get()
+        stats = self.handlers.get(name)
+        if stats is None:
+            stats = self.handlers[name] = HandlerStats()
+        return stats
+    
+    def record_method(self, name, elapsed, error=False, outermost=True):
+        with self._lock:
+            self.methods.setdefault(name, CallStats()).add(elapsed, error)
+            if outermost:
+                self._handler().storage_calls += 1
+    
+    def record_api_call(self, name, elapsed, error=False, rate_limited=False):
+        with self._lock:
+            self.api_calls.setdefault(name, CallStats()).add(elapsed, error, rate_limited)
+            now = time.monotonic()
+            self._api_times.append(now)
+            while self._api_times and self._api_times[0] < now - 60:
+                self._api_times.popleft()
+            handler = self._handler()
+            handler.sheets_calls += 1
+            handler.sheets_time += elapsed
+            if error:
+                handler.sheets_errors += 1
+    
+    def record_update(self, name, elapsed, error=False):
+        with self._lock:
+            stats = self.handlers.get(name)
+            if stats is None:
+                stats = self.handlers[name] = HandlerStats()
+            stats.updates += 1
+            stats.update_time += elapsed
+            stats.recent.append(elapsed)
+            stats.buckets[_bucket_index(elapsed)] += 1
+            if error:
+                stats.errors += 1
+    
+    def record_quota_wait(self, priority, waited):
+        with self._lock:
+            self.quota_waits.setdefault(priority, CallStats()).add(waited)
+    
+    def record_retry(self, error_class):
+        with self._lock:
+            self.retries[error_class] += 1
+    
+    def record_cache(self, cache, hit):
+        with self._lock:
+            self.cache[(cache, 'hit' if hit else 'miss')] += 1
+    
+    def record_fanout(self, kind, result):
+        """Add a FanOutResult's delivery counts under a message kind (reminder, broadcast...)"""
+        with self._lock:
+            for outcome in ('sent', 'failed', 'blocked', 'retries'):
+                self.deliveries[(kind, outcome)] += getattr(result, outcome)
+    
+    def api_calls_last_minute(self):
+        """Sheets API calls made in the last 60 seconds (Google's quota window)"""
+        with self._lock:
+            cutoff = time.monotonic() - 60
+            return sum(1 for called_at in self._api_times if called_at >= cutoff)
+    
+    def snapshot(self):
+        """Copies of the handler, storage method and API call stats"""
+        with self._lock:
+            return {
+                'handlers': {name: _copy(stats) for name, stats in self.handlers.items()},
+                'methods': {name: _copy(stats) for name, stats in self.methods.items()},
+                'api_calls': {name: _copy(stats) for name, stats in self.api_calls.items()},
+                'quota_waits': {name: _copy(stats) for name, stats in self.quota_waits.items()},
+                'cache': Counter(self.cache),
+                'deliveries': Counter(self.deliveries),
+                'retries': Counter(self.retries)
+            }
+    
+    def reset(self):
+        with self._lock:
+            self.started = time.time()
+            self.methods.clear()
+            self.api_calls.clear()
+            self.handlers.clear()
+            self.quota_waits.clear()
+            self.cache.clear()
+            self.deliveries.clear()
+            self.retries.clear()
+            self._api_times.clear()
+
+def _copy(stats):
+    copy = type(stats).__new__(type(stats))
+    for slot in type(stats).__slots__:
+        value = getattr(stats, slot)
+        if isinstance(value, deque):
+            value = deque(value, maxlen=value.maxlen)
+        elif isinstance(value, list):
+            value = list(value)
+        setattr(copy, slot, value)
+    return copy
+
+perf_stats = PerfStats()
+_method_depth = threading.local()
+
+def timed_method(name, func):
+    """
+    Wrap a blocking storage method so its calls are timed and counted
+    Only the outermost call counts towards the handler's storage calls
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        depth = getattr(_method_depth, 'value', 0)
+        _method_depth.value = depth + 1
+        started = time.perf_counter()
+        error = False
+        try:
+            return func(*args, **kwargs)
+        except Exception:
+            error = True
+            raise
+        finally:
+            _method_depth.value = depth
+            perf_stats.record_method(name, time.perf_counter() - started, error, outermost=depth == 0)
+    return wrapper
+
+def instrument_methods(cls):
+    """
+    Class decorator: time every public method a storage class defines
+    (nested calls are counted under each method they pass through)
+    """
+    for name, attr in list(vars(cls).items()):
+        if callable(attr) and not name.startswith('_') and not isinstance(attr, (staticmethod, classmethod, type)):
+            setattr(cls, name, timed_method(f"{cls.__name__}.{name}", attr))
+    return cls
+
+class TimedSheet:
+    """
+    Proxy for a gspread Worksheet or Spreadsheet that times every API method call
+    Attribute reads such as .title pass straight through
+    """
+    
+    def __init__(self, target, label):
+        self._target = target
+        self._label = label
+    
+    def __getattr__(self, name):
+        attr = getattr(self._target, name)
+        if not callable(attr) or name.startswith('_'):
+            return attr
+        label = f"{self._label}.{name}"
+        
+        @functools.wraps(attr)
+        def timed(*args, **kwargs):
+            started = time.perf_counter()
+            error = False
+            rate_limited = False
+            try:
+                return attr(*args, **kwargs)
+            except Exception as e:
+                error = True
+                rate_limited = getattr(e, 'code', None) == 429
+                raise
+            finally:
+                perf_stats.record_api_call(label, time.perf_counter() - started, error, rate_limited)
+        return timed
+
+def track_handler(callback):
+    """Wrap a PTB handler callback so its updates are timed and its Sheets work is charged to it"""
+    name = getattr(callback, '__name__', repr(callback))
+    
+    @functools.wraps(callback)
+    async def tracked(update, context):
+        token = current_handler.set(name)
+        started = time.perf_counter()
+        error = False
+        try:
+            return await callback(update, context)
+        except Exception:
+            error = True
+            raise
+        finally:
+            perf_stats.record_update(name, time.perf_counter() - started, error)
+            current_handler.reset(token)
+    return tracked
+
+def iter_handlers(application):
+    """Every registered handler, with ConversationHandlers replaced by the handlers inside them"""
+    def walk(handler):
+        if getattr(handler, 'entry_points', None) is not None:
+            for child in handler.entry_points:
+                yield from walk(child)
+            for state_handlers in handler.states.values():
+                for child in state_handlers:
+                    yield from walk(child)
+            for child in handler.fallbacks:
+                yield from walk(child)
+        else:
+            yield handler
+    
+    for group in application.handlers.values():
+        for handler in group:
+            yield from walk(handler)
+
+def wrap_handler_callbacks(application, decorate):
+    """Replace every registered handler callback, including those inside ConversationHandlers, with decorate(callback)"""
+    for handler in iter_handlers(application):
+        if getattr(handler, 'callback', None):
+            handler.callback = decorate(handler.callback)
+
+def instrument_handlers(application):
+    """Wrap every registered handler callback so its updates are timed"""
+    def decorate(callback):
+        if getattr(callback, '_perf_tracked', False):
+            return callback
+        tracked = track_handler(callback)
+        tracked._perf_tracked = True
+        return tracked
+    
+    wrap_handler_callbacks(application, decorate)
@@ -1,25 +1,27 @@
 """
 Reminder Scheduler
-Sends reminders to users 1 day before their return date
+Sends reminders to users 1 day before their return date, and archives old returns overnight
 """
-from apscheduler.schedulers.background import BackgroundScheduler
-from telegram import Bot
-import asyncio
-from sheets_manager import SheetsManager
+from telegram.ext import Application, ContextTypes
+from datetime import time
+import pytz
+from async_sheets import get_async_sheets
+from fanout import get_fanout
 import config
 
 class ReminderScheduler:
-    def __init__(self, bot_token):
-        self.bot = Bot(token=bot_token)
-        self.sheets = SheetsManager()
-        self.scheduler = BackgroundScheduler()
+    def __init__(self, application: Application):
+        self.application = application
+        self.sheets = get_async_sheets()
+        self.job = None
+        self.archive_job = None
         
-    def send_reminders(self):
+    async def send_reminders(self, context: ContextTypes.DEFAULT_TYPE):
         """Check for rentals due tomorrow and send reminders"""
         print("🔔 Checking for rentals due tomorrow...")
         
         try:
-            due_rentals = self.sheets.get_all_due_tomorrow()
+            due_rentals = await self.sheets.get_all_due_tomorrow()
             
             if not due_rentals:
                 print("No rentals due tomorrow.")
@@ -27,30 +29,33 @@ class ReminderScheduler:
             
             print(f"Found {len(due_rentals)} rental(s) due tomorrow. Sending reminders...")
             
-            for rental in due_rentals:
-                asyncio.run(self.send_reminder(rental))
+            # Send concurrently over the bot's own connection pool, within Telegram's rate limits
+            messages = [message for message in map(self.build_reminder, due_rentals) if message]
+            result = await get_fanout(context.bot).send(messages, kind='reminder')
+            print(f"✅ Reminders sent: {result.sent}/{len(due_rentals)} "
+                  f"(blocked: {result.blocked}, failed: {result.failed}, {result.elapsed:.1f}s)")
                 
         except Exception as e:
             print(f"Error in send_reminders: {e}")
     
-    async def send_reminder(self, rental):
-        """Send a reminder message to a user"""
-        try:
-            user_id = rental.get('User ID', '')
-            
-            if not user_id:
-                print(f"Cannot send reminder - no user ID for rental {rental.get('Item ID')}")
-                return
-            
-            user_id = int(user_id)
-            
-            message = f"""
+    def build_reminder(self, rental):
+        """
+        Build the reminder message for a rental
+        Returns: (chat_id, text, send_message kwargs) or None if there is no user ID
+        """
+        user_id = rental.user_id
+        
+        if not user_id.isdigit():
+            print(f"Cannot send reminder - no user ID for rental {rental.item_id}")
+            return None
+        
+        message = f"""
 🔔 *Rental Return Reminder*
 
-📦 Item: {rental.get('Item Name')}
-🆔 Item ID: `{rental.get('Item ID')}`
-📅 Rented on: {rental.get('Rental Start Date')}
-⚠️ *Due tomorrow:* {rental.get('Expected Return Date')}
+📦 Item: {rental.item_name}
+🆔 Item ID: `{rental.item_id}`
+📅 Rented on: {rental.rental_start}
+⚠️ *Due tomorrow:* {rental.expected_return}
 
 Please remember to return the item to its location.
 
@@ -58,34 +63,42 @@ If you're returning it now, use /return command.
 
 Thank you! 🙏
             """
-            
-            await self.bot.send_message(
-                chat_id=user_id,
-                text=message,
-                parse_mode='Markdown'
-            )
-            
-            print(f"✅ Sent reminder to user {user_id} for item {rental.get('Item ID')}")
-            
+        
+        return int(user_id), message, {'parse_mode': 'Markdown'}
+    
+    async def archive_rentals(self, context: ContextTypes.DEFAULT_TYPE):
+        """Move old returned rentals out of the hot Rental Log"""
+        try:
+            await self.sheets.archive_returned_rentals()
         except Exception as e:
-            print(f"Error sending reminder: {e}")
+            print(f"Error in archive_rentals: {e}")
     
     def start(self):
-        """Start the scheduler"""
+        """Schedule the reminder job on the application's job queue"""
         # Run reminder check every day at 9:00 AM
-        self.scheduler.add_job(
+        self.job = self.application.job_queue.run_daily(
             self.send_reminders,
-            'cron',
-            hour=9,
-            minute=0,
-            timezone=config.TIMEZONE
+            time=time(hour=9, minute=0, tzinfo=pytz.timezone(config.TIMEZONE)),
+            name='rental_reminders'
         )
         
-        self.scheduler.start()
         print("✅ Reminder scheduler started (runs daily at 9:00 AM)")
     
+        if config.ARCHIVE_AFTER_DAYS > 0:
+            self.archive_job = self.application.job_queue.run_daily(
+                self.archive_rentals,
+                time=time(hour=config.ARCHIVE_HOUR, minute=0, tzinfo=pytz.timezone(config.TIMEZONE)),
+                name='rental_log_archive'
+            )
+            print(f"✅ Rental Log archive scheduled (daily at {config.ARCHIVE_HOUR}:00, "
+                  f"returns older than {config.ARCHIVE_AFTER_DAYS} days)")
+    
     def stop(self):
-        """Stop the scheduler"""
-        self.scheduler.shutdown()
+        """Remove the reminder job"""
+        if self.job:
+            self.job.schedule_removal()
+            self.job = None
+        if self.archive_job:
+            self.archive_job.schedule_removal()
+            self.archive_job = None
         print("⏹️ Reminder scheduler stopped")
-
@@ -0,0 +1,73 @@
+"""
+Rental Record
+Compact, typed rental shared by the storage backends, the caches and the handlers
+"""
+import uuid
+from due_index import parse_due_date
+from sheet_schema import LOG_SCHEMA
+
+# Rental Log cells in __init__ argument order, read with one compiled accessor
+_row_fields = LOG_SCHEMA.getter(
+    'BORROWER_NAME', 'TELEGRAM_USERNAME', 'USER_ID', 'ITEM_ID', 'QUANTITY',
+    'RENTAL_START', 'EXPECTED_RETURN', 'STATUS', 'RENTAL_ID'
+)
+
+def new_rental_id():
+    """A fresh Rental ID: 12 hex digits, written once with the rental and never reused"""
+    return uuid.uuid4().hex[:12]
+
+class RentalRecord:
+    """
+    One rental. Every storage query returns these and every handler reads them.
+    
+    Fields are parsed once, when the record is built from a Rental Log row or a
+    database row. user_id is the stripped User ID text, quantity an int, and
+    due_ordinal the Expected Return Date as a date ordinal (None if missing or
+    malformed). rental_id is the Rental ID written with the rental; it stays
+    the same when rows are sorted, deleted or archived, so pass it back to
+    complete_return. row_number is where the backend held the rental when the
+    record was read. item_name and location are filled in from the inventory
+    by the backend, and days_overdue by get_overdue_rentals.
+    """
+    
+    __slots__ = ('row_number', 'borrower_name', 'telegram_username', 'user_id', 'item_id', 'quantity',
+                 'rental_start', 'expected_return', 'due_ordinal', 'status', 'item_name', 'location',
+                 'days_overdue', 'rental_id')
+    
+    def __init__(self, row_number, borrower_name='', telegram_username='', user_id='', item_id='',
+                 quantity=1, rental_start='', expected_return='', status='ACTIVE', rental_id=''):
+        self.row_number = row_number
+        self.borrower_name = borrower_name
+        self.telegram_username = telegram_username
+        self.user_id = str(user_id).strip()
+        self.item_id = item_id
+        self.quantity = int(quantity) if quantity not in ('', None) else 1
+        self.rental_start = rental_start
+        self.expected_return = expected_return
+        due = parse_due_date(expected_return)
+        self.due_ordinal = due.toordinal() if due else None
+        self.status = status
+        self.rental_id = str(rental_id).strip()
+        self.item_name = None
+        self.location = None
+        self.days_overdue = None
+    
+    @classmethod
+    def from_row(cls, row, row_number):
+        """
+        Build a record from a Rental Log row (a list of cells)
+        Raises ValueError if the Quantity cell is not a number
+        """
+        return cls(row_number, *_row_fields(row))
+    
+    def copy(self):
+        """Shallow copy (callers may fill in item details without touching a cached record)"""
+        other = RentalRecord.__new__(RentalRecord)
+        for slot in RentalRecord.__slots__:
+            setattr(other, slot, getattr(self, slot))
+        return other
+    
+    def __repr__(self):
+        return (f"RentalRecord(rental_id={self.rental_id!r}, row_number={self.row_number!r}, user_id={self.user_id!r}, "
+                f"item_id={self.item_id!r}, quantity={self.quantity}, "
+                f"expected_return={self.expected_return!r}, status={self.status!r})")
@@ -0,0 +1,66 @@
+"""
+Stock Reservations
+Short-lived holds on inventory while a user finishes the /rent conversation
+"""
+import itertools
+import threading
+import time
+import config
+
+class StockReservations:
+    """
+    Tracks quantity held per item so two users cannot both be promised the
+    last unit, plus a lock per item that serializes Loaned Out commits.
+    
+    Holds expire after STOCK_HOLD_SECONDS so an abandoned conversation
+    gives its stock back without any cleanup call.
+    """
+    
+    def __init__(self, ttl=None):
+        self.ttl = ttl if ttl is not None else config.STOCK_HOLD_SECONDS
+        self._lock = threading.Lock()
+        self._holds = {}  # hold id -> (item key, user id, quantity, expires at)
+        self._ids = itertools.count(1)
+        self._item_locks = {}
+    
+    def item_lock(self, item_key):
+        """Lock that serializes stock commits for one item"""
+        with self._lock:
+            lock = self._item_locks.get(item_key)
+            if lock is None:
+                lock = self._item_locks[item_key] = threading.RLock()
+            return lock
+    
+    def _purge_expired(self):
+        now = time.monotonic()
+        expired = [hold_id for hold_id, hold in self._holds.items() if hold[3] <= now]
+        for hold_id in expired:
+            del self._holds[hold_id]
+    
+    def held(self, item_key, exclude_user=None):
+        """Quantity of an item currently held, optionally ignoring one user's holds"""
+        with self._lock:
+            self._purge_expired()
+            return sum(
+                quantity
+                for key, user_id, quantity, _ in self._holds.values()
+                if key == item_key and user_id != exclude_user
+            )
+    
+    def hold(self, item_key, user_id, quantity):
+        """
+        Hold stock for a user, replacing any hold they already have on the item
+        Returns: hold id
+        """
+        with self._lock:
+            self._purge_expired()
+            for hold_id in [h for h, hold in self._holds.items() if hold[0] == item_key and hold[1] == user_id]:
+                del self._holds[hold_id]
+            hold_id = next(self._ids)
+            self._holds[hold_id] = (item_key, user_id, quantity, time.monotonic() + self.ttl)
+            return hold_id
+    
+    def release(self, hold_id):
+        """Give held stock back (no-op for unknown or expired holds)"""
+        with self._lock:
+            return self._holds.pop(hold_id, None) is not None
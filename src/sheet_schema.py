@@ -0,0 +1,144 @@
+"""
+Sheet Schema
+The header each worksheet must have, checked against the sheet, and compiled row accessors
+"""
+import operator
+import re
+import config
+from gspread.utils import rowcol_to_a1
+
+class SchemaError(Exception):
+    """A worksheet's header row does not match the columns the bot reads and writes"""
+
+def _normalize_header(value):
+    """Header text compared case- and whitespace-insensitively"""
+    return ' '.join(str(value).split()).casefold()
+
+def _column_letter(idx):
+    return rowcol_to_a1(1, idx + 1).rstrip('1')
+
+def _numeric(value):
+    """A cell as an int or float when it reads as one (like gspread's get_all_records), else unchanged"""
+    text = str(value).strip()
+    if re.fullmatch(r'-?\d+', text):
+        return int(text)
+    try:
+        number = float(text)
+    except ValueError:
+        return value
+    return int(number) if number.is_integer() else number
+
+class SheetSchema:
+    """
+    Column layout of one worksheet: every column key (as in config.INVENTORY_COLUMNS
+    or config.LOG_COLUMNS) with its position and header name.
+    
+    validate() resolves the sheet's header row against the expected names each
+    time the sheet is read in full. Rows are appended and cells written by
+    position, so a column that was moved, renamed or deleted raises SchemaError
+    instead of being silently misread. Extra columns after the last one are fine.
+    Optional columns were added later: a sheet from before may lack their
+    header, as long as no other header sits in their place, and the caller
+    adds it.
+    
+    getter() and record_builder() compile row accessors once; applying them to
+    a row does no header parsing or name lookups.
+    """
+    
+    def __init__(self, title, columns, headers, optional=()):
+        self.title = title
+        self.columns = dict(columns)
+        self.width = max(self.columns.values()) + 1
+        self.header_names = dict(headers)
+        self.headers = [headers[key] for key in sorted(self.columns, key=self.columns.get)]
+        self.optional = frozenset(optional)
+        self._validated = None  # (header row, missing optional keys) of the last row that passed
+    
+    def validate(self, header_row):
+        """
+        Raise SchemaError unless every expected header is found in its column
+        Returns: frozenset of the optional column keys whose header is missing
+        """
+        header_row = tuple(str(value) for value in header_row)
+        if self._validated is not None and header_row == self._validated[0]:
+            return self._validated[1]
+        found = {}
+        for idx, value in enumerate(header_row):
+            found.setdefault(_normalize_header(value), idx)
+        
+        problems = []
+        missing = set()
+        for key, idx in sorted(self.columns.items(), key=lambda entry: entry[1]):
+            name = self.header_names[key]
+            actual = found.get(_normalize_header(name))
+            if actual is None and key in self.optional and not (idx < len(header_row) and header_row[idx].strip()):
+                missing.add(key)
+            elif actual is None:
+                problems.append(f"'{name}' is missing (expected in column {_column_letter(idx)})")
+            elif actual != idx:
+                problems.append(f"'{name}' is in column {_column_letter(actual)}, expected {_column_letter(idx)}")
+        if problems:
+            raise SchemaError(f"{self.title} sheet columns do not match: " + '; '.join(problems))
+        self._validated = (header_row, frozenset(missing))
+        return self._validated[1]
+    
+    def getter(self, *keys):
+        """
+        Compile a reader for the given column keys
+        Returns: function(row) -> tuple of cells (a single cell for one key), '' for short rows
+        """
+        fetch = operator.itemgetter(*(self.columns[key] for key in keys))
+        width = self.width
+        
+        def get(row):
+            if len(row) < width:
+                row = list(row) + [''] * (width - len(row))
+            return fetch(row)
+        return get
+    
+    def record_builder(self, numeric=()):
+        """
+        Compile a row -> dict converter keyed by header name
+        Cells of the numeric column keys become ints or floats where they parse
+        """
+        keys = sorted(self.columns, key=self.columns.get)
+        fetch = self.getter(*keys)
+        fields = [(self.header_names[key], key in numeric) for key in keys]
+        
+        def build(row):
+            return {
+                name: _numeric(value) if convert and value != '' else value
+                for (name, convert), value in zip(fields, fetch(row))
+            }
+        return build
+
+INVENTORY_SCHEMA = SheetSchema(config.INVENTORY_SHEET_NAME, config.INVENTORY_COLUMNS, {
+    'ITEM_ID': 'ItemID',
+    'ITEM_NAME': 'Item Name',
+    'TYPE': 'Type',
+    'BRAND': 'Brand',
+    'MODEL': 'Model',
+    'QUANTITY': 'Quantity',
+    'LOCATION': 'Location',
+    'LOANED_OUT': 'Loaned Out',
+    'QUANTITY_CURRENT': 'Quantity Current'
+})
+
+LOG_SCHEMA = SheetSchema(config.LOG_SHEET_NAME, config.LOG_COLUMNS, {
+    'DATE_TIME': 'Date & Time',
+    'BORROWER_NAME': 'Borrower Name',
+    'TELEGRAM_USERNAME': 'Telegram Username',
+    'USER_ID': 'User ID',
+    'ITEM_ID': 'Item ID',
+    'QUANTITY': 'Quantity',
+    'RENTAL_START': 'Rental Start Date',
+    'EXPECTED_RETURN': 'Expected Return Date',
+    'ACTUAL_RETURN': 'Actual Return Date',
+    'STATUS': 'Status',
+    'PICKUP_PHOTO': 'Pickup Photo',
+    'RETURN_PHOTO': 'Return Photo',
+    'RENTAL_ID': 'Rental ID'
+}, optional=('RENTAL_ID',))
+
+# Inventory records as SheetsManager and SqliteStore cache them
+inventory_record = INVENTORY_SCHEMA.record_builder(numeric=('QUANTITY', 'LOANED_OUT', 'QUANTITY_CURRENT'))
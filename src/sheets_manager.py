@@ -3,82 +3,918 @@ Google Sheets Manager
 Handles all interactions with Google Sheets
 """
 import gspread
+from gspread.exceptions import APIError, WorksheetNotFound
+from gspread.utils import rowcol_to_a1
 from google.oauth2.service_account import Credentials
-from datetime import datetime
+from datetime import datetime, timedelta
+import re
+import threading
+import time
 import config
+from log_mirror import RentalLogMirror, RentalStats, rows_checksum
+from rental_record import new_rental_id
+from log_archive import WriteGate, plan_archive, row_runs, renumber, is_archive_title
+from due_index import local_today
+from reservations import StockReservations
+from write_journal import WriteJournal
+from storage import Storage
+from perf_stats import instrument_methods, TimedSheet, perf_stats
+from sheets_scheduler import ScheduledSheet, get_sheets_scheduler
+from sheets_retry import NON_IDEMPOTENT_METHODS, SPREADSHEET_NON_IDEMPOTENT_METHODS, RetryingSheet, get_circuit_breaker
+from sheet_schema import INVENTORY_SCHEMA, LOG_SCHEMA, SchemaError, inventory_record
 
-class SheetsManager:
-    def __init__(self):
-        """Initialize Google Sheets connection"""
-        import os
-        import json
-        
+_id_fields = LOG_SCHEMA.getter('STATUS', 'RENTAL_ID')
+
+def normalize_item_id(item_id):
+    """Normalize an Item ID for lookups (Item IDs are case-insensitive)"""
+    return str(item_id).strip().upper()
+
+def to_int(value, default=0):
+    """Convert a sheet cell to int, treating empty cells and None as the default"""
+    if value == '' or value is None:
+        return default
+    return int(value)
+
+def _trimmed(row):
+    """Row cells as a tuple of strings without trailing empty cells (for comparing rows)"""
+    values = [str(value) for value in row]
+    while values and values[-1] == '':
+        values.pop()
+    return tuple(values)
+
+def _exceeds_grid(error):
+    """True for the 400 a ranged read gets when it starts below the sheet's last grid row"""
+    return isinstance(error, APIError) and error.code == 400 and 'exceeds grid limits' in str(error)
+
+def parse_appended_row_number(response):
+    """Extract the first row number from an append response's updatedRange"""
+    try:
+        updated_range = response['updates']['updatedRange']
+    except (KeyError, TypeError):
+        return None
+    match = re.search(r'![A-Z]+(\d+)', updated_range)
+    return int(match.group(1)) if match else None
+
+class WriteResult:
+    """
+    Outcome of a rental or return transaction
+    Truthy when the Rental Log write was applied
+    inventory_written is None when the item is not in the inventory sheet
+    """
+    __slots__ = ('log_written', 'inventory_written', 'row_number', 'rental_id')
+    
+    def __init__(self, log_written=False, inventory_written=None, row_number=None, rental_id=None):
+        self.log_written = log_written
+        self.inventory_written = inventory_written
+        self.row_number = row_number
+        self.rental_id = rental_id
+    
+    def __bool__(self):
+        return self.log_written
+    
+    def __repr__(self):
+        return (f"WriteResult(log_written={self.log_written}, "
+                f"inventory_written={self.inventory_written}, row_number={self.row_number}, "
+                f"rental_id={self.rental_id!r})")
+
+@instrument_methods
+class SheetsManager(Storage):
+    def __init__(self, client=None):
+        """
+        Set up an unconnected manager
+        The Google Sheets connection is opened on first use, so importing and
+        constructing this is cheap; only the write journal (with WRITE_BEHIND)
+        is opened here, so a bad path falls back to direct writes up front
+        client replaces the authorized gspread client (e.g. fake_sheets.FakeClient)
+        """
         self.scopes = [
             'https://www.googleapis.com/auth/spreadsheets',
             'https://www.googleapis.com/auth/drive'
         ]
         
-        try:
-            # Check if credentials are provided as environment variable (for deployment)
-            if os.getenv('GOOGLE_CREDENTIALS'):
-                creds_dict = json.loads(os.getenv('GOOGLE_CREDENTIALS'))
-                self.creds = Credentials.from_service_account_info(
-                    creds_dict,
-                    scopes=self.scopes
-                )
-                print("🔑 Using credentials from environment variable")
-            else:
-                # Use credentials file (for local development)
-                self.creds = Credentials.from_service_account_file(
-                    'credentials.json',
-                    scopes=self.scopes
-                )
-                print("🔑 Using credentials from file")
+        self._connect_lock = threading.Lock()
+        self.creds = None
+        self._client = client
+        self._spreadsheet = None
+        self._inventory_sheet = None
+        self._log_sheet = None
+        
+        # In-memory inventory index: normalized ItemID -> item dict (with '_row_number')
+        self._inventory_lock = threading.RLock()
+        self._inventory = {}
+        self._inventory_loaded_at = None
+        self._inventory_write_seq = 0
+        self._reservations = StockReservations()
+        
+        # In-memory mirror of the Rental Log, read incrementally from its tail
+        self._log_mirror = RentalLogMirror()
+        self._log_load_lock = threading.Lock()
+        self._log_dirty = False
+        self._log_revision = None
+        self._log_verified_at = None
+        
+        # Set while the last read of that sheet failed; the caches keep serving the last good copy
+        self._inventory_failing = False
+        self._log_failing = False
+        # Sheet title -> header mismatch found by its last full read; writes to it are refused meanwhile
+        self._schema_errors = {}
+        
+        self._refresh_stop = threading.Event()
+        self._refresh_thread = None
+        
+        # Write-behind journal: rentals and returns are confirmed once on local disk
+        self._journal = None
+        if config.WRITE_BEHIND and not config.WRITE_JOURNAL_PATH:
+            print("⚠️ WRITE_BEHIND needs WRITE_JOURNAL_PATH on a persistent disk; writing to the sheets directly")
+        elif config.WRITE_BEHIND:
+            self._journal = self._open_journal(config.WRITE_JOURNAL_PATH)
+        self._journal_start_lock = threading.Lock()
+        self._journal_wake = threading.Event()
+        self._journal_thread = None
+        
+        # Rental Log archive: writes that address rows by number pass through the gate,
+        # which an archive run closes while it deletes rows
+        self._log_gate = WriteGate()
+        self._archive_lock = threading.RLock()
+        self._archive_sheets = {}  # archive tab title -> worksheet
+        self._archive_stats = None  # RentalStats over every archive tab, loaded on first use
+    
+    def connect(self):
+        """Initialize Google Sheets connection (once)"""
+        if self._log_sheet is not None:
+            return
+        
+        import os
+        import json
+        
+        with self._connect_lock:
+            if self._log_sheet is not None:
+                return
             
-            self.client = gspread.authorize(self.creds)
-            self.spreadsheet = self.client.open_by_key(config.GOOGLE_SHEETS_ID)
-            self.inventory_sheet = self.spreadsheet.worksheet(config.INVENTORY_SHEET_NAME)
-            self.log_sheet = self.spreadsheet.worksheet(config.LOG_SHEET_NAME)
-            print("✅ Successfully connected to Google Sheets")
+            try:
+                if self._client is not None:
+                    self._open_worksheets()
+                    return
+                
+                # Check if credentials are provided as environment variable (for deployment)
+                if os.getenv('GOOGLE_CREDENTIALS'):
+                    creds_dict = json.loads(os.getenv('GOOGLE_CREDENTIALS'))
+                    self.creds = Credentials.from_service_account_info(
+                        creds_dict,
+                        scopes=self.scopes
+                    )
+                    print("🔑 Using credentials from environment variable")
+                else:
+                    # Use credentials file (for local development)
+                    self.creds = Credentials.from_service_account_file(
+                        'credentials.json',
+                        scopes=self.scopes
+                    )
+                    print("🔑 Using credentials from file")
+                
+                self._client = gspread.authorize(self.creds)
+                self._open_worksheets()
+                print("✅ Successfully connected to Google Sheets")
+            except Exception as e:
+                print(f"❌ Error connecting to Google Sheets: {e}")
+                raise
+    
+    def _open_worksheets(self):
+        """
+        Open the spreadsheet and both worksheets. Every API call made through them
+        is retried on transient failures (behind the circuit breaker), admitted
+        by the shared quota scheduler and timed, in that order
+        """
+        self._spreadsheet = self._wrap(
+            self._client.open_by_key(config.GOOGLE_SHEETS_ID), 'Spreadsheet', SPREADSHEET_NON_IDEMPOTENT_METHODS
+        )
+        self._inventory_sheet = self._wrap(self._spreadsheet.worksheet(config.INVENTORY_SHEET_NAME), 'Inventory')
+        self._log_sheet = self._wrap(self._spreadsheet.worksheet(config.LOG_SHEET_NAME), 'RentalLog')
+    
+    def _wrap(self, target, label, non_idempotent=NON_IDEMPOTENT_METHODS):
+        return RetryingSheet(
+            ScheduledSheet(TimedSheet(target, label), get_sheets_scheduler()), get_circuit_breaker(), non_idempotent
+        )
+    
+    def warm_up(self):
+        """Connect and load the inventory index ahead of the first request"""
+        try:
+            self.connect()
+            self._ensure_inventory()
         except Exception as e:
-            print(f"❌ Error connecting to Google Sheets: {e}")
+            print(f"Error warming up Google Sheets: {e}")
+    
+    def health(self):
+        """
+        How fresh the data served right now is
+        Returns: 'ok', 'stale' (serving cached copies while Sheets is failing),
+        'unavailable' (Sheets is failing and a needed cache was never loaded)
+        or 'schema' (a sheet's header row no longer matches; writes are refused)
+        """
+        if self._schema_errors:
+            return 'schema'
+        inventory_loaded = self._inventory_loaded_at is not None
+        if (self._inventory_failing and not inventory_loaded) or (self._log_failing and not self._log_mirror.loaded):
+            return 'unavailable'
+        if self._inventory_failing or self._log_failing or get_circuit_breaker().state != 'closed':
+            return 'stale' if inventory_loaded else 'unavailable'
+        return 'ok'
+    
+    @property
+    def client(self):
+        self.connect()
+        return self._client
+    
+    @property
+    def spreadsheet(self):
+        self.connect()
+        return self._spreadsheet
+    
+    @property
+    def inventory_sheet(self):
+        self.connect()
+        return self._inventory_sheet
+    
+    @property
+    def log_sheet(self):
+        self.connect()
+        return self._log_sheet
+    
+    def read_inventory_records(self):
+        """
+        Read the inventory sheet, checking its header against INVENTORY_SCHEMA
+        Returns: one dict keyed by header per sheet row, starting at row 2
+        Raises SchemaError if a column was moved, renamed or deleted
+        """
+        all_values = self.inventory_sheet.get_all_values()
+        self._check_header(INVENTORY_SCHEMA, all_values)
+        return [inventory_record(row) for row in all_values[1:]]
+    
+    def read_log_header(self):
+        """
+        Read the Rental Log header row and check it against LOG_SCHEMA, for
+        writers that do not keep the log mirror loaded
+        Returns: the optional column keys whose header is missing
+        Raises SchemaError if a column was moved, renamed or deleted
+        """
+        return self._check_header(LOG_SCHEMA, [self.log_sheet.row_values(1)])
+    
+    def _check_header(self, schema, all_values):
+        """
+        Validate the header row of a full sheet read, remembering a mismatch so
+        that writes to the sheet are refused until it is fixed
+        Returns: the optional column keys whose header is missing
+        Raises SchemaError if a column was moved, renamed or deleted
+        """
+        try:
+            missing = schema.validate(all_values[0] if all_values else [])
+        except SchemaError as e:
+            self._schema_errors[schema.title] = str(e)
             raise
+        self._schema_errors.pop(schema.title, None)
+        return missing
     
-    def get_item_by_id(self, item_id):
+    def require_schema(self, *schemas):
         """
-        Find an item by its ID in the inventory sheet
-        Returns: dict with item details or None if not found
+        Refuse a write that addresses cells by column position while any of these
+        sheets' header rows was last found not to match
+        Raises SchemaError
         """
+        for schema in schemas:
+            problem = self._schema_errors.get(schema.title)
+            if problem:
+                raise SchemaError(f"{problem}; not writing to it until the header row is fixed")
+    
+    def refresh_inventory(self):
+        """
+        Re-read the inventory sheet and rebuild the in-memory index
+        Keeps the previous index if the read fails, the header does not match
+        or the read overlapped a journal flush
+        Returns: True if the index was refreshed
+        """
+        with self._inventory_lock:
+            write_seq = self._inventory_write_seq
         try:
-            all_items = self.inventory_sheet.get_all_records()
+            all_items = self.read_inventory_records()
+        except Exception as e:
+            print(f"Error refreshing inventory: {e}")
+            self._inventory_failing = True
+            return False
+        self._inventory_failing = False
+        
+        index = {}
+        for idx, item in enumerate(all_items, start=2):  # Start from row 2 (after header)
+            key = normalize_item_id(item.get('ItemID', ''))
+            if key and key not in index:
+                item['_row_number'] = idx
+                index[key] = item
+        
+        with self._inventory_lock:
+            if write_seq != self._inventory_write_seq:
+                return False
+            if self._journal is not None:
+                # Journaled rentals and returns not yet counted on the sheet
+                for key, delta in self._journal.pending_deltas().items():
+                    item = index.get(key)
+                    if item:
+                        item['Loaned Out'] = to_int(item.get('Loaned Out', 0)) + delta
+                        if item.get('Quantity Current', '') != '':
+                            item['Quantity Current'] = to_int(item['Quantity Current']) - delta
+            self._inventory = index
+            self._inventory_loaded_at = time.monotonic()
+        return True
+    
+    def start_background_refresh(self):
+        """Start the background thread that keeps the in-memory indexes fresh"""
+        if self._refresh_thread and self._refresh_thread.is_alive():
+            return
+        self._refresh_stop.clear()
+        self._refresh_thread = threading.Thread(
+            target=self._refresh_loop,
+            name='sheets-refresh',
+            daemon=True
+        )
+        self._refresh_thread.start()
+    
+    def stop_background_refresh(self):
+        """Stop the background refresh thread"""
+        self._refresh_stop.set()
+    
+    def _refresh_loop(self):
+        while not self._refresh_stop.wait(config.CACHE_REFRESH_SECONDS):
+            self.refresh_inventory()
+            if self._log_mirror.loaded:
+                self.refresh_log()
+                if time.monotonic() - (self._log_verified_at or 0) >= config.LOG_VERIFY_SECONDS:
+                    self.verify_log()
+    
+    def _ensure_inventory(self):
+        """Load the inventory index on first use and keep it fresh in the background"""
+        self._start_journal()
+        perf_stats.record_cache('inventory', self._inventory_loaded_at is not None)
+        if self._inventory_loaded_at is None:
+            with self._inventory_lock:
+                if self._inventory_loaded_at is None and self.refresh_inventory():
+                    self.start_background_refresh()
+    
+    def _adjust_loaned_out(self, item_id, delta):
+        """
+        Apply a change to an item's "Loaned Out" count in the in-memory index
+        Keeps "Quantity Current" in step so availability checks see the bot's own writes
+        Returns: (row_number, new_loaned_out) or None if the item is not indexed
+        """
+        with self._inventory_lock:
+            item = self._inventory.get(normalize_item_id(item_id))
+            if not item:
+                return None
+            
+            current_loaned = to_int(item.get('Loaned Out', 0))
+            new_loaned = max(0, current_loaned + delta)
+            item['Loaned Out'] = new_loaned
             
-            for idx, item in enumerate(all_items, start=2):  # Start from row 2 (after header)
-                if str(item.get('ItemID', '')).strip().upper() == str(item_id).strip().upper():
-                    item['_row_number'] = idx
-                    return item
+            if item.get('Quantity Current', '') != '':
+                current_qty = to_int(item.get('Quantity Current', 0))
+                item['Quantity Current'] = current_qty - (new_loaned - current_loaned)
             
+            return item['_row_number'], new_loaned
+    
+    def reload_log(self):
+        """
+        Read the whole Rental Log into the mirror
+        The read is discarded if the bot wrote to the log while it was reading
+        Returns: True if the mirror was replaced
+        """
+        mirror = self._log_mirror
+        with mirror.lock:
+            write_seq = mirror.write_seq
+        
+        try:
+            revision = self.spreadsheet.get_lastUpdateTime()
+            all_values = self.log_sheet.get_all_values()
+            missing = self._check_header(LOG_SCHEMA, all_values)
+        except Exception as e:
+            print(f"Error reading rental log: {e}")
+            self._log_failing = True
+            return False
+        self._log_failing = False
+        self.assign_rental_ids(2, all_values[1:], add_header='RENTAL_ID' in missing)
+        
+        with mirror.lock:
+            if write_seq != mirror.write_seq:
+                return False
+            mirror.load(all_values)
+            self._apply_journal_to_mirror()
+            self._log_dirty = False
+            self._log_revision = revision
+            self._log_verified_at = time.monotonic()
+        return True
+    
+    def refresh_log(self):
+        """
+        Fetch only the rows appended since the last read (ranged tail read)
+        Returns: number of new rows ingested, or None on error
+        """
+        mirror = self._log_mirror
+        with mirror.lock:
+            write_seq = mirror.write_seq
+            first_row = mirror.last_row + 1
+        
+        last_column = rowcol_to_a1(1, LOG_SCHEMA.width).rstrip('1')
+        try:
+            try:
+                new_rows = self.log_sheet.get(f"A{first_row}:{last_column}")
+            except APIError as e:
+                if not _exceeds_grid(e):
+                    raise
+                new_rows = []  # the grid ends at the last row already read
+        except Exception as e:
+            print(f"Error reading new rental log rows: {e}")
+            self._log_failing = True
             return None
+        self._log_failing = False
+        self.assign_rental_ids(first_row, new_rows)
+        
+        with mirror.lock:
+            if write_seq != mirror.write_seq:
+                self._log_dirty = True
+                return 0
+            mirror.extend(first_row, new_rows)
+            self._log_dirty = False
+        return len(new_rows)
+    
+    def verify_log(self):
+        """
+        Catch manual edits to rows the mirror already holds
+        Compares the spreadsheet revision time and, if it moved, re-reads the
+        log and replaces the mirror when its checksum differs
+        Returns: True if the mirror was found stale and reloaded
+        """
+        mirror = self._log_mirror
+        try:
+            revision = self.spreadsheet.get_lastUpdateTime()
         except Exception as e:
-            print(f"Error fetching item: {e}")
+            print(f"Error checking rental log revision: {e}")
+            self._log_failing = True
+            return False
+        
+        self._log_verified_at = time.monotonic()
+        if revision == self._log_revision:
+            return False
+        
+        with mirror.lock:
+            write_seq = mirror.write_seq
+        try:
+            all_values = self.log_sheet.get_all_values()
+            missing = self._check_header(LOG_SCHEMA, all_values)
+        except Exception as e:
+            print(f"Error verifying rental log: {e}")
+            self._log_failing = True
+            return False
+        self._log_failing = False
+        
+        with mirror.lock:
+            if write_seq != mirror.write_seq:
+                return False
+            self._log_revision = revision
+            if rows_checksum(all_values[1:]) == mirror.checksum():
+                return False
+        self.assign_rental_ids(2, all_values[1:], add_header='RENTAL_ID' in missing)
+        
+        with mirror.lock:
+            if write_seq != mirror.write_seq:
+                return False
+            print("🔄 Rental log changed outside the bot, reloading")
+            mirror.load(all_values)
+            self._apply_journal_to_mirror()
+            self._log_dirty = False
+        return True
+    
+    def assign_rental_ids(self, first_row, rows, add_header=False):
+        """
+        Give each ACTIVE row without a Rental ID (logged before the column
+        existed, or typed in by hand) a new one, in rows (sheet row first_row
+        onwards) and on the sheet with one batch update
+        The IDs stay in rows if the write fails or an archive run is moving
+        rows; the next full read then assigns fresh ones
+        """
+        idx = config.LOG_COLUMNS['RENTAL_ID']
+        updates = []
+        if add_header:
+            updates.append({'range': rowcol_to_a1(1, idx + 1), 'values': [[LOG_SCHEMA.header_names['RENTAL_ID']]]})
+        for row_number, row in enumerate(rows, start=first_row):
+            status, rental_id = _id_fields(row)
+            if str(rental_id).strip() or str(status).strip().upper() != 'ACTIVE':
+                continue
+            row.extend([''] * (idx + 1 - len(row)))
+            row[idx] = new_rental_id()
+            updates.append({'range': rowcol_to_a1(row_number, idx + 1), 'values': [[row[idx]]]})
+        if not updates:
+            return
+        
+        # An archive run in another thread may be deleting rows; the archive thread itself can write
+        if not self._archive_lock.acquire(blocking=False):
+            return
+        try:
+            if add_header and self.log_sheet.col_count < LOG_SCHEMA.width:
+                self.log_sheet.add_cols(LOG_SCHEMA.width - self.log_sheet.col_count)
+            self.log_sheet.batch_update(updates)
+            if len(updates) > add_header:
+                print(f"🆔 Assigned {len(updates) - add_header} Rental ID(s) in the Rental Log")
+        except Exception as e:
+            print(f"Error writing Rental IDs (kept in memory for now): {e}")
+        finally:
+            self._archive_lock.release()
+    
+    def archive_returned_rentals(self, older_than_days=None):
+        """
+        Move RETURNED rows returned more than older_than_days ago (config.ARCHIVE_AFTER_DAYS)
+        out of the Rental Log into archive tabs, one per month or year of return
+        Each archive tab gets one append (skipping rows an interrupted run already
+        copied there), then every run of rows is deleted from the log in one
+        spreadsheet batch update, bottom first. Archived rows are added to the
+        archive stats only once that delete succeeds. Rentals and returns wait at
+        the write gate meanwhile, and find their rows again by Rental ID once
+        the mirror is reloaded
+        Returns: number of rows archived, or None if skipped or failed
+        """
+        days = config.ARCHIVE_AFTER_DAYS if older_than_days is None else older_than_days
+        if days <= 0:
             return None
+        
+        with self._archive_lock:
+            if self._journal is not None:
+                self._start_journal()
+                self.flush_journal()
+            with self._log_gate.exclusive():
+                if self._journal is not None and len(self._journal):
+                    # Journal entries refer to rows by number; archive once they are all on the sheet
+                    print("📦 Rental Log archive postponed: journaled writes are still being flushed")
+                    return None
+                deleted = []
+                deleting = False
+                try:
+                    all_values = self.log_sheet.get_all_values()
+                    self._check_header(LOG_SCHEMA, all_values)
+                    stats = self._ensure_archive_stats()
+                    plan = plan_archive(all_values[1:], datetime.now() - timedelta(days=days))
+                    archived = {title: self._append_to_archive(title, [row for _, row in rows])
+                                for title, rows in sorted(plan.items())}
+                    runs = row_runs(row_number for rows in plan.values() for row_number, _ in rows)
+                    if runs:
+                        deleting = True
+                        sheet_id = self.log_sheet.id
+                        self.spreadsheet.batch_update({'requests': [
+                            {'deleteDimension': {'range': {
+                                'sheetId': sheet_id, 'dimension': 'ROWS', 'startIndex': first - 1, 'endIndex': last
+                            }}}
+                            for first, last in runs
+                        ]})
+                        deleted = [row_number for first, last in runs for row_number in range(first, last + 1)]
+                    # Counted only now the rows have left the log, where they were counted until now
+                    for title, rows in plan.items():
+                        for _, row in rows:
+                            stats.update((title, archived[title][_trimmed(row)]), row)
+                except Exception as e:
+                    print(f"Error archiving rental log: {e}")
+                    return None
+                finally:
+                    if deleting and not deleted:
+                        # The delete may have gone through before the error: re-read the log
+                        with self._log_mirror.lock:
+                            self._log_mirror.loaded = False
+                        self.reload_log()
+                    if deleted:
+                        # Rows below the deleted ones moved up: follow them, and reload the mirror
+                        if self._journal is not None:
+                            self._journal.renumber_rows(renumber(deleted))
+                        with self._log_mirror.lock:
+                            self._log_mirror.loaded = False
+                        self.reload_log()
+        
+        if deleted:
+            print(f"📦 Archived {len(deleted)} returned rental(s) into {len(plan)} archive tab(s)")
+        return len(deleted)
+    
+    def _archive_sheet(self, title, create=False):
+        """The archive tab with this title (created with a header row if create), or None"""
+        sheet = self._archive_sheets.get(title)
+        if sheet is None:
+            try:
+                sheet = self._wrap(self.spreadsheet.worksheet(title), 'Archive')
+            except WorksheetNotFound:
+                if not create:
+                    return None
+                sheet = self._wrap(
+                    self.spreadsheet.add_worksheet(title=title, rows=1, cols=LOG_SCHEMA.width), 'Archive'
+                )
+            self._archive_sheets[title] = sheet
+        return sheet
+    
+    def _append_to_archive(self, title, rows):
+        """
+        Append Rental Log rows to an archive tab in one call, skipping rows it already holds
+        Returns: {trimmed row: its row number in the archive tab}
+        """
+        sheet = self._archive_sheet(title, create=True)
+        existing = sheet.get_all_values()
+        if existing:
+            LOG_SCHEMA.validate(existing[0])
+        held = {}
+        for row_number, row in enumerate(existing[1:], start=2):
+            held.setdefault(_trimmed(row), row_number)
+        new_rows = [row for row in rows if _trimmed(row) not in held]
+        if new_rows:
+            sheet.append_rows(new_rows if existing else [LOG_SCHEMA.headers] + new_rows)
+        for row_number, row in enumerate(new_rows, start=max(len(existing), 1) + 1):
+            held[_trimmed(row)] = row_number
+        return held
+    
+    def _ensure_archive_stats(self, reload=False):
+        """
+        Count every archive tab once (one read per tab); archive runs then add
+        the rows they move. Rows that are still in the log (copied by a run
+        that failed before its delete) are left to the log's count
+        Returns: RentalStats over the archived rows
+        """
+        with self._archive_lock:
+            if self._archive_stats is not None and not reload:
+                return self._archive_stats
+            stats = RentalStats()
+            with self._log_mirror.lock:
+                in_log = {_trimmed(row) for row in self._log_mirror.rows}
+            for worksheet in self.spreadsheet.worksheets():
+                if not is_archive_title(worksheet.title):
+                    continue
+                sheet = self._archive_sheets.setdefault(worksheet.title, self._wrap(worksheet, 'Archive'))
+                values = sheet.get_all_values()
+                if values:
+                    LOG_SCHEMA.validate(values[0])
+                for row_number, row in enumerate(values[1:], start=2):
+                    if _trimmed(row) in in_log:
+                        continue
+                    stats.update((worksheet.title, row_number), row)
+            self._archive_stats = stats
+            return stats
+    
+    def _read_rental_ids(self, row_numbers):
+        """
+        The Rental ID cells of some Rental Log rows, in one batch read
+        Returns: {row number: Rental ID ('' if blank)}
+        """
+        column = rowcol_to_a1(1, config.LOG_COLUMNS['RENTAL_ID'] + 1).rstrip('1')
+        rows = sorted(set(row_numbers))
+        ranges = self.log_sheet.batch_get([f"{column}{row_number}" for row_number in rows])
+        return {
+            row_number: str(values[0][0]).strip() if values and values[0] else ''
+            for row_number, values in zip(rows, ranges)
+        }
+    
+    def _confirm_rental_rows(self, targets):
+        """
+        Check that each Rental ID is still in the row the mirror has for it
+        before writing to that row, and reload the mirror when any has moved
+        targets: {Rental ID: row number}
+        Returns: {Rental ID: current row number, or None if it is no longer in the log}
+        Raises RuntimeError if the moved log could not be re-read
+        """
+        if not targets:
+            return {}
+        try:
+            found = self._read_rental_ids(targets.values())
+        except APIError as e:
+            if not _exceeds_grid(e):
+                raise
+            found = {}  # rows were deleted from the bottom of the log
+        if all(found.get(row_number) == rental_id for rental_id, row_number in targets.items()):
+            return dict(targets)
+        print("🔄 Rental log rows moved since they were read, reloading")
+        if not self.reload_log():
+            raise RuntimeError("Rental log rows moved and the log could not be re-read")
+        rows = {rental_id: self._log_mirror.row_of(rental_id) for rental_id in targets}
+        return {rental_id: row if row is not None and row > 0 else None for rental_id, row in rows.items()}
+    
+    def _ensure_log(self):
+        """Load the Rental Log mirror on first use and catch up after unplaced writes"""
+        self._start_journal()
+        perf_stats.record_cache('rental_log', self._log_mirror.loaded and not self._log_dirty)
+        if not self._log_mirror.loaded:
+            with self._log_load_lock:
+                if not self._log_mirror.loaded:
+                    self.reload_log()
+            if not self._log_mirror.loaded:
+                raise RuntimeError("Rental log is unavailable")
+        elif self._log_dirty:
+            self.refresh_log()
+    
+    @staticmethod
+    def _open_journal(path):
+        """
+        Open and replay the write journal
+        Returns: WriteJournal, or None if the file cannot be opened (writes then go to the sheets directly)
+        """
+        journal = WriteJournal(path)
+        try:
+            journal.open()
+        except OSError as e:
+            print(f"⚠️ Cannot open write journal {path} ({e}); writing to the sheets directly")
+            return None
+        return journal
+    
+    def _start_journal(self):
+        """Overlay the replayed write journal on the log mirror and start its flush worker (once)"""
+        if self._journal is None or self._journal_thread is not None:
+            return
+        with self._journal_start_lock:
+            if self._journal_thread is not None:
+                return
+            self._apply_journal_to_mirror()
+            self._journal_thread = threading.Thread(
+                target=self._journal_loop,
+                name='sheets-journal',
+                daemon=True
+            )
+            self._journal_thread.start()
+            if len(self._journal):
+                self._journal_wake.set()
+    
+    def _apply_journal_to_mirror(self):
+        """Overlay journaled writes that are not on the sheet yet onto the Rental Log mirror"""
+        if self._journal is None:
+            return
+        for entry in self._journal.pending():
+            if entry['logged']:
+                continue
+            if entry['op'] == 'rental':
+                self._log_mirror.add_pending(entry['seq'], entry['row'])
+                continue
+            # Follow the rental by Rental ID in case rows moved since the return was journaled
+            row_number = self._log_mirror.row_of(entry['rental_id']) if entry.get('rental_id') else None
+            if row_number is not None and row_number > 0:
+                self._log_mirror.record_update(row_number, entry['changes'])
+            elif entry.get('target_row'):
+                self._log_mirror.record_update(entry['target_row'], entry['changes'])
+            else:
+                self._log_mirror.drop_pending(entry['target_seq'])
+    
+    def _journal_loop(self):
+        backoff = 1
+        while True:
+            self._journal_wake.wait()
+            time.sleep(config.JOURNAL_BATCH_SECONDS)
+            self._journal_wake.clear()
+            try:
+                self.flush_journal()
+                backoff = 1
+            except Exception as e:
+                print(f"Error flushing write journal (retrying in {backoff}s): {e}")
+                time.sleep(backoff)
+                backoff = min(backoff * 2, 300)
+                self._journal_wake.set()
+    
+    def flush_journal(self):
+        """
+        Write every journaled rental and return to the sheets
+        New rentals go out in one append, returns in one log batch update and
+        the affected Loaned Out counts in one inventory batch update
+        Returns: number of journal entries that were pending
+        """
+        with self._log_gate.write():
+            return self._flush_journal()
+    
+    def _flush_journal(self):
+        journal = self._journal
+        entries = journal.pending()
+        if not entries:
+            return 0
+        # Rows are written by column position: wait while either header does not match
+        self._ensure_log()
+        self.require_schema(LOG_SCHEMA, INVENTORY_SCHEMA)
+        
+        # New rentals first, so returns queued against them learn their row
+        rentals = [entry for entry in entries if entry['op'] == 'rental' and not entry['logged']]
+        if rentals:
+            response = self.log_sheet.append_rows([entry['row'] for entry in rentals])
+            first_row = parse_appended_row_number(response)
+            for offset, entry in enumerate(rentals):
+                row_number = first_row + offset if first_row else None
+                journal.mark_logged(entry['seq'], row_number)
+                self._log_mirror.drop_pending(entry['seq'])
+                if row_number is None:
+                    self._log_dirty = True
+                else:
+                    self._log_mirror.record_append(row_number, entry['row'])
+            self._apply_journal_to_mirror()
+        
+        targets = {}  # seq -> (row number, Rental ID or None for entries from before Rental IDs)
+        for entry in journal.pending():
+            if entry['op'] != 'return' or entry['logged']:
+                continue
+            if entry.get('target_seq') and journal.rental_row(entry['target_seq']) is None:
+                continue  # its rental is not on the sheet yet
+            row_number = self._log_mirror.row_of(entry['rental_id']) if entry.get('rental_id') else None
+            if row_number is None or row_number < 0:
+                row_number = entry.get('target_row')
+            if not row_number:
+                print(f"⚠️ Dropping journaled return: row of rental {entry.get('rental_id') or entry['target_seq']} "
+                      f"is unknown")
+                journal.mark_logged(entry['seq'])
+                continue
+            targets[entry['seq']] = (row_number, entry.get('rental_id'))
+        
+        # Check the rows still hold those rentals (rows may have been sorted or deleted by hand)
+        checked = self._confirm_rental_rows(
+            {rental_id: row_number for row_number, rental_id in targets.values() if rental_id}
+        )
+        updates = []
+        returns = []
+        for entry in journal.pending():
+            if entry['seq'] not in targets:
+                continue
+            row_number, rental_id = targets[entry['seq']]
+            if rental_id:
+                row_number = checked.get(rental_id)
+                if row_number is None:
+                    print(f"⚠️ Dropping journaled return: rental {rental_id} is no longer in the Rental Log")
+                    journal.mark_logged(entry['seq'])
+                    continue
+            changes = entry['changes']
+            updates.append({
+                'range': (f"{rowcol_to_a1(row_number, config.LOG_COLUMNS['ACTUAL_RETURN'] + 1)}:"
+                          f"{rowcol_to_a1(row_number, config.LOG_COLUMNS['STATUS'] + 1)}"),
+                'values': [[changes['ACTUAL_RETURN'], changes['STATUS']]]
+            })
+            updates.append({
+                'range': rowcol_to_a1(row_number, config.LOG_COLUMNS['RETURN_PHOTO'] + 1),
+                'values': [[changes['RETURN_PHOTO']]]
+            })
+            returns.append(entry['seq'])
+        if updates:
+            self.log_sheet.batch_update(updates)
+            for seq in returns:
+                journal.mark_logged(seq)
+        
+        # The cached Loaned Out already includes every uncounted entry
+        with self._inventory_lock:
+            uncounted = [entry for entry in journal.pending() if not entry['counted']]
+            values = {}
+            for entry in uncounted:
+                item = self._inventory.get(entry.get('item'))
+                if item:
+                    values[item['_row_number']] = to_int(item.get('Loaned Out', 0))
+            self._inventory_write_seq += 1
+        if values:
+            self.inventory_sheet.batch_update([
+                {
+                    'range': rowcol_to_a1(item_row, config.INVENTORY_COLUMNS['LOANED_OUT'] + 1),
+                    'values': [[loaned_out]]
+                }
+                for item_row, loaned_out in values.items()
+            ])
+        journal.mark_counted([entry['seq'] for entry in uncounted])
+        with self._inventory_lock:
+            self._inventory_write_seq += 1
+        return len(entries)
+    
+    def get_item_by_id(self, item_id):
+        """
+        Find an item by its ID in the in-memory inventory index
+        Returns: dict with item details or None if not found
+        """
+        self._ensure_inventory()
+        with self._inventory_lock:
+            item = self._inventory.get(normalize_item_id(item_id))
+            return dict(item) if item else None
     
     def enrich_rental_with_item_details(self, rental):
         """
         Enrich a rental record with item details from inventory
-        Adds 'Item Name' and 'Location' fields
+        Sets item_name and location
         """
-        item_id = rental.get('Item ID', '').strip()
-        if item_id:
-            item = self.get_item_by_id(item_id)
-            if item:
-                rental['Item Name'] = item.get('Item Name', 'Unknown')
-                rental['Location'] = item.get('Location', 'Unknown')
-        return rental
+        return self.enrich_rentals_with_item_details([rental])[0]
     
-    def check_availability(self, item_id):
+    def enrich_rentals_with_item_details(self, rentals):
+        """
+        Enrich a batch of rental records with item details from inventory
+        Joins every rental against a single inventory snapshot in one pass
+        Sets item_name and location
+        """
+        self._ensure_inventory()
+        with self._inventory_lock:
+            inventory = self._inventory
+        
+        for rental in rentals:
+            item_id = str(rental.item_id).strip()
+            if item_id:
+                item = inventory.get(normalize_item_id(item_id))
+                if item:
+                    rental.item_name = item.get('Item Name', 'Unknown')
+                    rental.location = item.get('Location', 'Unknown')
+        return rentals
+    
+    def check_availability(self, item_id, user_id=None):
         """
         Check if an item is available for rent
-        Uses "Quantity Current" to determine stock availability
+        Uses "Quantity Current" minus stock held by other users' unfinished rentals
         Returns: (available: bool, quantity: int, item_details: dict)
         """
         item = self.get_item_by_id(item_id)
@@ -87,28 +923,78 @@ class SheetsManager:
             return False, 0, None
         
         # Use "Quantity Current" for stock checking
-        quantity_current = int(item.get('Quantity Current', 0))
+        quantity_current = to_int(item.get('Quantity Current', 0))
+        held = self._reservations.held(normalize_item_id(item_id), exclude_user=user_id)
         
-        # If Quantity Current is 0, item is out of stock
-        if quantity_current == 0:
-            return False, 0, item
+        # Available quantity is what is on the shelf and not promised to someone else
+        available_quantity = max(0, quantity_current - held)
         
-        # Available quantity is the Quantity Current value
-        available_quantity = quantity_current
+        # If nothing is left, item is out of stock
+        if available_quantity == 0:
+            return False, 0, item
         
         return available_quantity > 0, available_quantity, item
     
+    def reserve_stock(self, item_id, user_id, quantity):
+        """
+        Hold stock for a user while they finish renting
+        Replaces the user's previous hold on the same item
+        Returns: (hold_id or None if not enough stock, available quantity)
+        """
+        self._ensure_inventory()
+        key = normalize_item_id(item_id)
+        with self._inventory_lock:
+            item = self._inventory.get(key)
+            if not item:
+                return None, 0
+            
+            available = to_int(item.get('Quantity Current', 0)) - self._reservations.held(key, exclude_user=user_id)
+            if quantity > available:
+                return None, max(0, available)
+            return self._reservations.hold(key, user_id, quantity), available
+    
+    def release_stock(self, hold_id):
+        """Give back stock held by reserve_stock (cancel or abandoned rental)"""
+        return self._reservations.release(hold_id)
+    
     def log_rental(self, borrower_name, telegram_username, user_id, item_id, item_name, 
-                   rental_start, expected_return, pickup_photo_url, quantity=1):
+                   rental_start, expected_return, pickup_photo_url, quantity=1, hold_id=None):
         """
         Log a new rental transaction and increment Loaned Out counter
         Each rental is logged as a separate row
+        Commits for the same item are serialized; hold_id is released once
+        the stock is counted as Loaned Out
+        Returns: WriteResult (falsy, and nothing written, while a sheet's header does not match)
         """
+        try:
+            self.require_schema(LOG_SCHEMA, INVENTORY_SCHEMA)
+        except SchemaError as e:
+            print(f"Error logging rental: {e}")
+            if hold_id is not None:
+                self.release_stock(hold_id)
+            return WriteResult()
+        if self._journal is not None:
+            return self._journal_rental(borrower_name, telegram_username, user_id, item_id,
+                                        rental_start, expected_return, pickup_photo_url, quantity, hold_id)
+        with self._reservations.item_lock(normalize_item_id(item_id)), self._log_gate.write():
+            result = self._log_rental(borrower_name, telegram_username, user_id, item_id,
+                                      rental_start, expected_return, pickup_photo_url, quantity, hold_id)
+        if hold_id is not None and not result:
+            self.release_stock(hold_id)
+        return result
+    
+    def _log_rental(self, borrower_name, telegram_username, user_id, item_id,
+                    rental_start, expected_return, pickup_photo_url, quantity, hold_id):
         try:
             # Get current date and time
             request_datetime = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
             
+            # The log's header must have been checked before appending by column position
+            self._ensure_log()
+            self.require_schema(LOG_SCHEMA, INVENTORY_SCHEMA)
+            
             # Log the rental - NEW STRUCTURE
+            rental_id = new_rental_id()
             row = [
                 request_datetime,      # Date & Time
                 borrower_name,         # Borrower Name
@@ -121,46 +1007,154 @@ class SheetsManager:
                 '',                   # Actual Return Date (empty for now)
                 'ACTIVE',             # Status
                 pickup_photo_url,     # Pickup Photo
-                ''                    # Return Photo (empty for now)
+                '',                   # Return Photo (empty for now)
+                rental_id             # Rental ID
             ]
             
-            self.log_sheet.append_row(row)
-            
-            # Increment the "Loaned Out" counter in inventory by the quantity
-            item = self.get_item_by_id(item_id)
+            response = self.log_sheet.append_rows([row])
+            row_number = parse_appended_row_number(response)
+            if row_number is None:
+                # Position unknown - pick the row up with the next tail read
+                self._log_dirty = True
+            else:
+                self._log_mirror.record_append(row_number, row)
+        except Exception as e:
+            print(f"Error logging rental: {e}")
+            return WriteResult()
+        
+        # Increment the "Loaned Out" counter in inventory by the quantity
+        return WriteResult(
+            log_written=True,
+            inventory_written=self._commit_loaned_out(item_id, quantity, hold_id),
+            row_number=row_number,
+            rental_id=rental_id
+        )
+    
+    def _journal_rental(self, borrower_name, telegram_username, user_id, item_id,
+                        rental_start, expected_return, pickup_photo_url, quantity, hold_id):
+        """
+        Record a rental in the write journal and count it in the inventory index
+        The rental is listed as ACTIVE straight away; the flush worker writes it
+        to the sheets
+        Returns: WriteResult whose row_number is negative until the row is appended
+        """
+        key = normalize_item_id(item_id)
+        rental_id = new_rental_id()
+        row = [
+            datetime.now().strftime('%Y-%m-%d %H:%M:%S'), borrower_name, telegram_username,
+            str(user_id), item_id, quantity, rental_start, expected_return, '', 'ACTIVE',
+            pickup_photo_url, '', rental_id
+        ]
+        try:
+            self._ensure_inventory()
+            with self._reservations.item_lock(key):
+                with self._inventory_lock:
+                    adjusted = self._adjust_loaned_out(item_id, quantity)
+                    try:
+                        seq = self._journal.append({
+                            'op': 'rental', 'row': row, 'item': key if adjusted else None, 'delta': quantity
+                        })
+                    except Exception:
+                        if adjusted:
+                            self._adjust_loaned_out(item_id, -quantity)
+                        raise
+                    if hold_id is not None:
+                        self._reservations.release(hold_id)
+        except Exception as e:
+            print(f"Error journaling rental: {e}")
+            if hold_id is not None:
+                self.release_stock(hold_id)
+            return WriteResult()
+        
+        self._log_mirror.add_pending(seq, row)
+        self._journal_wake.set()
+        return WriteResult(log_written=True, inventory_written=True if adjusted else None, row_number=-seq,
+                           rental_id=rental_id)
+    
+    def _journal_return(self, row_number, return_photo_url):
+        """
+        Record a return in the write journal and release its stock in the inventory index
+        row_number may be negative for a rental that is itself still journaled
+        Returns: WriteResult
+        """
+        try:
+            if row_number < 0 and self._journal.rental_row(-row_number):
+                row_number = self._journal.rental_row(-row_number)
+            rental = self._log_mirror.active_rental(row_number)
+            if rental is None:
+                raise LookupError(f"rental at row {row_number} is no longer active")
+            item_id = rental.item_id or None
+            quantity = rental.quantity
             
-            if not item or '_row_number' not in item:
-                return True
+            changes = {
+                'ACTUAL_RETURN': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                'STATUS': 'RETURNED',
+                'RETURN_PHOTO': return_photo_url
+            }
+            key = normalize_item_id(item_id) if item_id else None
+            with self._reservations.item_lock(key or ''):
+                with self._inventory_lock:
+                    adjusted = self._adjust_loaned_out(item_id, -quantity) if item_id else None
+                    with self._journal.lock:
+                        # Resolve again under the journal lock in case the rental was just appended
+                        if row_number < 0 and self._journal.rental_row(-row_number):
+                            row_number = self._journal.rental_row(-row_number)
+                        elif row_number < 0 and (self._log_mirror.row_of(rental.rental_id) or 0) > 0:
+                            # Appended and finished with in the journal meanwhile
+                            row_number = self._log_mirror.row_of(rental.rental_id)
+                        entry = {'op': 'return', 'changes': changes, 'rental_id': rental.rental_id,
+                                 'item': key if adjusted else None, 'delta': -quantity}
+                        if row_number < 0:
+                            entry['target_seq'] = -row_number
+                        else:
+                            entry['target_row'] = row_number
+                        try:
+                            self._journal.append(entry)
+                        except Exception:
+                            if adjusted:
+                                self._adjust_loaned_out(item_id, quantity)
+                            raise
+        except Exception as e:
+            print(f"Error journaling return: {e}")
+            return WriteResult()
+        
+        if row_number < 0:
+            self._log_mirror.drop_pending(-row_number)
+        else:
+            self._log_mirror.record_update(row_number, changes)
+        self._journal_wake.set()
+        return WriteResult(log_written=True, inventory_written=True if adjusted else None, row_number=row_number,
+                           rental_id=rental.rental_id)
+    
+    def _commit_loaned_out(self, item_id, delta, hold_id=None):
+        """
+        Apply a "Loaned Out" change to the inventory index and write it in one call
+        Runs under the item's commit lock so concurrent writes land in order
+        The index change is rolled back if the write fails
+        Returns: True if written, False on error, None if the item is not in the inventory
+        """
+        self._ensure_inventory()
+        with self._reservations.item_lock(normalize_item_id(item_id)):
+            with self._inventory_lock:
+                adjusted = self._adjust_loaned_out(item_id, delta)
+                if hold_id is not None:
+                    # The held units are now counted in Loaned Out
+                    self._reservations.release(hold_id)
+            if not adjusted:
+                return None
             
+            item_row, new_loaned = adjusted
             try:
-                # Get current Loaned Out value
-                current_loaned_raw = item.get('Loaned Out', 0)
-                
-                # Convert to int, handling empty strings and None
-                if current_loaned_raw == '' or current_loaned_raw is None:
-                    current_loaned = 0
-                else:
-                    current_loaned = int(current_loaned_raw)
-                
-                new_loaned = current_loaned + quantity
-                
-                # Column index for Loaned Out
-                loaned_out_col = config.INVENTORY_COLUMNS['LOANED_OUT'] + 1
-                
-                # Update the Loaned Out column
-                self.inventory_sheet.update_cell(
-                    item['_row_number'],
-                    loaned_out_col,
-                    new_loaned
-                )
-                
-            except Exception as update_error:
-                print(f"Error updating inventory: {update_error}")
-            
-            return True
-        except Exception as e:
-            print(f"Error logging rental: {e}")
-            return False
+                self.require_schema(INVENTORY_SCHEMA)
+                self.inventory_sheet.batch_update([{
+                    'range': rowcol_to_a1(item_row, config.INVENTORY_COLUMNS['LOANED_OUT'] + 1),
+                    'values': [[new_loaned]]
+                }])
+                return True
+            except Exception as e:
+                print(f"Error updating inventory: {e}")
+                self._adjust_loaned_out(item_id, -delta)
+                return False
     
     def get_active_rentals_by_user(self, user_id):
         """
@@ -168,201 +1162,189 @@ class SheetsManager:
         Returns: list of rental records with item details enriched
         """
         try:
-            all_values = self.log_sheet.get_all_values()
-            if not all_values or len(all_values) < 2:
-                return []
+            self._ensure_log()
+            user_rentals = self._log_mirror.active_rentals_for_user(user_id)
             
-            headers = all_values[0]
-            user_rentals = []
-            
-            for idx, row in enumerate(all_values[1:], start=2):
-                if len(row) > config.LOG_COLUMNS['STATUS']:
-                    user_id_val = str(row[config.LOG_COLUMNS['USER_ID']]).strip()
-                    status_val = str(row[config.LOG_COLUMNS['STATUS']]).upper()
-                    
-                    if user_id_val == str(user_id).strip() and status_val == 'ACTIVE':
-                        # Create dictionary from row
-                        log = {
-                            'Borrower Name': row[config.LOG_COLUMNS['BORROWER_NAME']] if len(row) > config.LOG_COLUMNS['BORROWER_NAME'] else '',
-                            'Telegram Username': row[config.LOG_COLUMNS['TELEGRAM_USERNAME']] if len(row) > config.LOG_COLUMNS['TELEGRAM_USERNAME'] else '',
-                            'User ID': row[config.LOG_COLUMNS['USER_ID']] if len(row) > config.LOG_COLUMNS['USER_ID'] else '',
-                            'Item ID': row[config.LOG_COLUMNS['ITEM_ID']] if len(row) > config.LOG_COLUMNS['ITEM_ID'] else '',
-                            'Quantity': int(row[config.LOG_COLUMNS['QUANTITY']]) if len(row) > config.LOG_COLUMNS['QUANTITY'] and row[config.LOG_COLUMNS['QUANTITY']] else 1,
-                            'Rental Start Date': row[config.LOG_COLUMNS['RENTAL_START']] if len(row) > config.LOG_COLUMNS['RENTAL_START'] else '',
-                            'Expected Return Date': row[config.LOG_COLUMNS['EXPECTED_RETURN']] if len(row) > config.LOG_COLUMNS['EXPECTED_RETURN'] else '',
-                            'Status': row[config.LOG_COLUMNS['STATUS']] if len(row) > config.LOG_COLUMNS['STATUS'] else '',
-                            '_row_number': idx
-                        }
-                        log = self.enrich_rental_with_item_details(log)
-                        user_rentals.append(log)
-            
-            return user_rentals
+            return self.enrich_rentals_with_item_details(user_rentals)
         except Exception as e:
             print(f"Error fetching user rentals: {e}")
             return []
     
-    def complete_return(self, row_number, return_photo_url):
+    def complete_return(self, rental_id, return_photo_url):
         """
         Mark a rental as returned and decrement Loaned Out counter by the rented quantity
+        The rental's row comes from the mirror's Rental ID map and its Rental ID
+        cell is read back before the write (the log is reloaded if the row has
+        moved); the log row is then updated with a single batch call
+        Returns: WriteResult (falsy if no ACTIVE rental has this Rental ID)
         """
+        with self._log_gate.write():
+            try:
+                self._ensure_log()
+                self.require_schema(LOG_SCHEMA, INVENTORY_SCHEMA)
+            except Exception as e:
+                print(f"Error completing return: {e}")
+                return WriteResult()
+            row_number = self._log_mirror.locate(rental_id)
+            if row_number is None:
+                print(f"⚠️ Return not recorded: no ACTIVE rental with Rental ID {rental_id}")
+                return WriteResult()
+            if self._journal is not None:
+                # Checked against the sheet when the journal is flushed
+                return self._journal_return(row_number, return_photo_url)
+            try:
+                row_number = self._confirm_rental_rows({rental_id: row_number})[rental_id]
+            except Exception as e:
+                print(f"Error completing return: {e}")
+                return WriteResult()
+            if row_number is None:
+                print(f"⚠️ Return not recorded: Rental ID {rental_id} is no longer in the Rental Log")
+                return WriteResult()
+            return self._write_return(row_number, return_photo_url)
+    
+    def _write_return(self, row_number, return_photo_url):
         try:
-            # Get the item ID and quantity from this rental row
-            row_values = self.log_sheet.row_values(row_number)
-            item_id = row_values[config.LOG_COLUMNS['ITEM_ID']] if len(row_values) > config.LOG_COLUMNS['ITEM_ID'] else None
-            quantity = int(row_values[config.LOG_COLUMNS['QUANTITY']]) if len(row_values) > config.LOG_COLUMNS['QUANTITY'] else 1
+            rental = self._log_mirror.active_rental(row_number)
+            if rental is None:
+                raise LookupError(f"rental at row {row_number} is no longer active")
+            item_id = rental.item_id or None
+            quantity = rental.quantity
             
             actual_return_date = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
             
-            # Update Actual Return Date
-            self.log_sheet.update_cell(
-                row_number, 
-                config.LOG_COLUMNS['ACTUAL_RETURN'] + 1, 
-                actual_return_date
-            )
-            
-            # Update Status
-            self.log_sheet.update_cell(
-                row_number, 
-                config.LOG_COLUMNS['STATUS'] + 1, 
-                'RETURNED'
-            )
-            
-            # Update Return Photo
-            self.log_sheet.update_cell(
-                row_number, 
-                config.LOG_COLUMNS['RETURN_PHOTO'] + 1, 
-                return_photo_url
-            )
-            
-            # Decrement the "Loaned Out" counter in inventory by the quantity
-            if item_id:
-                print(f"🔍 Looking up item {item_id} for return (Quantity: {quantity})...")
-                item = self.get_item_by_id(item_id)
-                if item and '_row_number' in item:
-                    try:
-                        current_loaned_raw = item.get('Loaned Out', 0)
-                        if current_loaned_raw == '' or current_loaned_raw is None:
-                            current_loaned = 0
-                        else:
-                            current_loaned = int(current_loaned_raw)
-                        new_loaned = max(0, current_loaned - quantity)
-                        
-                        loaned_out_col = config.INVENTORY_COLUMNS['LOANED_OUT'] + 1
-                        
-                        # Update the Loaned Out column
-                        self.inventory_sheet.update_cell(
-                            item['_row_number'],
-                            loaned_out_col,
-                            new_loaned
-                        )
-                    except Exception as update_error:
-                        print(f"Error updating inventory on return: {update_error}")
+            # Actual Return Date and Status are adjacent; Return Photo follows Pickup Photo
+            self.log_sheet.batch_update([
+                {
+                    'range': (f"{rowcol_to_a1(row_number, config.LOG_COLUMNS['ACTUAL_RETURN'] + 1)}:"
+                              f"{rowcol_to_a1(row_number, config.LOG_COLUMNS['STATUS'] + 1)}"),
+                    'values': [[actual_return_date, 'RETURNED']]
+                },
+                {
+                    'range': rowcol_to_a1(row_number, config.LOG_COLUMNS['RETURN_PHOTO'] + 1),
+                    'values': [[return_photo_url]]
+                }
+            ])
             
-            return True
+            self._log_mirror.record_update(row_number, {
+                'ACTUAL_RETURN': actual_return_date,
+                'STATUS': 'RETURNED',
+                'RETURN_PHOTO': return_photo_url
+            })
         except Exception as e:
             print(f"Error completing return: {e}")
-            return False
+            return WriteResult()
+        
+        # Decrement the "Loaned Out" counter in inventory by the quantity
+        inventory_written = None
+        if item_id:
+            inventory_written = self._commit_loaned_out(item_id, -quantity)
+        
+        return WriteResult(
+            log_written=True,
+            inventory_written=inventory_written,
+            row_number=row_number,
+            rental_id=rental.rental_id
+        )
     
     def get_all_due_tomorrow(self):
         """
         Get all rentals that are due tomorrow (for reminder notifications)
+        Read from the mirror's due-date index
         Returns: list of rentals with user info and item details
         """
         try:
-            from datetime import timedelta
-            import pytz
-            
-            tomorrow = (datetime.now(pytz.timezone(config.TIMEZONE)) + timedelta(days=1)).date()
-            
-            all_values = self.log_sheet.get_all_values()
-            if not all_values or len(all_values) < 2:
-                return []
-            
-            due_tomorrow = []
-            
-            for row in all_values[1:]:  # Skip header
-                if len(row) > config.LOG_COLUMNS['STATUS']:
-                    status_val = str(row[config.LOG_COLUMNS['STATUS']]).upper()
-                    expected_return = row[config.LOG_COLUMNS['EXPECTED_RETURN']] if len(row) > config.LOG_COLUMNS['EXPECTED_RETURN'] else ''
-                    
-                    if status_val == 'ACTIVE' and expected_return:
-                        try:
-                            return_date = datetime.strptime(expected_return, '%Y-%m-%d').date()
-                            
-                            if return_date == tomorrow:
-                                log = {
-                                    'Borrower Name': row[config.LOG_COLUMNS['BORROWER_NAME']] if len(row) > config.LOG_COLUMNS['BORROWER_NAME'] else '',
-                                    'User ID': row[config.LOG_COLUMNS['USER_ID']] if len(row) > config.LOG_COLUMNS['USER_ID'] else '',
-                                    'Item ID': row[config.LOG_COLUMNS['ITEM_ID']] if len(row) > config.LOG_COLUMNS['ITEM_ID'] else '',
-                                    'Quantity': int(row[config.LOG_COLUMNS['QUANTITY']]) if len(row) > config.LOG_COLUMNS['QUANTITY'] and row[config.LOG_COLUMNS['QUANTITY']] else 1,
-                                    'Expected Return Date': expected_return
-                                }
-                                log = self.enrich_rental_with_item_details(log)
-                                due_tomorrow.append(log)
-                        except:
-                            continue
-            
-            return due_tomorrow
+            self._ensure_log()
+            tomorrow = local_today() + timedelta(days=1)
+            return self.enrich_rentals_with_item_details(self._log_mirror.rentals_due_on(tomorrow))
         except Exception as e:
             print(f"Error fetching due tomorrow rentals: {e}")
             return []
     
+    def get_overdue_rentals(self):
+        """
+        Get every ACTIVE rental past its Expected Return Date in TIMEZONE
+        Read from the mirror's due-date index
+        Returns: list of rentals with item details and days_overdue, most overdue first
+        """
+        try:
+            self._ensure_log()
+            return self.enrich_rentals_with_item_details(self._log_mirror.overdue_rentals())
+        except Exception as e:
+            print(f"Error fetching overdue rentals: {e}")
+            return []
+    
     def get_all_active_rentals(self):
         """
         Get all active rentals (for admin)
         Returns: list of all active rental records with item details
         """
         try:
-            all_values = self.log_sheet.get_all_values()
-            if not all_values or len(all_values) < 2:
-                return []
-            
-            active_rentals = []
-            
-            for row in all_values[1:]:  # Skip header
-                if len(row) > config.LOG_COLUMNS['STATUS']:
-                    status_val = str(row[config.LOG_COLUMNS['STATUS']]).upper()
-                    
-                    if status_val == 'ACTIVE':
-                        log = {
-                            'Borrower Name': row[config.LOG_COLUMNS['BORROWER_NAME']] if len(row) > config.LOG_COLUMNS['BORROWER_NAME'] else '',
-                            'Telegram Username': row[config.LOG_COLUMNS['TELEGRAM_USERNAME']] if len(row) > config.LOG_COLUMNS['TELEGRAM_USERNAME'] else '',
-                            'User ID': row[config.LOG_COLUMNS['USER_ID']] if len(row) > config.LOG_COLUMNS['USER_ID'] else '',
-                            'Item ID': row[config.LOG_COLUMNS['ITEM_ID']] if len(row) > config.LOG_COLUMNS['ITEM_ID'] else '',
-                            'Quantity': int(row[config.LOG_COLUMNS['QUANTITY']]) if len(row) > config.LOG_COLUMNS['QUANTITY'] and row[config.LOG_COLUMNS['QUANTITY']] else 1,
-                            'Rental Start Date': row[config.LOG_COLUMNS['RENTAL_START']] if len(row) > config.LOG_COLUMNS['RENTAL_START'] else '',
-                            'Expected Return Date': row[config.LOG_COLUMNS['EXPECTED_RETURN']] if len(row) > config.LOG_COLUMNS['EXPECTED_RETURN'] else '',
-                            'Status': row[config.LOG_COLUMNS['STATUS']] if len(row) > config.LOG_COLUMNS['STATUS'] else ''
-                        }
-                        log = self.enrich_rental_with_item_details(log)
-                        active_rentals.append(log)
-            
-            return active_rentals
+            self._ensure_log()
+            return self.enrich_rentals_with_item_details(self._log_mirror.active_rentals())
         except Exception as e:
             print(f"Error fetching active rentals: {e}")
             return []
     
+    def get_known_user_ids(self):
+        """
+        Get every Telegram user ID that has ever rented (for broadcasts),
+        archived rentals included
+        Returns: list of user IDs or empty list on error
+        """
+        try:
+            self._ensure_log()
+            with self._archive_lock:
+                archived = {int(user_id) for user_id in self._ensure_archive_stats().users if user_id.isdigit()}
+            return sorted(self._log_mirror.user_ids() | archived)
+        except Exception as e:
+            print(f"Error fetching user IDs: {e}")
+            return []
+    
+    def get_rental_stats(self, rebuild=False):
+        """
+        Usage statistics kept up to date by the Rental Log mirror as rows
+        arrive, plus the archive tabs' totals (counted once, then added to by
+        each archive run)
+        rebuild recounts both from every row first
+        Returns: dict (see RentalStats.snapshot) or None on error
+        """
+        try:
+            self._ensure_log()
+            if rebuild:
+                self._log_mirror.rebuild_stats()
+            with self._archive_lock:
+                return self._log_mirror.stats_snapshot(self._ensure_archive_stats(reload=rebuild))
+        except Exception as e:
+            print(f"Error fetching rental statistics: {e}")
+            return None
+    
     def user_has_overdue_items(self, user_id):
         """
-        Check if a user has any overdue items
+        Check if a user has any overdue items (the /rent gate)
+        A lookup in the mirror's per-user overdue set
         Returns: (has_overdue: bool, overdue_rental: dict or None)
         """
         try:
-            rentals = self.get_active_rentals_by_user(user_id)
-            today = datetime.now().date()
-            
-            for rental in rentals:
-                expected_return = rental.get('Expected Return Date', '')
-                if expected_return:
-                    try:
-                        return_date = datetime.strptime(expected_return, '%Y-%m-%d').date()
-                        if return_date < today:
-                            return True, rental
-                    except:
-                        continue
-            
-            return False, None
+            self._ensure_log()
+            rental = self._log_mirror.overdue_rental_for_user(user_id)
+            if rental is None:
+                return False, None
+            return True, self.enrich_rental_with_item_details(rental)
         except Exception as e:
             print(f"Error checking overdue items: {e}")
             return False, None
 
+_shared_manager = None
+_shared_manager_lock = threading.Lock()
+
+def get_sheets_manager():
+    """
+    Get the process-wide SheetsManager
+    Every module shares one connection, HTTP session and set of caches
+    """
+    global _shared_manager
+    if _shared_manager is None:
+        with _shared_manager_lock:
+            if _shared_manager is None:
+                _shared_manager = SheetsManager()
+    return _shared_manager
@@ -0,0 +1,168 @@
+"""
+Sheets Retry
+Classified retries with jittered exponential backoff and a circuit breaker for Google Sheets calls
+"""
+import functools
+import random
+import threading
+import time
+import requests
+import config
+from perf_stats import perf_stats
+
+# Methods that add or delete rows or sheets: a retry after an ambiguous failure could apply them twice,
+# so they are only retried when Google rejected the request outright (429)
+NON_IDEMPOTENT_METHODS = frozenset({
+    'append_row', 'append_rows', 'insert_row', 'insert_rows', 'insert_cols', 'add_worksheet', 'duplicate',
+    'delete_rows', 'delete_columns', 'delete_dimension', 'add_rows', 'add_cols'
+})
+# A Spreadsheet's batch_update carries structural requests (deleteDimension and the like), not cell values
+SPREADSHEET_NON_IDEMPOTENT_METHODS = NON_IDEMPOTENT_METHODS | {'batch_update'}
+
+class SheetsUnavailable(Exception):
+    """Raised without calling Google while the circuit breaker is open"""
+
+def classify_error(error):
+    """
+    Sort a failed Sheets call into a retry class
+    Returns: 'rate_limited' (429), 'transient' (5xx, 408, network) or 'permanent'
+    """
+    code = getattr(error, 'code', None)
+    if code == 429:
+        return 'rate_limited'
+    if code == 408 or (isinstance(code, int) and code >= 500):
+        return 'transient'
+    if isinstance(error, (requests.exceptions.ConnectionError, requests.exceptions.Timeout, TimeoutError)):
+        return 'transient'
+    return 'permanent'
+
+def retry_after(error):
+    """Seconds asked for by a Retry-After header on the failed response, if any"""
+    headers = getattr(getattr(error, 'response', None), 'headers', None) or {}
+    try:
+        return float(headers.get('Retry-After'))
+    except (TypeError, ValueError):
+        return None
+
+def backoff_delay(attempt, error_class, error=None):
+    """
+    Full-jitter exponential backoff for the given attempt (0-based)
+    Rate-limited calls wait at least as long as Retry-After and never less than one second
+    """
+    ceiling = min(config.SHEETS_RETRY_MAX_SECONDS, config.SHEETS_RETRY_BASE_SECONDS * 2 ** attempt)
+    delay = random.uniform(0, ceiling)
+    if error_class == 'rate_limited':
+        delay = max(delay, ceiling / 2, 1.0, retry_after(error) or 0)
+    return delay
+
+class CircuitBreaker:
+    """
+    Counts consecutive failed Sheets attempts. After `threshold` of them the
+    circuit opens and calls fail fast with SheetsUnavailable for `reset_seconds`;
+    then a single probe call is let through, and its result closes or re-opens it.
+    Permanent errors (bad range, missing sheet...) say nothing about Google's health
+    and are not counted.
+    """
+    
+    def __init__(self, threshold=None, reset_seconds=None):
+        self.threshold = threshold or config.SHEETS_BREAKER_THRESHOLD
+        self.reset_seconds = reset_seconds if reset_seconds is not None else config.SHEETS_BREAKER_RESET_SECONDS
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+        self._lock = threading.Lock()
+    
+    @property
+    def state(self):
+        """'closed', 'open' or 'half_open'"""
+        with self._lock:
+            if self.opened_at is None:
+                return 'closed'
+            if time.monotonic() - self.opened_at < self.reset_seconds:
+                return 'open'
+            return 'half_open'
+    
+    def before_call(self):
+        """Raise SheetsUnavailable unless a call may go out now"""
+        with self._lock:
+            if self.opened_at is None:
+                return
+            remaining = self.reset_seconds - (time.monotonic() - self.opened_at)
+            if remaining > 0:
+                raise SheetsUnavailable(f"Google Sheets circuit open, retrying in {remaining:.0f}s")
+            if self._probing:
+                raise SheetsUnavailable("Google Sheets circuit half-open, waiting for the probe call")
+            self._probing = True
+    
+    def record_success(self):
+        with self._lock:
+            if self.opened_at is not None:
+                print("✅ Google Sheets reachable again, closing circuit")
+            self.failures = 0
+            self.opened_at = None
+            self._probing = False
+    
+    def record_failure(self, error_class):
+        with self._lock:
+            probing, self._probing = self._probing, False
+            if error_class == 'permanent':
+                return
+            self.failures += 1
+            if probing or (self.opened_at is None and self.failures >= self.threshold):
+                if self.opened_at is None:
+                    print(f"⚡ Google Sheets failing ({self.failures} attempts), "
+                          f"opening circuit for {self.reset_seconds}s")
+                self.opened_at = time.monotonic()
+
+class RetryingSheet:
+    """
+    Proxy for a (Scheduled) Worksheet or Spreadsheet that retries failed API
+    method calls by class and reports every attempt to the circuit breaker
+    Each attempt goes back through the quota scheduler
+    non_idempotent names the methods only retried after a 429
+    """
+    
+    def __init__(self, target, breaker, non_idempotent=NON_IDEMPOTENT_METHODS):
+        self._target = target
+        self._breaker = breaker
+        self._non_idempotent = non_idempotent
+    
+    def __getattr__(self, name):
+        attr = getattr(self._target, name)
+        if not callable(attr) or name.startswith('_'):
+            return attr
+        retry_on = ('rate_limited',) if name in self._non_idempotent else ('rate_limited', 'transient')
+        
+        @functools.wraps(attr)
+        def retried(*args, **kwargs):
+            attempt = 0
+            while True:
+                self._breaker.before_call()
+                try:
+                    result = attr(*args, **kwargs)
+                except Exception as e:
+                    error_class = classify_error(e)
+                    self._breaker.record_failure(error_class)
+                    if error_class not in retry_on or attempt + 1 >= config.SHEETS_RETRY_ATTEMPTS:
+                        raise
+                    delay = backoff_delay(attempt, error_class, e)
+                    perf_stats.record_retry(error_class)
+                    print(f"🔁 Sheets {name} failed ({error_class}), retry {attempt + 1} in {delay:.1f}s: {e}")
+                    time.sleep(delay)
+                    attempt += 1
+                    continue
+                self._breaker.record_success()
+                return result
+        return retried
+
+_breaker = None
+_breaker_lock = threading.Lock()
+
+def get_circuit_breaker():
+    """Get the process-wide circuit breaker shared by every Sheets call"""
+    global _breaker
+    if _breaker is None:
+        with _breaker_lock:
+            if _breaker is None:
+                _breaker = CircuitBreaker()
+    return _breaker
@@ -0,0 +1,181 @@
+"""
+Sheets Scheduler
+Token buckets matching the Google Sheets API quotas, shared by every Sheets request,
+with user conversations served ahead of admin views and background work
+"""
+import contextvars
+import functools
+import threading
+import time
+import config
+from perf_stats import perf_stats, wrap_handler_callbacks
+
+# Priority classes, most urgent first
+INTERACTIVE = 0  # a user mid-conversation (/rent, /return, /myrentals...)
+ADMIN = 1        # admin panel views, overdue notifications and broadcasts
+BACKGROUND = 2   # reminders, cache refresh, journal flush, SQLite replication
+
+PRIORITY_NAMES = {INTERACTIVE: 'interactive', ADMIN: 'admin', BACKGROUND: 'background'}
+
+# Priority of the Sheets requests made in the current context. Handler callbacks
+# set it (see prioritize_handlers); jobs and worker threads default to BACKGROUND
+current_priority = contextvars.ContextVar('current_priority', default=BACKGROUND)
+
+# gspread methods that only read; every other method is charged to the write quota
+READ_METHODS = frozenset({
+    'get', 'batch_get', 'get_all_values', 'get_all_records', 'get_values', 'row_values', 'col_values',
+    'acell', 'cell', 'range', 'find', 'findall', 'worksheet', 'worksheets', 'fetch_sheet_metadata',
+    'get_lastUpdateTime', 'list_named_ranges', 'export'
+})
+
+class TokenBucket:
+    """Refills continuously at per_minute / 60 tokens a second, holding at most per_minute"""
+    
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.tokens = self.capacity
+        self._updated = time.monotonic()
+    
+    def refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+class SheetsScheduler:
+    """
+    Admits Sheets requests against a read bucket and a write bucket.
+    
+    A request waits while a more urgent one is waiting for the same bucket, and
+    lower priorities may not spend the last RESERVE share of a bucket, so a
+    burst of admin or background reads leaves room for users' requests.
+    A quota of 0 disables that bucket.
+    """
+    
+    # Share of each bucket that only more urgent requests may spend
+    RESERVE = {INTERACTIVE: 0.0, ADMIN: 0.1, BACKGROUND: 0.25}
+    
+    def __init__(self, read_per_minute=None, write_per_minute=None):
+        if read_per_minute is None:
+            read_per_minute = config.SHEETS_READ_QUOTA_PER_MINUTE
+        if write_per_minute is None:
+            write_per_minute = config.SHEETS_WRITE_QUOTA_PER_MINUTE
+        self._buckets = {
+            'read': TokenBucket(read_per_minute) if read_per_minute > 0 else None,
+            'write': TokenBucket(write_per_minute) if write_per_minute > 0 else None
+        }
+        self._waiting = {kind: [0, 0, 0] for kind in self._buckets}
+        self._cond = threading.Condition()
+    
+    def acquire(self, kind, priority=None):
+        """
+        Block until a request of this kind ('read' or 'write') may be sent
+        Returns: seconds spent waiting
+        """
+        bucket = self._buckets[kind]
+        if bucket is None:
+            return 0.0
+        if priority is None:
+            priority = current_priority.get()
+        
+        started = time.monotonic()
+        floor = bucket.capacity * self.RESERVE[priority]
+        with self._cond:
+            waiting = self._waiting[kind]
+            waiting[priority] += 1
+            try:
+                while True:
+                    bucket.refill()
+                    more_urgent = any(waiting[p] for p in range(priority))
+                    if not more_urgent and bucket.tokens - 1 >= floor:
+                        bucket.tokens -= 1
+                        break
+                    shortfall = floor + 1 - bucket.tokens
+                    self._cond.wait(max(shortfall / bucket.rate, 0.01) if shortfall > 0 else 0.05)
+            finally:
+                waiting[priority] -= 1
+                self._cond.notify_all()
+        
+        waited = time.monotonic() - started
+        perf_stats.record_quota_wait(PRIORITY_NAMES[priority], waited)
+        return waited
+    
+    def penalize(self, kind):
+        """Empty a bucket after Google rejected a request with 429, so callers back off"""
+        bucket = self._buckets[kind]
+        if bucket is None:
+            return
+        with self._cond:
+            bucket.refill()
+            bucket.tokens = min(bucket.tokens, 0.0)
+    
+    def available(self, kind):
+        """Tokens left in a bucket (None if that quota is not enforced)"""
+        bucket = self._buckets[kind]
+        if bucket is None:
+            return None
+        with self._cond:
+            bucket.refill()
+            return bucket.tokens
+
+class ScheduledSheet:
+    """
+    Proxy for a (Timed) Worksheet or Spreadsheet that takes a quota token
+    before every API method call
+    """
+    
+    def __init__(self, target, scheduler):
+        self._target = target
+        self._scheduler = scheduler
+    
+    def __getattr__(self, name):
+        attr = getattr(self._target, name)
+        if not callable(attr) or name.startswith('_'):
+            return attr
+        kind = 'read' if name in READ_METHODS else 'write'
+        
+        @functools.wraps(attr)
+        def scheduled(*args, **kwargs):
+            self._scheduler.acquire(kind)
+            try:
+                return attr(*args, **kwargs)
+            except Exception as e:
+                if getattr(e, 'code', None) == 429:
+                    self._scheduler.penalize(kind)
+                raise
+        return scheduled
+
+def handler_priority(callback):
+    """Priority class for a handler callback: admin_commands handlers are ADMIN, the rest INTERACTIVE"""
+    return ADMIN if getattr(callback, '__module__', None) == 'admin_commands' else INTERACTIVE
+
+def prioritize_handlers(application):
+    """Wrap every registered handler callback so its Sheets requests carry its priority class"""
+    def decorate(callback):
+        if getattr(callback, '_priority', None) is not None:
+            return callback
+        priority = handler_priority(callback)
+        
+        @functools.wraps(callback)
+        async def prioritized(update, context):
+            token = current_priority.set(priority)
+            try:
+                return await callback(update, context)
+            finally:
+                current_priority.reset(token)
+        prioritized._priority = priority
+        return prioritized
+    
+    wrap_handler_callbacks(application, decorate)
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+def get_sheets_scheduler():
+    """Get the process-wide scheduler (all Sheets traffic shares one service account's quota)"""
+    global _scheduler
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                _scheduler = SheetsScheduler()
+    return _scheduler
@@ -0,0 +1,730 @@
+"""
+SQLite Store
+Local, authoritative storage for inventory and rentals with Google Sheets as a mirror
+"""
+import sqlite3
+import threading
+from datetime import datetime, timedelta
+import config
+from reservations import StockReservations
+from sheets_manager import (
+    WriteResult, normalize_item_id, to_int, parse_appended_row_number, get_sheets_manager
+)
+from log_mirror import RentalStats
+from due_index import local_today
+from rental_record import RentalRecord, new_rental_id
+from storage import Storage
+from perf_stats import instrument_methods
+from sheet_schema import INVENTORY_SCHEMA, LOG_SCHEMA
+from gspread.utils import rowcol_to_a1
+
+# Rental Log cells in the rentals table's column order, read with one compiled accessor
+_log_fields = LOG_SCHEMA.getter(
+    'DATE_TIME', 'BORROWER_NAME', 'TELEGRAM_USERNAME', 'USER_ID', 'ITEM_ID', 'QUANTITY', 'RENTAL_START',
+    'EXPECTED_RETURN', 'ACTUAL_RETURN', 'STATUS', 'PICKUP_PHOTO', 'RETURN_PHOTO', 'RENTAL_ID'
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS inventory (
+    item_key TEXT PRIMARY KEY,
+    item_id TEXT NOT NULL,
+    item_name TEXT,
+    type TEXT,
+    brand TEXT,
+    model TEXT,
+    quantity INTEGER,
+    location TEXT,
+    loaned_out INTEGER NOT NULL DEFAULT 0,
+    quantity_current INTEGER NOT NULL DEFAULT 0,
+    sheet_row INTEGER
+);
+CREATE TABLE IF NOT EXISTS rentals (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    date_time TEXT,
+    borrower_name TEXT,
+    telegram_username TEXT,
+    user_id TEXT,
+    item_id TEXT,
+    item_key TEXT,
+    quantity INTEGER NOT NULL DEFAULT 1,
+    rental_start TEXT,
+    expected_return TEXT,
+    actual_return TEXT,
+    status TEXT NOT NULL,
+    pickup_photo TEXT,
+    return_photo TEXT,
+    sheet_row INTEGER,
+    rental_ref TEXT
+);
+CREATE INDEX IF NOT EXISTS rentals_active_user ON rentals (status, user_id);
+CREATE INDEX IF NOT EXISTS rentals_active_due ON rentals (status, expected_return);
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    rental_id INTEGER,
+    item_key TEXT
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+RENTAL_COLUMNS = (
+    'id, date_time, borrower_name, telegram_username, user_id, item_id, quantity, '
+    'rental_start, expected_return, actual_return, status, pickup_photo, return_photo, rental_ref'
+)
+
+def _rental_record(row):
+    """RentalRecord for a rentals table row, keyed by its id"""
+    return RentalRecord(
+        row['id'],
+        borrower_name=row['borrower_name'] or '',
+        telegram_username=row['telegram_username'] or '',
+        user_id=row['user_id'] or '',
+        item_id=row['item_id'] or '',
+        quantity=row['quantity'],
+        rental_start=row['rental_start'] or '',
+        expected_return=row['expected_return'] or '',
+        status=row['status'],
+        rental_id=row['rental_ref'] or ''
+    )
+
+def _sheet_row(row):
+    """Rental Log sheet row for a rentals table row"""
+    return [
+        row['date_time'] or '', row['borrower_name'] or '', row['telegram_username'] or '',
+        row['user_id'] or '', row['item_id'] or '', row['quantity'],
+        row['rental_start'] or '', row['expected_return'] or '', row['actual_return'] or '',
+        row['status'], row['pickup_photo'] or '', row['return_photo'] or '', row['rental_ref'] or ''
+    ]
+
+@instrument_methods
+class SqliteStore(Storage):
+    """
+    Drop-in replacement for SheetsManager that keeps inventory and rentals in
+    an embedded SQLite database. Every write also queues an outbox entry that
+    SheetsReplicator pushes to the existing sheets, so volunteers can still
+    browse them. Inventory master data (names, quantities, new items) is
+    still edited in the sheet and pulled in periodically.
+    
+    Rentals are read through indexes, so the Rental Log archive does not
+    apply: the replica rows are addressed by sheet row and stay in place.
+    """
+    
+    def __init__(self, path=None, sheets=None):
+        self.path = path or config.SQLITE_PATH
+        self.sheets = sheets or get_sheets_manager()
+        self._lock = threading.RLock()
+        self._conn = None
+        self._reservations = StockReservations()
+        self._stats = None  # RentalStats, built on the first get_rental_stats
+        self.replicator = SheetsReplicator(self)
+    
+    def connect(self):
+        """Open the database, creating and seeding it from the sheets on first run"""
+        if self._conn is not None:
+            return
+        with self._lock:
+            if self._conn is not None:
+                return
+            conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=FULL')
+            conn.executescript(SCHEMA)
+            self._conn = conn
+            self._add_rental_refs()
+            if not self._meta('seeded_at'):
+                self._seed_from_sheets()
+            print(f"✅ Using SQLite storage at {self.path}")
+    
+    def warm_up(self):
+        """Open the database and start replicating to the sheets"""
+        try:
+            self.connect()
+            self.replicator.start()
+        except Exception as e:
+            print(f"Error warming up SQLite storage: {e}")
+    
+    def _db(self):
+        self.connect()
+        return self._conn
+    
+    def _meta(self, key):
+        row = self._conn.execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return row['value'] if row else None
+    
+    def _add_rental_refs(self):
+        """
+        Give a database created before Rental IDs a rental_ref column (the
+        Rental ID), fill it in for every rental, and index it
+        """
+        conn = self._conn
+        with self._lock:
+            columns = {row['name'] for row in conn.execute('PRAGMA table_info(rentals)')}
+            if 'rental_ref' not in columns:
+                conn.execute('BEGIN IMMEDIATE')
+                try:
+                    conn.execute('ALTER TABLE rentals ADD COLUMN rental_ref TEXT')
+                    ids = [row['id'] for row in conn.execute('SELECT id FROM rentals')]
+                    conn.executemany('UPDATE rentals SET rental_ref = ? WHERE id = ?',
+                                     [(new_rental_id(), rental_id) for rental_id in ids])
+                    conn.execute('COMMIT')
+                except Exception:
+                    conn.execute('ROLLBACK')
+                    raise
+                print(f"🆔 Assigned Rental IDs to {len(ids)} stored rental(s)")
+            conn.execute('CREATE UNIQUE INDEX IF NOT EXISTS rentals_ref ON rentals (rental_ref)')
+    
+    def _seed_from_sheets(self):
+        """Copy the current inventory and Rental Log into an empty database"""
+        print("📥 Seeding SQLite storage from Google Sheets...")
+        items = self.sheets.read_inventory_records()
+        log_values = self.sheets.log_sheet.get_all_values()
+        missing = LOG_SCHEMA.validate(log_values[0] if log_values else [])
+        log_rows = log_values[1:]
+        # As SheetsManager does: add the Rental ID header to a log from before it, and IDs to its ACTIVE rows
+        self.sheets.assign_rental_ids(2, log_rows, add_header='RENTAL_ID' in missing)
+        
+        with self._lock:
+            conn = self._conn
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                self._upsert_inventory(items, keep_loaned_out=False)
+                seen_refs = set()
+                for row_number, row in enumerate(log_rows, start=2):
+                    if not any(row):
+                        continue
+                    (date_time, borrower_name, telegram_username, user_id, item_id, quantity, rental_start,
+                     expected_return, actual_return, status, pickup_photo, return_photo,
+                     rental_ref) = _log_fields(row)
+                    # Rows from before Rental IDs, or copied by hand with one, get a fresh ID
+                    rental_ref = str(rental_ref).strip()
+                    if not rental_ref or rental_ref in seen_refs:
+                        rental_ref = new_rental_id()
+                    seen_refs.add(rental_ref)
+                    conn.execute(
+                        'INSERT INTO rentals (id, date_time, borrower_name, telegram_username, user_id, '
+                        'item_id, item_key, quantity, rental_start, expected_return, actual_return, status, '
+                        'pickup_photo, return_photo, sheet_row, rental_ref) '
+                        'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                        (
+                            row_number, date_time, borrower_name, telegram_username, str(user_id).strip(),
+                            item_id, normalize_item_id(item_id), int(quantity) if str(quantity).isdigit() else 1,
+                            rental_start, expected_return, actual_return, str(status).upper(),
+                            pickup_photo, return_photo, row_number, rental_ref
+                        )
+                    )
+                conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('seeded_at', ?)",
+                             (datetime.now().strftime('%Y-%m-%d %H:%M:%S'),))
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+        print(f"✅ Seeded {len(items)} item(s) and {len(log_rows)} rental row(s)")
+    
+    def _upsert_inventory(self, items, keep_loaned_out=True):
+        """
+        Insert or update inventory rows from sheet records
+        With keep_loaned_out, Loaned Out stays as SQLite has it and Quantity
+        Current is shifted by however far the sheet is behind
+        """
+        conn = self._conn
+        for sheet_row, item in enumerate(items, start=2):
+            key = normalize_item_id(item.get('ItemID', ''))
+            if not key:
+                continue
+            sheet_loaned = to_int(item.get('Loaned Out', 0))
+            sheet_current = to_int(item.get('Quantity Current', 0))
+            existing = conn.execute('SELECT loaned_out FROM inventory WHERE item_key = ?', (key,)).fetchone()
+            loaned_out = existing['loaned_out'] if existing and keep_loaned_out else sheet_loaned
+            conn.execute(
+                'INSERT INTO inventory (item_key, item_id, item_name, type, brand, model, quantity, location, '
+                'loaned_out, quantity_current, sheet_row) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?) '
+                'ON CONFLICT(item_key) DO UPDATE SET item_id = excluded.item_id, item_name = excluded.item_name, '
+                'type = excluded.type, brand = excluded.brand, model = excluded.model, '
+                'quantity = excluded.quantity, location = excluded.location, loaned_out = excluded.loaned_out, '
+                'quantity_current = excluded.quantity_current, sheet_row = excluded.sheet_row',
+                (
+                    key, str(item.get('ItemID', '')).strip(), item.get('Item Name', ''), item.get('Type', ''),
+                    item.get('Brand', ''), item.get('Model', ''), to_int(item.get('Quantity', 0)),
+                    item.get('Location', ''), loaned_out, sheet_current - (loaned_out - sheet_loaned), sheet_row
+                )
+            )
+    
+    def pull_inventory(self):
+        """Pick up inventory edits made in the sheet (new items, names, quantities)"""
+        try:
+            items = self.sheets.read_inventory_records()
+        except Exception as e:
+            print(f"Error pulling inventory from sheets: {e}")
+            return False
+        with self._lock:
+            conn = self._db()
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                self._upsert_inventory(items)
+                conn.execute('COMMIT')
+            except Exception as e:
+                conn.execute('ROLLBACK')
+                print(f"Error applying inventory from sheets: {e}")
+                return False
+        return True
+    
+    # ---- Inventory ----
+    
+    def _item_dict(self, row):
+        return {
+            'ItemID': row['item_id'],
+            'Item Name': row['item_name'],
+            'Type': row['type'],
+            'Brand': row['brand'],
+            'Model': row['model'],
+            'Quantity': row['quantity'],
+            'Location': row['location'],
+            'Loaned Out': row['loaned_out'],
+            'Quantity Current': row['quantity_current'],
+            '_row_number': row['sheet_row']
+        }
+    
+    def get_item_by_id(self, item_id):
+        """
+        Find an item by its ID
+        Returns: dict with item details or None if not found
+        """
+        try:
+            with self._lock:
+                row = self._db().execute(
+                    'SELECT * FROM inventory WHERE item_key = ?', (normalize_item_id(item_id),)
+                ).fetchone()
+            return self._item_dict(row) if row else None
+        except Exception as e:
+            print(f"Error fetching item: {e}")
+            return None
+    
+    def enrich_rental_with_item_details(self, rental):
+        return self.enrich_rentals_with_item_details([rental])[0]
+    
+    def enrich_rentals_with_item_details(self, rentals):
+        """Set item_name and location on each rental with one inventory query"""
+        keys = {normalize_item_id(rental.item_id) for rental in rentals}
+        keys.discard('')
+        if not keys:
+            return rentals
+        with self._lock:
+            rows = self._db().execute(
+                f"SELECT item_key, item_name, location FROM inventory WHERE item_key IN ({','.join('?' * len(keys))})",
+                tuple(keys)
+            ).fetchall()
+        items = {row['item_key']: row for row in rows}
+        for rental in rentals:
+            item = items.get(normalize_item_id(rental.item_id))
+            if item:
+                rental.item_name = item['item_name'] or 'Unknown'
+                rental.location = item['location'] or 'Unknown'
+        return rentals
+    
+    def check_availability(self, item_id, user_id=None):
+        """
+        Check if an item is available for rent
+        Returns: (available: bool, quantity: int, item_details: dict)
+        """
+        item = self.get_item_by_id(item_id)
+        if not item:
+            return False, 0, None
+        held = self._reservations.held(normalize_item_id(item_id), exclude_user=user_id)
+        available_quantity = max(0, to_int(item.get('Quantity Current', 0)) - held)
+        if available_quantity == 0:
+            return False, 0, item
+        return True, available_quantity, item
+    
+    def reserve_stock(self, item_id, user_id, quantity):
+        """
+        Hold stock for a user while they finish renting
+        Returns: (hold_id or None if not enough stock, available quantity)
+        """
+        key = normalize_item_id(item_id)
+        with self._lock:
+            item = self.get_item_by_id(item_id)
+            if not item:
+                return None, 0
+            available = to_int(item.get('Quantity Current', 0)) - self._reservations.held(key, exclude_user=user_id)
+            if quantity > available:
+                return None, max(0, available)
+            return self._reservations.hold(key, user_id, quantity), available
+    
+    def release_stock(self, hold_id):
+        return self._reservations.release(hold_id)
+    
+    # ---- Rentals ----
+    
+    def log_rental(self, borrower_name, telegram_username, user_id, item_id, item_name,
+                   rental_start, expected_return, pickup_photo_url, quantity=1, hold_id=None):
+        """
+        Record a rental and increment Loaned Out in one local transaction
+        The sheets are updated later by the replicator
+        Returns: WriteResult
+        """
+        key = normalize_item_id(item_id)
+        request_datetime = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        rental_ref = new_rental_id()
+        try:
+            with self._lock:
+                conn = self._db()
+                conn.execute('BEGIN IMMEDIATE')
+                try:
+                    cursor = conn.execute(
+                        'INSERT INTO rentals (date_time, borrower_name, telegram_username, user_id, item_id, '
+                        'item_key, quantity, rental_start, expected_return, actual_return, status, pickup_photo, '
+                        "return_photo, rental_ref) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, '', 'ACTIVE', ?, '', ?)",
+                        (request_datetime, borrower_name, telegram_username, str(user_id), item_id, key,
+                         quantity, rental_start, expected_return, pickup_photo_url, rental_ref)
+                    )
+                    rental_id = cursor.lastrowid
+                    updated = conn.execute(
+                        'UPDATE inventory SET loaned_out = loaned_out + ?, quantity_current = quantity_current - ? '
+                        'WHERE item_key = ?', (quantity, quantity, key)
+                    ).rowcount
+                    conn.execute("INSERT INTO outbox (kind, rental_id) VALUES ('rental', ?)", (rental_id,))
+                    if updated:
+                        conn.execute("INSERT INTO outbox (kind, item_key) VALUES ('inventory', ?)", (key,))
+                    conn.execute('COMMIT')
+                except Exception:
+                    conn.execute('ROLLBACK')
+                    raise
+                self._count_rental(conn, rental_id)
+                if hold_id is not None:
+                    self._reservations.release(hold_id)
+        except Exception as e:
+            print(f"Error logging rental: {e}")
+            if hold_id is not None:
+                self._reservations.release(hold_id)
+            return WriteResult()
+        
+        self.replicator.notify()
+        return WriteResult(log_written=True, inventory_written=bool(updated) or None, row_number=rental_id,
+                           rental_id=rental_ref)
+    
+    def complete_return(self, rental_id, return_photo_url):
+        """
+        Mark a rental as returned and decrement Loaned Out in one local transaction
+        The rental is looked up by Rental ID on the rental_ref index
+        Returns: WriteResult (falsy if no ACTIVE rental has the ID)
+        """
+        actual_return_date = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        try:
+            with self._lock:
+                conn = self._db()
+                conn.execute('BEGIN IMMEDIATE')
+                try:
+                    rental = conn.execute(
+                        "SELECT id, item_key, quantity FROM rentals WHERE rental_ref = ? AND status = 'ACTIVE'",
+                        (str(rental_id).strip(),)
+                    ).fetchone()
+                    if not rental:
+                        raise LookupError(f"no ACTIVE rental with Rental ID {rental_id}")
+                    row_number = rental['id']
+                    conn.execute(
+                        "UPDATE rentals SET actual_return = ?, status = 'RETURNED', return_photo = ? WHERE id = ?",
+                        (actual_return_date, return_photo_url, row_number)
+                    )
+                    updated = conn.execute(
+                        'UPDATE inventory SET loaned_out = MAX(0, loaned_out - ?), '
+                        'quantity_current = quantity_current + MIN(loaned_out, ?) WHERE item_key = ?',
+                        (rental['quantity'], rental['quantity'], rental['item_key'])
+                    ).rowcount
+                    conn.execute("INSERT INTO outbox (kind, rental_id) VALUES ('return', ?)", (row_number,))
+                    if updated:
+                        conn.execute("INSERT INTO outbox (kind, item_key) VALUES ('inventory', ?)",
+                                     (rental['item_key'],))
+                    conn.execute('COMMIT')
+                except Exception:
+                    conn.execute('ROLLBACK')
+                    raise
+                self._count_rental(conn, row_number)
+        except Exception as e:
+            print(f"Error completing return: {e}")
+            return WriteResult()
+        
+        self.replicator.notify()
+        return WriteResult(log_written=True, inventory_written=bool(updated) or None, row_number=row_number,
+                           rental_id=str(rental_id).strip())
+    
+    def _count_rental(self, conn, rental_id):
+        """Re-count one rental in the running stats (under self._lock, after its commit)"""
+        if self._stats is None:
+            return
+        row = conn.execute('SELECT * FROM rentals WHERE id = ?', (rental_id,)).fetchone()
+        if row:
+            self._stats.update(rental_id, _sheet_row(row))
+    
+    def _query_rentals(self, where, params=(), order='id'):
+        with self._lock:
+            rows = self._db().execute(
+                f'SELECT {RENTAL_COLUMNS} FROM rentals WHERE {where} ORDER BY {order}', params
+            ).fetchall()
+        return self.enrich_rentals_with_item_details([_rental_record(row) for row in rows])
+    
+    def get_active_rentals_by_user(self, user_id):
+        try:
+            return self._query_rentals("status = 'ACTIVE' AND user_id = ?", (str(user_id).strip(),))
+        except Exception as e:
+            print(f"Error fetching user rentals: {e}")
+            return []
+    
+    def get_all_active_rentals(self):
+        try:
+            return self._query_rentals("status = 'ACTIVE'")
+        except Exception as e:
+            print(f"Error fetching active rentals: {e}")
+            return []
+    
+    def get_all_due_tomorrow(self):
+        try:
+            tomorrow = local_today() + timedelta(days=1)
+            return self._query_rentals("status = 'ACTIVE' AND expected_return = ?", (tomorrow.isoformat(),))
+        except Exception as e:
+            print(f"Error fetching due tomorrow rentals: {e}")
+            return []
+    
+    def get_overdue_rentals(self):
+        """
+        Every ACTIVE rental due before today in TIMEZONE, most overdue first
+        A range read on the (status, expected_return) index
+        """
+        try:
+            today = local_today()
+            rentals = self._query_rentals(
+                "status = 'ACTIVE' AND expected_return != '' AND expected_return < ?",
+                (today.isoformat(),), order='expected_return, id'
+            )
+            overdue = []
+            for rental in rentals:
+                if rental.due_ordinal is not None:
+                    rental.days_overdue = today.toordinal() - rental.due_ordinal
+                    overdue.append(rental)
+            return overdue
+        except Exception as e:
+            print(f"Error fetching overdue rentals: {e}")
+            return []
+    
+    def user_has_overdue_items(self, user_id):
+        """
+        Check if a user has any overdue items
+        Returns: (has_overdue: bool, overdue_rental: dict or None)
+        """
+        try:
+            rentals = self._query_rentals(
+                "status = 'ACTIVE' AND user_id = ? AND expected_return != '' AND expected_return < ?",
+                (str(user_id).strip(), local_today().isoformat()), order='expected_return, id'
+            )
+            return (True, rentals[0]) if rentals else (False, None)
+        except Exception as e:
+            print(f"Error checking overdue items: {e}")
+            return False, None
+    
+    def get_known_user_ids(self):
+        try:
+            with self._lock:
+                rows = self._db().execute('SELECT DISTINCT user_id FROM rentals').fetchall()
+            return sorted(int(row['user_id']) for row in rows if str(row['user_id']).isdigit())
+        except Exception as e:
+            print(f"Error fetching user IDs: {e}")
+            return []
+    
+    def get_rental_stats(self, rebuild=False):
+        """
+        Usage statistics, counted from the rentals table once and then kept up
+        to date by log_rental and complete_return
+        Returns: dict (see RentalStats.snapshot) or None on error
+        """
+        try:
+            with self._lock:
+                if self._stats is None or rebuild:
+                    stats = RentalStats()
+                    for row in self._db().execute('SELECT * FROM rentals'):
+                        stats.update(row['id'], _sheet_row(row))
+                    self._stats = stats
+                return self._stats.snapshot()
+        except Exception as e:
+            print(f"Error fetching rental statistics: {e}")
+            return None
+
+class SheetsReplicator:
+    """
+    Background thread that pushes SqliteStore's outbox to Google Sheets.
+    Each pass sends new rentals as one append_rows call, returns as one
+    batch_update on the log and Loaned Out values as one batch_update on the
+    inventory. Failed entries stay queued and are retried with backoff. The
+    inventory is pulled back every CACHE_REFRESH_SECONDS.
+    
+    Cells are written by column position, so nothing is pushed while either
+    sheet's header row does not match its schema.
+    """
+    
+    def __init__(self, store):
+        self.store = store
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._log_header_checked_at = None
+    
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._wake.set()  # push anything left queued by the previous run
+        self._thread = threading.Thread(target=self._run, name='sheets-replicator', daemon=True)
+        self._thread.start()
+    
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+    
+    def notify(self):
+        """Wake the replicator after a local write"""
+        self._wake.set()
+    
+    def _run(self):
+        backoff = 1
+        last_pull = 0
+        while not self._stop.is_set():
+            self._wake.wait(timeout=config.CACHE_REFRESH_SECONDS)
+            self._wake.clear()
+            if self._stop.is_set():
+                break
+            now = datetime.now().timestamp()
+            if now - last_pull >= config.CACHE_REFRESH_SECONDS and self.store.pull_inventory():
+                last_pull = now
+            try:
+                self.push_pending()
+                backoff = 1
+            except Exception as e:
+                print(f"Error replicating to sheets (retrying in {backoff}s): {e}")
+                self._stop.wait(backoff)
+                backoff = min(backoff * 2, 300)
+                self._wake.set()
+    
+    def push_pending(self):
+        """Push every queued change to the sheets; returns the number of outbox entries applied"""
+        store = self.store
+        with store._lock:
+            conn = store._db()
+            entries = conn.execute('SELECT id, kind, rental_id, item_key FROM outbox ORDER BY id').fetchall()
+        if not entries:
+            return 0
+        
+        # Raises SchemaError (the entries stay queued) until a moved or renamed column is put back
+        self._check_log_header()
+        store.sheets.require_schema(LOG_SCHEMA, INVENTORY_SCHEMA)
+        
+        applied = []
+        
+        # New rentals first, so returns below know their sheet row
+        rental_entries = [entry for entry in entries if entry['kind'] == 'rental']
+        if rental_entries:
+            with store._lock:
+                rows = [conn.execute('SELECT * FROM rentals WHERE id = ?', (entry['rental_id'],)).fetchone()
+                        for entry in rental_entries]
+            response = store.sheets.log_sheet.append_rows([_sheet_row(row) for row in rows])
+            first_row = parse_appended_row_number(response)
+            with store._lock:
+                # Dequeue with the row numbers, so a later write of this pass failing can't append them again
+                conn.execute('BEGIN IMMEDIATE')
+                try:
+                    for offset, row in enumerate(rows):
+                        sheet_row = first_row + offset if first_row else None
+                        conn.execute('UPDATE rentals SET sheet_row = ? WHERE id = ?', (sheet_row, row['id']))
+                    conn.executemany('DELETE FROM outbox WHERE id = ?', [(entry['id'],) for entry in rental_entries])
+                    conn.execute('COMMIT')
+                except Exception:
+                    conn.execute('ROLLBACK')
+                    raise
+        
+        return_entries = [entry for entry in entries if entry['kind'] == 'return']
+        with store._lock:
+            rows = [conn.execute('SELECT * FROM rentals WHERE id = ?', (entry['rental_id'],)).fetchone()
+                    for entry in return_entries]
+        unplaced = {row['rental_ref']: row['id'] for row in rows if row and not row['sheet_row']}
+        if unplaced:
+            # Appended without learning where the row landed: find it by Rental ID
+            with store._lock:
+                for rental_ref, sheet_row in self._find_sheet_rows(unplaced).items():
+                    conn.execute('UPDATE rentals SET sheet_row = ? WHERE id = ?', (sheet_row, unplaced[rental_ref]))
+                rows = [conn.execute('SELECT * FROM rentals WHERE id = ?', (entry['rental_id'],)).fetchone()
+                        for entry in return_entries]
+        updates = []
+        for entry, row in zip(return_entries, rows):
+            if not row or not row['sheet_row']:
+                continue  # not on the sheet yet - retry next pass
+            sheet_row = row['sheet_row']
+            updates.append({
+                'range': (f"{rowcol_to_a1(sheet_row, config.LOG_COLUMNS['ACTUAL_RETURN'] + 1)}:"
+                          f"{rowcol_to_a1(sheet_row, config.LOG_COLUMNS['STATUS'] + 1)}"),
+                'values': [[row['actual_return'], row['status']]]
+            })
+            updates.append({
+                'range': rowcol_to_a1(sheet_row, config.LOG_COLUMNS['RETURN_PHOTO'] + 1),
+                'values': [[row['return_photo']]]
+            })
+            applied.append(entry['id'])
+        if updates:
+            store.sheets.log_sheet.batch_update(updates)
+        
+        inventory_entries = [entry for entry in entries if entry['kind'] == 'inventory']
+        item_keys = {entry['item_key'] for entry in inventory_entries}
+        updates = []
+        for key in item_keys:
+            with store._lock:
+                item = conn.execute('SELECT loaned_out, sheet_row FROM inventory WHERE item_key = ?',
+                                    (key,)).fetchone()
+            if item and item['sheet_row']:
+                updates.append({
+                    'range': rowcol_to_a1(item['sheet_row'], config.INVENTORY_COLUMNS['LOANED_OUT'] + 1),
+                    'values': [[item['loaned_out']]]
+                })
+        if updates:
+            store.sheets.inventory_sheet.batch_update(updates)
+        applied.extend(entry['id'] for entry in inventory_entries)
+        
+        with store._lock:
+            conn.executemany('DELETE FROM outbox WHERE id = ?', [(entry_id,) for entry_id in applied])
+        return len(rental_entries) + len(applied)
+    
+    def _check_log_header(self):
+        """
+        Re-read the Rental Log header at most every CACHE_REFRESH_SECONDS
+        (the inventory header is checked by every pull_inventory)
+        Raises SchemaError if a column was moved, renamed or deleted
+        """
+        now = datetime.now().timestamp()
+        if self._log_header_checked_at is None or now - self._log_header_checked_at >= config.CACHE_REFRESH_SECONDS:
+            self.store.sheets.read_log_header()
+            self._log_header_checked_at = now
+    
+    def _find_sheet_rows(self, rental_refs):
+        """
+        Sheet rows of rentals by Rental ID, with one read of the Rental ID column
+        Returns: {Rental ID: row number} for the IDs found
+        """
+        column = rowcol_to_a1(1, config.LOG_COLUMNS['RENTAL_ID'] + 1).rstrip('1')
+        cells = self.store.sheets.log_sheet.get(f"{column}2:{column}")
+        found = {}
+        for row_number, values in enumerate(cells, start=2):
+            rental_ref = str(values[0]).strip() if values else ''
+            if rental_ref in rental_refs:
+                found.setdefault(rental_ref, row_number)
+        return found
+
+_shared_store = None
+_shared_store_lock = threading.Lock()
+
+def get_sqlite_store():
+    """Get the process-wide SqliteStore"""
+    global _shared_store
+    if _shared_store is None:
+        with _shared_store_lock:
+            if _shared_store is None:
+                _shared_store = SqliteStore()
+    return _shared_store
@@ -0,0 +1,142 @@
+"""
+Storage Interface
+The operations the bot's handlers need from a storage backend, and the factory that picks one
+"""
+import threading
+from abc import ABC, abstractmethod
+import config
+
+class Storage(ABC):
+    """
+    Interface shared by every storage backend (SheetsManager, SqliteStore,
+    and SheetsManager over the in-memory fake in fake_sheets).
+    
+    Methods are blocking; handlers reach them through the AsyncSheetsManager
+    facade in async_sheets, which runs them on a worker pool.
+    
+    Rentals are RentalRecord objects (see rental_record); their rental_id
+    identifies the rental for good (pass it back to complete_return).
+    """
+    
+    def warm_up(self):
+        """Connect and load caches ahead of the first request"""
+    
+    def health(self):
+        """
+        How fresh the data served right now is (cheap, makes no API calls)
+        Returns: 'ok', 'stale' (serving cached data while the backend is failing),
+        'unavailable', or 'schema' (a sheet's header row does not match; writes are refused)
+        """
+        return 'ok'
+    
+    @abstractmethod
+    def get_item_by_id(self, item_id):
+        """
+        Find an item by its ID
+        Returns: dict with item details or None if not found
+        """
+    
+    @abstractmethod
+    def check_availability(self, item_id, user_id=None):
+        """
+        Check if an item is available for rent, ignoring user_id's own holds
+        Returns: (available: bool, quantity: int, item_details: dict)
+        """
+    
+    @abstractmethod
+    def reserve_stock(self, item_id, user_id, quantity):
+        """
+        Hold stock for a user while they finish renting
+        Returns: (hold_id or None if not enough stock, available quantity)
+        """
+    
+    @abstractmethod
+    def release_stock(self, hold_id):
+        """Give back stock held by reserve_stock"""
+    
+    @abstractmethod
+    def log_rental(self, borrower_name, telegram_username, user_id, item_id, item_name,
+                   rental_start, expected_return, pickup_photo_url, quantity=1, hold_id=None):
+        """
+        Record a rental and count it as Loaned Out
+        Returns: WriteResult
+        """
+    
+    @abstractmethod
+    def complete_return(self, rental_id, return_photo_url):
+        """
+        Mark the ACTIVE rental with this Rental ID as returned and give its stock back
+        Returns: WriteResult (falsy if no ACTIVE rental has the ID)
+        """
+    
+    @abstractmethod
+    def get_active_rentals_by_user(self, user_id):
+        """Returns: list of the user's ACTIVE rentals"""
+    
+    @abstractmethod
+    def get_all_active_rentals(self):
+        """Returns: list of every ACTIVE rental"""
+    
+    @abstractmethod
+    def get_all_due_tomorrow(self):
+        """Returns: list of ACTIVE rentals due tomorrow in TIMEZONE"""
+    
+    @abstractmethod
+    def get_overdue_rentals(self):
+        """Returns: list of ACTIVE rentals due before today in TIMEZONE, most overdue first, with days_overdue"""
+    
+    @abstractmethod
+    def user_has_overdue_items(self, user_id):
+        """Returns: (has_overdue: bool, overdue_rental: RentalRecord or None)"""
+    
+    @abstractmethod
+    def get_known_user_ids(self):
+        """Returns: list of every Telegram user ID that has rented"""
+    
+    def archive_returned_rentals(self, older_than_days=None):
+        """
+        Move old RETURNED rentals out of the hot Rental Log
+        Returns: number of rentals archived, or None if skipped (backends that
+        do not archive always skip)
+        """
+        return None
+    
+    @abstractmethod
+    def get_rental_stats(self, rebuild=False):
+        """
+        Running usage statistics, recounted from scratch only when rebuild is set
+        Returns: dict with total, active, completed, unique_users, top_items,
+        on_time, late and on_time_rate, or None on error
+        """
+
+_storage = None
+_storage_lock = threading.Lock()
+
+def use_storage(storage):
+    """
+    Install a storage backend for this process (benchmarks and offline runs)
+    Must be called before the handler modules are imported
+    """
+    global _storage
+    with _storage_lock:
+        _storage = storage
+
+def get_storage():
+    """
+    Get the process-wide storage backend chosen by STORAGE_BACKEND
+    ('sheets', 'sqlite' or 'fake')
+    """
+    global _storage
+    if _storage is None:
+        with _storage_lock:
+            if _storage is None:
+                if config.STORAGE_BACKEND == 'sqlite':
+                    from sqlite_store import get_sqlite_store
+                    _storage = get_sqlite_store()
+                elif config.STORAGE_BACKEND == 'fake':
+                    from fake_sheets import fake_sheets_manager
+                    _storage = fake_sheets_manager()
+                else:
+                    from sheets_manager import get_sheets_manager
+                    _storage = get_sheets_manager()
+    return _storage
@@ -0,0 +1,180 @@
+"""
+Webhook Server
+Receives Telegram updates over HTTPS webhooks on the bot's own asyncio loop, as an alternative to polling
+"""
+import asyncio
+import hmac
+import json
+import secrets
+import signal
+from urllib.parse import urlparse
+from telegram import Update
+from telegram.ext import CallbackQueryHandler, CommandHandler, InlineQueryHandler, MessageHandler
+import config
+from perf_stats import iter_handlers
+
+MAX_BODY_BYTES = 1024 * 1024
+KEEP_ALIVE_SECONDS = 75  # longer than a load balancer's usual idle timeout, so it closes first
+
+# Update types each handler class is fed. The handlers read update.message, so
+# Command and Message handlers ask for new messages only, not edits or channel posts
+_HANDLER_UPDATE_TYPES = (
+    (CommandHandler, (Update.MESSAGE,)),
+    (MessageHandler, (Update.MESSAGE,)),
+    (CallbackQueryHandler, (Update.CALLBACK_QUERY,)),
+    (InlineQueryHandler, (Update.INLINE_QUERY,)),
+)
+
+def allowed_update_types(application):
+    """
+    The update types the registered handlers can use, for getUpdates and setWebhook
+    Telegram then never sends the rest (edits, chat member changes, polls...)
+    Returns: sorted list of update type names (Update.ALL_TYPES if a handler is not recognised)
+    """
+    allowed = set()
+    for handler in iter_handlers(application):
+        types = next((types for cls, types in _HANDLER_UPDATE_TYPES if isinstance(handler, cls)), None)
+        if types is None:
+            print(f"⚠️  Don't know which updates {type(handler).__name__} needs; asking Telegram for all of them")
+            return list(Update.ALL_TYPES)
+        allowed.update(types)
+    return sorted(allowed)
+
+def _response(status, body=b'', keep_alive=False):
+    return (
+        f"HTTP/1.1 {status}\r\n"
+        f"Content-Type: text/plain; charset=utf-8\r\n"
+        f"Content-Length: {len(body)}\r\n"
+        f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+    ).encode('latin-1') + body
+
+class WebhookServer:
+    """
+    Minimal HTTP/1.1 server for Telegram's webhook POSTs, in the same style as
+    MetricsServer. A request must carry the secret token given to setWebhook
+    in X-Telegram-Bot-Api-Secret-Token (compared in constant time); its update
+    goes straight onto the application's update queue and is answered 200
+    before it is processed. Connections are kept alive for the load balancer
+    or proxy in front. GET /healthz answers 200 for its health checks.
+    """
+    
+    def __init__(self, application, host=None, port=None, path=None, secret_token=None):
+        self.application = application
+        self.host = host or config.WEBHOOK_HOST
+        self.port = port if port is not None else config.WEBHOOK_PORT
+        self.path = '/' + (path or config.WEBHOOK_PATH or urlparse(config.WEBHOOK_URL).path).strip('/')
+        self.secret_token = secret_token or config.WEBHOOK_SECRET_TOKEN or secrets.token_urlsafe(32)
+        self.received = 0
+        self.rejected = 0
+        self._server = None
+    
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        print(f"🪝 Listening for Telegram webhooks on http://{self.host}:{self.port}{self.path}")
+    
+    async def stop(self):
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+    
+    async def _handle(self, reader, writer):
+        try:
+            while True:
+                request_line = await asyncio.wait_for(reader.readline(), timeout=KEEP_ALIVE_SECONDS)
+                if not request_line:
+                    break
+                headers = {}
+                while True:
+                    line = await asyncio.wait_for(reader.readline(), timeout=5)
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                
+                parts = request_line.decode('latin-1').split()
+                if len(parts) != 3 or 'transfer-encoding' in headers:
+                    writer.write(_response('400 Bad Request', b'Bad request\n'))
+                    break
+                method, target, version = parts
+                length = int(headers.get('content-length') or 0)
+                if length > MAX_BODY_BYTES:
+                    writer.write(_response('413 Payload Too Large', b'Too large\n'))
+                    break
+                body = await asyncio.wait_for(reader.readexactly(length), timeout=10) if length else b''
+                
+                keep_alive = version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+                status, response_body = self._dispatch(method, target.split('?')[0], headers, body)
+                writer.write(_response(status, response_body, keep_alive))
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+    
+    def _dispatch(self, method, path, headers, body):
+        """Returns: (status line, body) for one request"""
+        if method == 'GET' and path == '/healthz':
+            return '200 OK', b'ok\n'
+        if path != self.path:
+            return '404 Not Found', b'Not found\n'
+        if method != 'POST':
+            return '405 Method Not Allowed', b'Method not allowed\n'
+        token = headers.get('x-telegram-bot-api-secret-token', '')
+        if not hmac.compare_digest(token.encode('utf-8'), self.secret_token.encode('utf-8')):
+            self.rejected += 1
+            return '403 Forbidden', b'Forbidden\n'
+        try:
+            update = Update.de_json(json.loads(body), self.application.bot)
+        except (ValueError, TypeError, KeyError, AttributeError) as e:
+            print(f"⚠️  Ignoring malformed webhook update: {e}")
+            return '400 Bad Request', b'Bad update\n'
+        if update is None:
+            return '400 Bad Request', b'Bad update\n'
+        self.received += 1
+        self.application.update_queue.put_nowait(update)
+        return '200 OK', b''
+
+async def serve_webhook(application, allowed_updates):
+    """
+    Run the bot on webhooks until SIGINT/SIGTERM: start the application and the
+    server, register WEBHOOK_URL with Telegram, and shut down in reverse order
+    The webhook stays registered on exit so Telegram holds updates for the
+    next start; starting in polling mode removes it
+    """
+    if not config.WEBHOOK_URL.startswith('https://'):
+        raise ValueError("UPDATE_MODE=webhook needs WEBHOOK_URL set to the bot's public https:// address")
+    
+    server = WebhookServer(application)
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(signum, stop.set)
+        except (NotImplementedError, RuntimeError):
+            pass  # Windows: Ctrl+C raises KeyboardInterrupt instead
+    
+    await application.initialize()
+    if application.post_init:
+        await application.post_init(application)
+    await application.start()
+    try:
+        await server.start()
+        await application.bot.set_webhook(
+            url=config.WEBHOOK_URL,
+            secret_token=server.secret_token,
+            allowed_updates=allowed_updates,
+            max_connections=config.WEBHOOK_MAX_CONNECTIONS
+        )
+        print(f"✅ Webhook set to {config.WEBHOOK_URL} ({', '.join(allowed_updates)})")
+        await stop.wait()
+    finally:
+        await server.stop()
+        if application.running:
+            await application.stop()
+        if application.post_stop:
+            await application.post_stop(application)
+        await application.shutdown()
+        if application.post_shutdown:
+            await application.post_shutdown(application)
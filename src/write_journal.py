@@ -0,0 +1,174 @@
+"""
+Write Journal
+Durable local log of rentals and returns that have not reached Google Sheets yet
+"""
+import json
+import os
+import threading
+
+class WriteJournal:
+    """
+    Append-only JSON-lines file of pending writes. Each entry is fsynced
+    before the user is told their rental or return went through, and is
+    forgotten once SheetsManager has written both its Rental Log change
+    ("logged") and its Loaned Out change ("counted") to the sheets.
+    
+    Entries:
+        {'seq', 'op': 'rental', 'row': [...], 'item': key, 'delta': n}
+        {'seq', 'op': 'return', 'target_row' or 'target_seq', 'changes': {...}, 'item': key, 'delta': -n}
+    
+    The journal does no Sheets I/O itself; replaying it at startup just
+    reloads whatever is still unfinished.
+    """
+    
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.RLock()
+        self._entries = {}  # seq -> entry dict (unfinished only)
+        self._rows_by_seq = {}  # rental seq -> sheet row once appended, until the rental entry is done
+        self._next_seq = 1
+        self._file = None
+    
+    def open(self):
+        """Replay unfinished entries from disk and compact the file"""
+        with self.lock:
+            if self._file is not None:
+                return
+            if os.path.exists(self.path):
+                with open(self.path, encoding='utf-8') as f:
+                    for line in f:
+                        self._replay(line)
+            self._compact()
+            if self._entries:
+                print(f"📒 Replaying {len(self._entries)} unflushed write(s) from {self.path}")
+    
+    def _replay(self, line):
+        try:
+            record = json.loads(line)
+        except ValueError:
+            return  # torn final line from a crash mid-write
+        if 'op' in record:
+            self._entries[record['seq']] = record
+            self._next_seq = max(self._next_seq, record['seq'] + 1)
+        elif 'logged' in record:
+            self._mark_logged(record['logged'], record.get('row'))
+        elif 'counted' in record:
+            self._mark_counted(record['counted'])
+    
+    def _compact(self):
+        """Rewrite the file with only the unfinished entries"""
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for entry in self._entries.values():
+                f.write(json.dumps(entry) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        if self._file is not None:
+            self._file.close()
+        self._file = open(self.path, 'a', encoding='utf-8')
+    
+    def _write(self, record):
+        self._file.write(json.dumps(record) + '\n')
+        self._file.flush()
+        os.fsync(self._file.fileno())
+    
+    def append(self, entry):
+        """
+        Durably record a pending write
+        Returns: the entry's sequence number
+        """
+        with self.lock:
+            entry = dict(entry, seq=self._next_seq, logged=False, counted=False)
+            self._next_seq += 1
+            self._write(entry)
+            self._entries[entry['seq']] = entry
+            return entry['seq']
+    
+    def _mark_logged(self, seq, row=None):
+        entry = self._entries.get(seq)
+        if entry is None:
+            return
+        entry['logged'] = True
+        if entry['op'] == 'rental':
+            entry['logged_row'] = row
+            if row:
+                self._rows_by_seq[seq] = row
+                # Returns queued against this rental can now target its row directly
+                for other in self._entries.values():
+                    if other['op'] == 'return' and other.get('target_seq') == seq:
+                        other['target_row'] = row
+                        del other['target_seq']
+        self._forget_if_done(seq)
+    
+    def _mark_counted(self, seqs):
+        for seq in seqs:
+            entry = self._entries.get(seq)
+            if entry is not None:
+                entry['counted'] = True
+                self._forget_if_done(seq)
+    
+    def _forget_if_done(self, seq):
+        entry = self._entries[seq]
+        if entry['logged'] and entry['counted']:
+            del self._entries[seq]
+            # Returns queued against it were retargeted when it was logged
+            self._rows_by_seq.pop(seq, None)
+    
+    def mark_logged(self, seq, row=None):
+        """Record that an entry's Rental Log change is on the sheet (row: where a rental landed)"""
+        with self.lock:
+            self._write({'logged': seq, 'row': row})
+            self._mark_logged(seq, row)
+    
+    def mark_counted(self, seqs):
+        """Record that the entries' Loaned Out changes are on the sheet"""
+        with self.lock:
+            self._write({'counted': list(seqs)})
+            self._mark_counted(seqs)
+            if not self._entries:
+                self._compact()
+    
+    def pending(self):
+        """Copies of every unfinished entry, oldest first"""
+        with self.lock:
+            return [dict(self._entries[seq]) for seq in sorted(self._entries)]
+    
+    def pending_deltas(self):
+        """Loaned Out changes not yet written to the sheet: item key -> delta"""
+        with self.lock:
+            deltas = {}
+            for entry in self._entries.values():
+                if not entry['counted'] and entry.get('item'):
+                    deltas[entry['item']] = deltas.get(entry['item'], 0) + entry['delta']
+            return deltas
+    
+    def rental_row(self, seq):
+        """
+        Sheet row of a journaled rental
+        Returns: row number, None if not appended yet, or False if unknown
+        """
+        with self.lock:
+            if seq in self._rows_by_seq:
+                return self._rows_by_seq[seq]
+            entry = self._entries.get(seq)
+            if entry is not None and entry['op'] == 'rental' and not entry['logged']:
+                return None
+            return False
+    
+    def renumber_rows(self, new_row):
+        """
+        Follow rentals' rows after Rental Log rows above them were deleted
+        new_row(old row number) gives the new number, or None for a deleted row
+        """
+        with self.lock:
+            for seq, row in list(self._rows_by_seq.items()):
+                moved = new_row(row)
+                if moved is None:
+                    del self._rows_by_seq[seq]
+                else:
+                    self._rows_by_seq[seq] = moved
+    
+    def __len__(self):
+        with self.lock:
+            return len(self._entries)
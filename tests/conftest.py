@@ -0,0 +1,22 @@
+"""
+Test setup: the bot's modules live flat in src/ and read config from the environment at import
+"""
+import os
+import sys
+import pytest
+
+os.environ.setdefault('TELEGRAM_BOT_TOKEN', '123456:test')
+os.environ.setdefault('GOOGLE_SHEETS_ID', 'test')
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+def _log_row(rental_id='', user_id='100', item_id='ITEM001', status='ACTIVE',
+             expected_return='2026-01-10', actual_return='', borrower_name='Borrower'):
+    return [
+        '2026-01-01 09:00:00', borrower_name, '@borrower', user_id, item_id, '1', '2026-01-01',
+        expected_return, actual_return, status, 'pickup', 'return' if actual_return else '', rental_id
+    ]
+
+@pytest.fixture
+def log_row():
+    """Builds a Rental Log row in LOG_SCHEMA column order"""
+    return _log_row
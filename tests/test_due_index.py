@@ -0,0 +1,57 @@
+from datetime import date
+from due_index import DueDateIndex
+
+def _ordinal(day):
+    return date(2026, 1, day).toordinal()
+
+def test_overdue_is_ordered_most_overdue_first():
+    index = DueDateIndex(today=date(2026, 1, 10))
+    index.add(5, 'alice', _ordinal(8))
+    index.add(3, 'bob', _ordinal(2))
+    index.add(4, 'alice', _ordinal(8))
+    index.add(6, 'bob', _ordinal(12))
+
+    assert index.overdue() == [(_ordinal(2), 3), (_ordinal(8), 4), (_ordinal(8), 5)]
+    assert index.due_on(date(2026, 1, 12)) == [6]
+    assert index.overdue_for_user('alice') == 4
+    assert index.overdue_users() == {'alice', 'bob'}
+
+def test_remove_drops_rental_date_and_overdue_user():
+    index = DueDateIndex(today=date(2026, 1, 10))
+    index.add(3, 'bob', _ordinal(2))
+    index.add(4, 'alice', _ordinal(2))
+
+    index.remove(3)
+    index.remove(3)  # removing twice is harmless
+    assert index.overdue() == [(_ordinal(2), 4)]
+    assert index.overdue_for_user('bob') is None
+
+    index.remove(4)
+    assert len(index) == 0
+    assert index.overdue() == []
+    assert index.due_on(date(2026, 1, 2)) == []
+    assert index.overdue_users() == set()
+
+def test_add_replaces_the_earlier_due_date():
+    index = DueDateIndex(today=date(2026, 1, 10))
+    index.add(3, 'bob', _ordinal(2))
+    index.add(3, 'bob', _ordinal(20))
+
+    assert len(index) == 1
+    assert index.overdue() == []
+    assert index.due_on(date(2026, 1, 20)) == [3]
+
+def test_roll_over_marks_passed_due_dates_overdue():
+    index = DueDateIndex(today=date(2026, 1, 10))
+    index.add(3, 'bob', _ordinal(11))
+    index.add(4, 'alice', _ordinal(15))
+    assert index.overdue_users() == set()
+
+    assert index.roll_over(date(2026, 1, 12))
+    assert not index.roll_over(date(2026, 1, 12))
+    assert index.overdue_for_user('bob') == 3
+    assert index.overdue_users() == {'bob'}
+
+    # The clock going back recounts from scratch
+    assert index.roll_over(date(2026, 1, 5))
+    assert index.overdue_users() == set()
@@ -0,0 +1,37 @@
+from datetime import datetime
+import config
+from log_archive import archive_title, plan_archive, renumber, row_runs
+
+def test_plan_archive_picks_old_returned_rows_by_period(log_row):
+    rows = [
+        log_row('a', status='RETURNED', actual_return='2025-11-03 10:00:00'),
+        log_row('b'),  # ACTIVE
+        log_row('c', status='RETURNED', actual_return='2025-12-30 10:00:00'),
+        log_row('d', status='RETURNED', actual_return='2026-02-01 10:00:00'),  # too recent
+        log_row('e', status='RETURNED', actual_return='not a date'),
+        log_row('f', status='returned', actual_return='2025-11-20 10:00:00'),
+    ]
+    plan = plan_archive(rows, datetime(2026, 1, 15))
+
+    prefix = config.ARCHIVE_SHEET_PREFIX
+    assert sorted(plan) == [f"{prefix} 2025-11", f"{prefix} 2025-12"]
+    assert [row_number for row_number, _ in plan[f"{prefix} 2025-11"]] == [2, 7]
+    assert plan[f"{prefix} 2025-12"] == [(4, rows[2])]
+
+    yearly = plan_archive(rows, datetime(2026, 1, 15), period='year')
+    assert list(yearly) == [f"{prefix} 2025"]
+    assert archive_title(datetime(2025, 3, 1), period='year') == f"{prefix} 2025"
+
+def test_row_runs_are_contiguous_and_bottom_first():
+    assert row_runs([3, 4, 5, 9, 11, 12, 2]) == [(11, 12), (9, 9), (2, 5)]
+    assert row_runs([]) == []
+    assert row_runs([7]) == [(7, 7)]
+
+def test_renumber_follows_rows_below_deleted_ones():
+    new_row = renumber([3, 4, 8])
+    assert new_row(2) == 2
+    assert new_row(3) is None
+    assert new_row(5) == 3
+    assert new_row(7) == 5
+    assert new_row(8) is None
+    assert new_row(9) == 6
@@ -0,0 +1,55 @@
+from log_mirror import RentalLogMirror
+from sheet_schema import LOG_SCHEMA
+
+def _mirror(rows):
+    mirror = RentalLogMirror()
+    mirror.load([LOG_SCHEMA.headers] + rows)
+    return mirror
+
+def test_locate_finds_active_rentals_by_id(log_row):
+    mirror = _mirror([log_row('a'), log_row('b', status='RETURNED', actual_return='2026-01-05 10:00:00')])
+    assert mirror.locate('a') == 2
+    assert mirror.locate(' a ') == 2
+    assert mirror.locate('b') is None  # returned
+    assert mirror.row_of('b') == 3
+    assert mirror.locate('missing') is None
+
+def test_locate_after_rows_are_inserted_above(log_row):
+    mirror = _mirror([log_row('a'), log_row('b')])
+    mirror.load([LOG_SCHEMA.headers, log_row('new'), log_row('a'), log_row('hand typed'), log_row('b')])
+    assert mirror.locate('a') == 3
+    assert mirror.locate('b') == 5
+    assert mirror.active_rental(5).rental_id == 'b'
+
+def test_locate_after_rows_are_deleted(log_row):
+    mirror = _mirror([log_row('a'), log_row('b'), log_row('c')])
+    mirror.load([LOG_SCHEMA.headers, log_row('c')])
+    assert mirror.locate('a') is None
+    assert mirror.locate('b') is None
+    assert mirror.row_of('b') is None
+    assert mirror.locate('c') == 2
+
+def test_locate_follows_a_sort(log_row):
+    rows = [log_row('a', user_id='1'), log_row('b', user_id='2'), log_row('c', user_id='3')]
+    mirror = _mirror(rows)
+    mirror.load([LOG_SCHEMA.headers] + rows[::-1])
+    assert [mirror.locate(rental_id) for rental_id in 'abc'] == [4, 3, 2]
+    assert [rental.rental_id for rental in mirror.active_rentals_for_user('1')] == ['a']
+
+def test_locate_after_a_return_and_a_retyped_id(log_row):
+    mirror = _mirror([log_row('a'), log_row('b')])
+    mirror.record_update(2, {'STATUS': 'RETURNED', 'ACTUAL_RETURN': '2026-01-05 10:00:00'})
+    assert mirror.locate('a') is None
+
+    mirror.record_update(3, {'RENTAL_ID': 'b2'})
+    assert mirror.locate('b') is None
+    assert mirror.locate('b2') == 3
+
+def test_pending_rentals_are_located_by_negative_row(log_row):
+    mirror = _mirror([log_row('a')])
+    mirror.add_pending(4, log_row('p'))
+    assert mirror.locate('p') == -4
+
+    mirror.drop_pending(4)
+    mirror.record_append(3, log_row('p'))
+    assert mirror.locate('p') == 3
@@ -0,0 +1,74 @@
+from log_mirror import RentalLogMirror, RentalStats
+from sheet_schema import LOG_SCHEMA
+
+def _returned(log_row, rental_id, actual_return, **fields):
+    return log_row(rental_id, status='RETURNED', actual_return=actual_return, **fields)
+
+def _full_count(rows):
+    stats = RentalStats()
+    for row_number, row in enumerate(rows, start=2):
+        stats.update(row_number, row)
+    return stats.snapshot()
+
+def test_incremental_updates_match_a_full_recount(log_row):
+    mirror = RentalLogMirror()
+    mirror.load([LOG_SCHEMA.headers] + [
+        log_row('a', user_id='1', item_id='ITEM001'),
+        log_row('b', user_id='2', item_id='ITEM002'),
+        _returned(log_row, 'c', '2026-01-09 10:00:00', user_id='1', item_id='ITEM001'),
+    ])
+
+    # A return, a late return, a new rental and a row typed over by hand
+    mirror.record_update(2, {'ACTUAL_RETURN': '2026-01-20 10:00:00', 'STATUS': 'RETURNED'})
+    mirror.record_update(3, {'ACTUAL_RETURN': '2026-01-05 10:00:00', 'STATUS': 'RETURNED'})
+    mirror.record_append(5, log_row('d', user_id='3', item_id='ITEM003'))
+    mirror.extend(6, [log_row('e', user_id='3', item_id='ITEM001')])
+    incremental = mirror.stats_snapshot()
+
+    assert incremental == _full_count(mirror.rows)
+    mirror.rebuild_stats()
+    assert mirror.stats_snapshot() == incremental
+    assert incremental['total'] == 5
+    assert incremental['active'] == 2
+    assert incremental['completed'] == 3
+    assert incremental['on_time'] == 2
+    assert incremental['late'] == 1
+    assert incremental['unique_users'] == 3
+    assert incremental['top_items'][0] == ('ITEM001', 3)
+
+def test_update_replaces_and_remove_takes_back_a_rows_contribution(log_row):
+    stats = RentalStats()
+    stats.update(2, log_row('a', user_id='1'))
+    stats.update(2, _returned(log_row, 'a', '2026-01-20 10:00:00', user_id='1'))
+    assert stats.snapshot()['total'] == 1
+    assert stats.snapshot()['active'] == 0
+    assert stats.snapshot()['late'] == 1
+
+    stats.remove(2)
+    stats.remove(2)
+    assert stats.snapshot() == RentalStats().snapshot()
+
+def test_blank_rows_are_not_counted(log_row):
+    stats = RentalStats()
+    stats.update(2, [''] * len(LOG_SCHEMA.headers))
+    assert stats.snapshot()['total'] == 0
+
+def test_pending_rentals_are_counted_until_dropped(log_row):
+    mirror = RentalLogMirror()
+    mirror.load([LOG_SCHEMA.headers, log_row('a')])
+    mirror.add_pending(1, log_row('p', user_id='9'))
+    assert mirror.stats_snapshot()['total'] == 2
+
+    mirror.drop_pending(1)
+    assert mirror.stats_snapshot() == _full_count(mirror.rows)
+
+def test_combined_adds_the_archive_totals(log_row):
+    hot = RentalStats()
+    hot.update(2, log_row('a', user_id='1'))
+    archive = RentalStats()
+    archive.update(('Archive', 2), _returned(log_row, 'b', '2026-01-09 10:00:00', user_id='2'))
+
+    combined = hot.combined(archive).snapshot()
+    assert combined['total'] == 2
+    assert combined['unique_users'] == 2
+    assert combined['on_time'] == 1
@@ -0,0 +1,42 @@
+import pytest
+from sheet_schema import INVENTORY_SCHEMA, LOG_SCHEMA, SchemaError
+
+def test_matching_header_passes():
+    assert LOG_SCHEMA.validate(LOG_SCHEMA.headers) == frozenset()
+    assert INVENTORY_SCHEMA.validate(INVENTORY_SCHEMA.headers) == frozenset()
+
+def test_header_case_whitespace_and_extra_columns_are_fine():
+    header = [f"  {name.upper()} " for name in INVENTORY_SCHEMA.headers] + ['Notes']
+    assert INVENTORY_SCHEMA.validate(header) == frozenset()
+
+def test_missing_header_is_reported():
+    header = list(LOG_SCHEMA.headers)
+    header[9] = 'State'
+    with pytest.raises(SchemaError, match=r"'Status' is missing \(expected in column J\)"):
+        LOG_SCHEMA.validate(header)
+
+def test_moved_headers_are_reported():
+    header = list(INVENTORY_SCHEMA.headers)
+    header[6], header[7] = header[7], header[6]
+    with pytest.raises(SchemaError) as error:
+        INVENTORY_SCHEMA.validate(header)
+    assert "'Location' is in column H, expected G" in str(error.value)
+    assert "'Loaned Out' is in column G, expected H" in str(error.value)
+
+def test_missing_optional_column_is_returned_not_raised():
+    assert LOG_SCHEMA.validate(LOG_SCHEMA.headers[:-1]) == frozenset({'RENTAL_ID'})
+
+def test_optional_column_slot_taken_by_another_header_is_an_error():
+    with pytest.raises(SchemaError, match="'Rental ID' is missing"):
+        LOG_SCHEMA.validate(LOG_SCHEMA.headers[:-1] + ['Notes'])
+
+def test_empty_sheet_fails():
+    with pytest.raises(SchemaError):
+        LOG_SCHEMA.validate([])
+
+def test_a_fixed_header_validates_again_after_a_failure():
+    header = list(LOG_SCHEMA.headers)
+    header[0], header[1] = header[1], header[0]
+    with pytest.raises(SchemaError):
+        LOG_SCHEMA.validate(header)
+    assert LOG_SCHEMA.validate(LOG_SCHEMA.headers) == frozenset()
@@ -0,0 +1,64 @@
+import pytest
+import config
+import fake_sheets
+from sheet_schema import SchemaError
+from sqlite_store import SqliteStore
+
+@pytest.fixture
+def spreadsheet():
+    return fake_sheets.build_fake_spreadsheet(fake_sheets.sample_inventory(3))
+
+@pytest.fixture
+def store(spreadsheet, tmp_path):
+    store = SqliteStore(path=str(tmp_path / 'store.db'), sheets=fake_sheets.fake_sheets_manager(spreadsheet))
+    store.connect()
+    return store
+
+def _rent(store, user_id=7):
+    return store.log_rental('Borrower', '@borrower', user_id, 'ITEM001', 'Item 1', '2026-02-01', '2026-02-03', 'pickup')
+
+def _log_rental_ids(spreadsheet):
+    log = spreadsheet.worksheet(config.LOG_SHEET_NAME)
+    return [row[config.LOG_COLUMNS['RENTAL_ID']] for row in log.get_all_values()[1:]]
+
+def _outbox_kinds(store):
+    return sorted(row['kind'] for row in store._db().execute('SELECT kind FROM outbox'))
+
+def test_push_replicates_rentals_and_empties_the_outbox(store, spreadsheet):
+    rental = _rent(store)
+    assert store.replicator.push_pending() == 2  # the rental and its Loaned Out change
+    assert _log_rental_ids(spreadsheet) == [rental.rental_id]
+    assert _outbox_kinds(store) == []
+
+def test_pass_failing_partway_does_not_append_rentals_twice(store, spreadsheet, monkeypatch):
+    rental = _rent(store)
+    inventory = spreadsheet.worksheet(config.INVENTORY_SHEET_NAME)
+    batch_update = inventory.batch_update
+    failures = []
+
+    def fail_once(*args, **kwargs):
+        if not failures:
+            failures.append(True)
+            raise RuntimeError('inventory write failed')
+        return batch_update(*args, **kwargs)
+    monkeypatch.setattr(inventory, 'batch_update', fail_once)
+
+    with pytest.raises(RuntimeError):
+        store.replicator.push_pending()
+    assert _log_rental_ids(spreadsheet) == [rental.rental_id]
+    assert _outbox_kinds(store) == ['inventory']
+
+    assert store.replicator.push_pending() == 1
+    assert _log_rental_ids(spreadsheet) == [rental.rental_id]
+    assert _outbox_kinds(store) == []
+
+def test_push_waits_while_the_log_header_is_out_of_order(store, spreadsheet):
+    log = spreadsheet.worksheet(config.LOG_SHEET_NAME)
+    header = log.row_values(1)
+    log.batch_update([{'range': 'B1:C1', 'values': [[header[2], header[1]]]}])
+    _rent(store)
+
+    with pytest.raises(SchemaError):
+        store.replicator.push_pending()
+    assert _log_rental_ids(spreadsheet) == []
+    assert _outbox_kinds(store) == ['inventory', 'rental']
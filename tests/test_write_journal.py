@@ -0,0 +1,94 @@
+from write_journal import WriteJournal
+
+def _rental(item='ITEM001'):
+    return {'op': 'rental', 'row': ['row'], 'item': item, 'delta': 1}
+
+def _return(**target):
+    return dict({'op': 'return', 'changes': {'STATUS': 'RETURNED'}, 'item': 'ITEM001', 'delta': -1}, **target)
+
+def _reopen(path):
+    journal = WriteJournal(str(path))
+    journal.open()
+    return journal
+
+def test_replay_after_a_crash_restores_unfinished_entries(tmp_path):
+    path = tmp_path / 'journal.jsonl'
+    journal = _reopen(path)
+    first = journal.append(_rental())
+    second = journal.append(_rental('ITEM002'))
+    returned = journal.append(_return(target_seq=second, rental_id='abc'))
+    journal.mark_logged(first, 7)
+    journal.mark_counted([first])
+    journal.mark_logged(second, 8)
+    # Crash: the file is never closed or compacted
+
+    replayed = _reopen(path)
+    pending = replayed.pending()
+    assert [entry['seq'] for entry in pending] == [second, returned]
+    assert pending[0]['logged'] and not pending[0]['counted']
+    # The return learned its rental's row before the crash
+    assert pending[1]['target_row'] == 8 and 'target_seq' not in pending[1]
+    assert replayed.rental_row(second) == 8
+    assert replayed.pending_deltas() == {'ITEM002': 1, 'ITEM001': -1}
+
+    # New entries continue after the replayed sequence numbers
+    assert replayed.append(_rental()) > returned
+
+def test_replay_is_idempotent(tmp_path):
+    path = tmp_path / 'journal.jsonl'
+    journal = _reopen(path)
+    seq = journal.append(_rental())
+    journal.mark_logged(seq, 5)
+
+    once = _reopen(path).pending()
+    twice = _reopen(path).pending()
+    assert once == twice
+    assert len(once) == 1
+
+def test_torn_final_line_is_ignored(tmp_path):
+    path = tmp_path / 'journal.jsonl'
+    journal = _reopen(path)
+    seq = journal.append(_rental())
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write('{"logged": ')
+
+    assert [entry['seq'] for entry in _reopen(path).pending()] == [seq]
+
+def test_marks_for_finished_entries_are_no_ops(tmp_path):
+    path = tmp_path / 'journal.jsonl'
+    journal = _reopen(path)
+    seq = journal.append(_rental())
+    journal.mark_logged(seq, 5)
+    journal.mark_counted([seq])
+    journal.mark_logged(seq, 9)
+    journal.mark_counted([seq])
+
+    assert len(journal) == 0
+    assert journal.rental_row(seq) is False
+    assert len(_reopen(path)) == 0
+
+def test_finished_entries_are_compacted_away(tmp_path):
+    path = tmp_path / 'journal.jsonl'
+    journal = _reopen(path)
+    seq = journal.append(_rental())
+    journal.mark_logged(seq, 5)
+    journal.mark_counted([seq])
+
+    assert path.read_text(encoding='utf-8') == ''
+
+def test_pending_returns_copies(tmp_path):
+    journal = _reopen(tmp_path / 'journal.jsonl')
+    journal.append(_rental())
+    journal.pending()[0]['logged'] = True
+    assert not journal.pending()[0]['logged']
+
+def test_renumber_rows_follows_deleted_rows_above(tmp_path):
+    journal = _reopen(tmp_path / 'journal.jsonl')
+    moved = journal.append(_rental())
+    deleted = journal.append(_rental())
+    journal.mark_logged(moved, 10)
+    journal.mark_logged(deleted, 4)
+
+    journal.renumber_rows(lambda row: None if row == 4 else row - 2)
+    assert journal.rental_row(moved) == 8
+    assert journal.rental_row(deleted) is False